@@ -1,6 +1,12 @@
 from django.contrib import admin
-from .models import UserProfile
+from .models import CareTeam, UserProfile
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'created_at', 'updated_at')
+
+
+@admin.register(CareTeam)
+class CareTeamAdmin(admin.ModelAdmin):
+    list_display = ('name', 'created_at', 'updated_at')
+    filter_horizontal = ('managers', 'members')
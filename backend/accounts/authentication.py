@@ -0,0 +1,45 @@
+"""
+JWT authentication that loads the user's profile with the user.
+
+Profiles are created lazily, the first time they are read or written
+(``get_profile``), rather than by ``User`` signals, so logins, password
+changes and other ``User`` writes never touch the profile table. The
+authenticated user is fetched with its profile in one query, which makes
+``request.user.profile`` free for the rest of the request.
+"""
+from rest_framework_simplejwt import authentication
+
+from .models import UserProfile
+
+
+class UserWithProfile:
+    """The user model as simplejwt's ``get_user`` sees it, with ``objects`` joining in the profile."""
+
+    def __init__(self, model):
+        self.model = model
+        self.DoesNotExist = model.DoesNotExist
+
+    @property
+    def objects(self):
+        return self.model.objects.select_related('profile')
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    simplejwt's ``JWTAuthentication``, with the user's profile joined in. Only
+    the lookup changes; the claim, active and revocation checks stay simplejwt's.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_model = UserWithProfile(self.user_model)
+
+
+def get_profile(user):
+    """The user's profile, created on first use; no query if it was loaded with the user."""
+    try:
+        return user.profile
+    except UserProfile.DoesNotExist:
+        profile, created = UserProfile.objects.get_or_create(user=user)
+        user.profile = profile
+        return profile
@@ -0,0 +1,110 @@
+import itertools
+import statistics
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth.models import User, update_last_login
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.authentication import JWTAuthentication
+from accounts.models import UserProfile
+from backend.metrics import RequestStats
+
+
+def create_profile(sender, instance, created, **kwargs):
+    if created:
+        UserProfile.objects.create(user=instance)
+
+
+def save_profile(sender, instance, **kwargs):
+    instance.profile.save()
+
+
+@contextmanager
+def signal_profiles():
+    """The previous design: profiles created and saved by ``User`` signals, and loaded with a query of their own."""
+    post_save.connect(create_profile, sender=User, dispatch_uid='benchmark_create_profile')
+    post_save.connect(save_profile, sender=User, dispatch_uid='benchmark_save_profile')
+    try:
+        with mock.patch.object(JWTAuthentication, '__init__', authentication.JWTAuthentication.__init__):
+            yield
+    finally:
+        post_save.disconnect(sender=User, dispatch_uid='benchmark_create_profile')
+        post_save.disconnect(sender=User, dispatch_uid='benchmark_save_profile')
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the queries and median latency of the token and profile endpoints and of plain User writes, "
+        "with profiles kept by User signals (the previous design) and with lazily created profiles loaded "
+        "with the user. Runs on a throwaway test database; passwords use a fast hasher so the numbers "
+        "reflect the database work rather than password hashing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help="Runs per operation; the median is reported.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            with override_settings(
+                PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                METRICS_LOG_REQUESTS=False,
+            ):
+                with signal_profiles():
+                    before = self.measure('signals', options['repeat'])
+                after = self.measure('lazy', options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"\n{'operation':<34} {'queries':>15} {'median ms':>21}")
+        for name in before:
+            (queries_before, ms_before), (queries_after, ms_after) = before[name], after[name]
+            self.stdout.write(f"{name:<34} {queries_before:>6} -> {queries_after:<6} {ms_before:>9.3f} -> {ms_after:<9.3f}")
+
+    def measure(self, label, repeat):
+        user = User.objects.create_user(username=f'benchmark-{label}', password='secret')
+        UserProfile.objects.get_or_create(user_id=user.pk)
+        client = Client()
+        client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {RefreshToken.for_user(user).access_token}"
+        names = (f'benchmark-{label}-{i}' for i in itertools.count())
+
+        # Writes start from a freshly loaded user, as a login or a password change in another request would.
+        def record_login():
+            update_last_login(None, User.objects.get(pk=user.pk))
+
+        def change_password():
+            fresh = User.objects.get(pk=user.pk)
+            fresh.set_password('secret')
+            fresh.save()
+
+        operations = {
+            "obtain token": lambda: client.post('/api/token/', {'username': user.username, 'password': 'secret'}),
+            "read profile": lambda: client.get('/api/accounts/profile/'),
+            "update profile": lambda: client.put(
+                '/api/accounts/profile/', {'bio': "Night shift lead."}, content_type='application/json'),
+            # What a login does (and the token endpoint with SIMPLE_JWT's UPDATE_LAST_LOGIN)
+            "record last_login": record_login,
+            "change password": change_password,
+            "create user": lambda: User.objects.create_user(username=next(names)),
+        }
+        results = {}
+        for name, operation in operations.items():
+            stats = RequestStats()
+            with connection.execute_wrapper(stats.time_query):
+                operation()
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                operation()
+                runs.append((time.perf_counter() - start) * 1000)
+            results[name] = (stats.db_queries, statistics.median(runs))
+        return results
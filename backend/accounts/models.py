@@ -15,3 +15,18 @@ class UserProfile(models.Model):
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
+
+
+class CareTeam(models.Model):
+    """
+    A group of caregivers and the managers who oversee them. Managers see
+    their members' clients and notes as well as their own (``clients.access``).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    managers = models.ManyToManyField(User, related_name='managed_teams', blank=True)
+    members = models.ManyToManyField(User, related_name='care_teams', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
@@ -1,3 +1,64 @@
+from django.contrib.auth.models import User, update_last_login
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from .models import UserProfile
+
+
+class TokenTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+
+    def test_token_carries_the_user_id(self):
+        response = self.client.post('/api/token/', {'username': 'carer', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user_id'], self.user.pk)
+
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(api.get('/api/clients/client-notes/').status_code, 200)
+
+    def test_wrong_password_is_rejected(self):
+        response = self.client.post('/api/token/', {'username': 'carer', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+
+class UserProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+    def test_profile_is_created_on_first_use_and_can_be_updated(self):
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+        response = self.api.put('/api/accounts/profile/', {'bio': "Night shift lead."}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.api.get('/api/accounts/profile/').data['bio'], "Night shift lead.")
+
+    def test_profile_is_loaded_with_the_user(self):
+        self.api.get('/api/accounts/profile/')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.api.get('/api/accounts/profile/').status_code, 200)
+
+    def test_user_writes_leave_the_profile_alone(self):
+        UserProfile.objects.create(user=self.user)
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            update_last_login(None, user)
+            user.set_password('changed')
+            user.save()
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('accounts_userprofile', ' '.join(query['sql'] for query in queries))
+
+    def test_profile_needs_authentication(self):
+        self.assertEqual(APIClient().get('/api/accounts/profile/').status_code, 401)
+
+    def test_inactive_and_deleted_users_are_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.api.get('/api/accounts/profile/').status_code, 401)
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.api.get('/api/accounts/profile/').status_code, 401)
@@ -1,7 +1,7 @@
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import UserProfile
+from .authentication import get_profile
 from .serializers import UserProfileSerializer, CustomTokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 
@@ -13,15 +13,13 @@ class UserProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        # Fetch the profile for the logged-in user
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
-        serializer = UserProfileSerializer(profile)
+        # The profile was loaded with the logged-in user
+        serializer = UserProfileSerializer(get_profile(request.user))
         return Response(serializer.data)
 
     def put(self, request):
-        # Fetch and update the profile for the logged-in user
-        profile, created = UserProfile.objects.get_or_create(user=request.user)
-        serializer = UserProfileSerializer(profile, data=request.data, partial=True)
+        # Update the profile of the logged-in user
+        serializer = UserProfileSerializer(get_profile(request.user), data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -0,0 +1,73 @@
+"""
+Read-replica routing.
+
+Everything reads from and writes to the primary by default. Views that only
+read wrap their work in ``read_from_replica()`` (usually via
+``ReplicaReadMixin``) to move their reads to ``settings.DB_READ_REPLICA``.
+Reads made inside a transaction on the primary stay on the primary, so code
+that reads in order to write (statistics deltas, ``select_for_update``)
+never acts on replica data that is lagging behind.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_alias():
+    alias = settings.DB_READ_REPLICA
+    return alias if alias and alias in settings.DATABASES else None
+
+
+@contextmanager
+def read_from_replica():
+    """Route reads in this block (and this thread or task only) to the read replica."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaReadMixin:
+    """
+    Serve a view's GET and HEAD requests from the read replica. On viewsets,
+    ``replica_actions`` limits this to the named actions, so e.g. a detail
+    page opened straight after a create still reads from the primary.
+    """
+    replica_actions = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.reads_from_replica(request):
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+    def reads_from_replica(self, request):
+        if request.method not in SAFE_METHODS:
+            return False
+        if self.replica_actions is None:
+            return True
+        return getattr(self, 'action_map', {}).get(request.method.lower()) in self.replica_actions
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias is None or not _use_replica.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
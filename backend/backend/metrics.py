@@ -0,0 +1,324 @@
+"""
+Application metrics and structured logs.
+
+A small in-process registry of counters, histograms and scrape-time values,
+rendered in the Prometheus text format at ``/metrics``. Scrapes must send
+``Authorization: Bearer <METRICS_TOKEN>``; with no token configured the
+endpoint answers 404, since the site sits behind a public proxy and the
+numbers describe its traffic.
+
+- ``MetricsMiddleware`` times every request per URL name and records how many
+  database queries it made and how long they took, plus the time spent in
+  model calls made on its behalf, including from the analysis thread pool
+  (the request's ``RequestStats`` travels with ``contextvars``). With
+  ``METRICS_LOG_REQUESTS`` each request is also logged to ``backend.requests``
+  with those numbers as fields.
+- ``clients.monitoring`` defines the analysis metrics: latency and tokens per
+  model call, latency per analysis type, cache hits and queue depth.
+- ``JsonFormatter`` writes log records, extra fields included, as one JSON
+  object per line, with ``LOG_FORMAT = 'json'``; by default logs stay plain
+  text at WARNING, as before.
+
+Recording a value is a dict lookup, a bisect and an addition under a lock;
+scrape-time values such as the queue depth cost nothing until ``/metrics`` is
+read. Durations of streamed responses end when the response starts. Async
+views (``clients.streaming``) run their queries in worker threads, so their
+database numbers are not counted. Values are per process: scrape each
+worker, or read them as samples of the whole.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+# Set up logger
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger('backend.requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+# Registry ***********************************************************************
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {format_value(value)}")
+        return lines
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, (counts, total) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_value(float(bound))
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Collected(Metric):
+    """
+    Values read when the metrics are scraped: ``collect()`` returns a number,
+    or ``{label values: number}`` when the metric has labels.
+    """
+
+    def __init__(self, name, help, collect, labels=(), type='gauge'):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self.type = type
+
+    def snapshot(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.error(f"Error collecting metric {self.name}: {str(e)}")
+            return {}
+        return values if isinstance(values, dict) else {(): values}
+
+
+def register(metric):
+    """Add ``metric`` to the registry, or return the one already registered under its name."""
+    with _registry_lock:
+        return REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name, help, labels=()):
+    return register(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return register(Histogram(name, help, labels, buckets))
+
+
+def collected(name, help, collect, labels=(), type='gauge'):
+    return register(Collected(name, help, collect, labels, type))
+
+
+def render():
+    with _registry_lock:
+        metrics = list(REGISTRY.values())
+    return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+# End Registry *******************************************************************
+
+
+REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds', "Time to produce a response, per URL name.", ('method', 'endpoint', 'status'),
+)
+REQUEST_DB_QUERIES = histogram(
+    'http_request_db_queries', "Database queries made per request.", ('method', 'endpoint'), COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = histogram(
+    'http_request_db_seconds', "Time spent in database queries per request.", ('method', 'endpoint'),
+)
+REQUEST_MODEL_SECONDS = histogram(
+    'http_request_model_seconds', "Time spent in model calls per request, summed over concurrent calls.",
+    ('method', 'endpoint'),
+)
+
+
+# Per-request statistics **********************************************************
+
+class RequestStats:
+    """What one request spent its time on; model calls may add to it from other threads."""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.model_calls = 0
+        self.model_seconds = 0.0
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def time_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+    def add_model_call(self, seconds, tokens=0):
+        with self.lock:
+            self.model_calls += 1
+            self.model_seconds += seconds
+            self.tokens += tokens
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def current_request():
+    """The ``RequestStats`` of the request being served, or None outside a request."""
+    return _current.get()
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        endpoint = (match.view_name or match.route) if match is not None else 'unmatched'
+        labels = {'method': request.method, 'endpoint': endpoint}
+        REQUEST_SECONDS.observe(elapsed, status=response.status_code, **labels)
+        REQUEST_DB_QUERIES.observe(stats.db_queries, **labels)
+        REQUEST_DB_SECONDS.observe(stats.db_seconds, **labels)
+        if stats.model_calls:
+            REQUEST_MODEL_SECONDS.observe(stats.model_seconds, **labels)
+
+        if settings.METRICS_LOG_REQUESTS and request_logger.isEnabledFor(logging.INFO):
+            request_logger.info(
+                f"{request.method} {request.path} {response.status_code} in {elapsed * 1000:.1f}ms",
+                extra={
+                    'method': request.method,
+                    'path': request.path,
+                    'endpoint': endpoint,
+                    'status': response.status_code,
+                    'duration_ms': round(elapsed * 1000, 2),
+                    'db_queries': stats.db_queries,
+                    'db_ms': round(stats.db_seconds * 1000, 2),
+                    'model_calls': stats.model_calls,
+                    'model_ms': round(stats.model_seconds * 1000, 2),
+                    'tokens': stats.tokens,
+                },
+            )
+
+# End Per-request statistics ******************************************************
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponse("Not found", status=404, content_type='text/plain')
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponse("Unauthorized", status=401, content_type='text/plain')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Attributes every log record has; anything else was passed with ``extra``.
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
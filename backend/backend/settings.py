@@ -14,7 +14,80 @@ SECRET_KEY = config('SECRET_KEY')
 DEBUG = config('DEBUG', default=False, cast=bool)
 
 OPEN_AI_API=config('OPEN_AI_API')
-OPEN_AI_BASE_URL=config('OPEN_AI_BASE_URL')
+OPEN_AI_BASE_URL=config('OPEN_AI_BASE_URL', default='https://api.openai.com/v1')
+
+# AI analysis of client notes
+AI_ANALYSIS_BACKEND = config('AI_ANALYSIS_BACKEND', default='openai')  # 'openai' (or compatible, at OPEN_AI_BASE_URL), 'azure' or 'fake' (offline)
+AZURE_OPENAI_API_VERSION = config('AZURE_OPENAI_API_VERSION', default='2024-02-01')
+AI_HTTP_MAX_CONNECTIONS = config('AI_HTTP_MAX_CONNECTIONS', default=20, cast=int)  # pooled keep-alive connections to the provider, per process
+AI_HTTP_KEEPALIVE_EXPIRY = config('AI_HTTP_KEEPALIVE_EXPIRY', default=30, cast=float)  # seconds an idle connection is kept open
+AI_ANALYSIS_MODEL = config('AI_ANALYSIS_MODEL', default='gpt-4')
+AI_ANALYSIS_STRATEGY = config('AI_ANALYSIS_STRATEGY', default='separate')  # 'separate' (3 prompts) or 'combined' (1 JSON prompt)
+AI_ANALYSIS_CONCURRENT = config('AI_ANALYSIS_CONCURRENT', default=True, cast=bool)
+AI_ANALYSIS_TIMEOUT = config('AI_ANALYSIS_TIMEOUT', default=30, cast=float)  # seconds, per model call
+AI_ANALYSIS_MAX_WORKERS = config('AI_ANALYSIS_MAX_WORKERS', default=12, cast=int)
+FAKE_LLM_LATENCY = config('FAKE_LLM_LATENCY', default=0.5, cast=float)  # seconds, per fake model call
+FAKE_LLM_FIRST_TOKEN_LATENCY = config('FAKE_LLM_FIRST_TOKEN_LATENCY', default=0.1, cast=float)  # seconds, streamed calls
+FAKE_LLM_LATENCY_DISTRIBUTION = config('FAKE_LLM_LATENCY_DISTRIBUTION', default='fixed')  # 'fixed', 'uniform' or 'lognormal' around FAKE_LLM_LATENCY
+FAKE_LLM_LATENCY_SPREAD = config('FAKE_LLM_LATENCY_SPREAD', default=0.5, cast=float)  # uniform: +/- fraction; lognormal: sigma
+
+# Client-side protection of model calls (see clients/resilience.py); limits are per process, 0 = none
+AI_RATE_LIMIT_RPM = config('AI_RATE_LIMIT_RPM', default=0, cast=int)  # requests per minute
+AI_RATE_LIMIT_TPM = config('AI_RATE_LIMIT_TPM', default=0, cast=int)  # tokens per minute
+AI_RETRY_MAX_ATTEMPTS = config('AI_RETRY_MAX_ATTEMPTS', default=3, cast=int)  # attempts per call, all within AI_ANALYSIS_TIMEOUT
+AI_RETRY_BACKOFF = config('AI_RETRY_BACKOFF', default=0.5, cast=float)  # seconds, doubled per retry, full jitter
+AI_RETRY_MAX_BACKOFF = config('AI_RETRY_MAX_BACKOFF', default=8, cast=float)  # seconds
+AI_BREAKER_FAILURE_THRESHOLD = config('AI_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)  # consecutive failures that open the circuit
+AI_BREAKER_RESET_TIMEOUT = config('AI_BREAKER_RESET_TIMEOUT', default=30, cast=float)  # seconds open before a trial call
+
+# Cache of analysis results keyed by note text, prompt version and model
+AI_CACHE_ENABLED = config('AI_CACHE_ENABLED', default=True, cast=bool)
+AI_CACHE_TTL = config('AI_CACHE_TTL', default=60 * 60 * 24 * 30, cast=int)  # seconds
+AI_CACHE_MAX_ENTRIES = config('AI_CACHE_MAX_ENTRIES', default=50000, cast=int)
+AI_CACHE_PRUNE_EVERY = config('AI_CACHE_PRUNE_EVERY', default=500, cast=int)  # stores between prunes
+AI_CACHE_DJANGO_ALIAS = config('AI_CACHE_DJANGO_ALIAS', default=None)  # optional entry in CACHES placed in front of the table
+
+# Serve the last analysis summary while a new one is generated in the background
+AI_SUMMARY_BACKGROUND_REFRESH = config('AI_SUMMARY_BACKGROUND_REFRESH', default=True, cast=bool)
+
+# 'sync' analyses notes inside the request; 'deferred' queues them for `manage.py run_analysis_workers`
+AI_ANALYSIS_MODE = config('AI_ANALYSIS_MODE', default='sync')
+AI_QUEUE_BATCH_SIZE = config('AI_QUEUE_BATCH_SIZE', default=5, cast=int)
+AI_QUEUE_POLL_INTERVAL = config('AI_QUEUE_POLL_INTERVAL', default=2, cast=float)  # seconds
+AI_QUEUE_MAX_ATTEMPTS = config('AI_QUEUE_MAX_ATTEMPTS', default=5, cast=int)
+AI_QUEUE_RETRY_BACKOFF = config('AI_QUEUE_RETRY_BACKOFF', default=30, cast=float)  # seconds, doubled per attempt
+AI_QUEUE_LOCK_TIMEOUT = config('AI_QUEUE_LOCK_TIMEOUT', default=300, cast=float)  # seconds before a claimed job is reclaimable
+
+# Note embeddings for similarity search
+AI_EMBEDDING_BACKEND = config('AI_EMBEDDING_BACKEND', default='hashing')  # 'hashing' (built in, offline) or 'sentence-transformers'
+AI_EMBEDDING_MODEL = config('AI_EMBEDDING_MODEL', default='all-MiniLM-L6-v2')  # sentence-transformers model name or local path
+AI_EMBEDDING_DIMENSIONS = config('AI_EMBEDDING_DIMENSIONS', default=256, cast=int)  # hashing backend only
+AI_EMBEDDING_ANN_THRESHOLD = config('AI_EMBEDDING_ANN_THRESHOLD', default=50000, cast=int)  # notes from which an HNSW index is used
+
+# Bulk note import
+AI_IMPORT_MAX_RETRIES = config('AI_IMPORT_MAX_RETRIES', default=5, cast=int)  # rate-limit retries per imported note
+AI_IMPORT_RETRY_BACKOFF = config('AI_IMPORT_RETRY_BACKOFF', default=2, cast=float)  # seconds, doubled per retry
+
+# Metrics at /metrics and logging (see backend/metrics.py)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # scrapes must send "Authorization: Bearer <token>"; unset, /metrics is off
+METRICS_LOG_REQUESTS = config('METRICS_LOG_REQUESTS', default=False, cast=bool)  # one structured log record per request
+LOG_FORMAT = config('LOG_FORMAT', default='text')  # 'text' (plain messages) or 'json' (one object per line)
+LOG_LEVEL = config('LOG_LEVEL', default='WARNING')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'backend.metrics.JsonFormatter'},
+        'text': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'root': {'handlers': ['console'], 'level': LOG_LEVEL},
+    # Request records are INFO; when they are asked for, show them whatever LOG_LEVEL is.
+    'loggers': {'backend.requests': {'level': 'INFO' if METRICS_LOG_REQUESTS else 'WARNING'}},
+}
 
 ALLOWED_HOSTS = ["*"]
 
@@ -39,6 +112,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.MetricsMiddleware',  # Request latency, DB and model time (first, so it times the rest)
     'corsheaders.middleware.CorsMiddleware',  # Added for CORS
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -52,7 +126,7 @@ MIDDLEWARE = [
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.JWTAuthentication',  # simplejwt's, loading the user's profile with the user
     ),
 }
 
@@ -95,23 +169,55 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database: SQLite for local development, PostgreSQL in production (DB_ENGINE=postgresql)
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST'),
+            'PORT': config('DB_PORT'),
+            # Keep connections open between requests instead of reconnecting every time
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
+    }
+    if config('DB_PGBOUNCER', default=False, cast=bool):
+        # Transaction-pooling PgBouncer: server-side cursors don't survive across transactions
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+    if config('DB_REPLICA_HOST', default=''):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': config('DB_REPLICA_HOST'),
+            'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        # Local stand-in for a read replica (the same file), so replica routing can be
+        # exercised without PostgreSQL. Only used when DB_READ_REPLICA is set.
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        },
     }
-}
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': config('DB_NAME'),
-#         'USER': config('DB_USER'),
-#         'PASSWORD': config('DB_PASSWORD'),
-#         'HOST': config('DB_HOST'),
-#         'PORT': config('DB_PORT'),
-#     }
-# }
+# Alias read-heavy endpoints read from; empty reads everything from the primary
+DB_READ_REPLICA = config('DB_READ_REPLICA', default='replica' if config('DB_REPLICA_HOST', default='') else '') or None
+DATABASE_ROUTERS = ['backend.db_router.ReplicaRouter']
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -6,6 +6,7 @@ from drf_yasg import openapi
 from django.urls import path
 from rest_framework_simplejwt.views import (TokenObtainPairView,TokenRefreshView,)
 from accounts.views import CustomTokenObtainPairView
+from backend.metrics import metrics_view
 
 # Swagger schema view configuration
 schema_view = get_schema_view(
@@ -34,6 +35,9 @@ urlpatterns = [
     path('api/clients/', include('clients.urls')),
     path('api/accounts/', include('accounts.urls')),
 
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
+
     # Swagger and ReDoc endpoints
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
@@ -0,0 +1,46 @@
+"""
+Which clients and notes a user can see.
+
+Caregivers see the clients assigned to them (``CareClient.assigned_caregiver``)
+and those clients' notes; managers of an ``accounts.CareTeam`` also see their
+members' clients; staff see the whole organisation. Access is a filter on the
+indexed ``assigned_caregiver`` column (notes join through their client's
+primary key), never a check per object, so a list costs what the caseload
+costs rather than what the organisation does. Anything outside the caseload
+is simply not found.
+"""
+from django.contrib.auth.models import User
+
+from .models import CareClient, ClientNote
+
+
+def caregiver_ids(user):
+    """
+    The caregivers whose clients ``user`` can see, or None for all of them.
+    Looked up once and kept on the user object for the rest of the request.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    if user.is_staff:
+        return None
+    ids = getattr(user, '_caseload_caregiver_ids', None)
+    if ids is None:
+        team_members = User.objects.filter(care_teams__managers=user).values_list('pk', flat=True)
+        ids = user._caseload_caregiver_ids = frozenset([user.pk, *team_members])
+    return ids
+
+
+def clients_for(user, queryset=None):
+    queryset = CareClient.objects.all() if queryset is None else queryset
+    ids = caregiver_ids(user)
+    if ids is None:
+        return queryset
+    return queryset.filter(assigned_caregiver_id__in=ids)
+
+
+def notes_for(user, queryset=None):
+    queryset = ClientNote.objects.all() if queryset is None else queryset
+    ids = caregiver_ids(user)
+    if ids is None:
+        return queryset
+    return queryset.filter(care_client__assigned_caregiver_id__in=ids)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CareClient, ClientNote
+from .models import AnalysisCacheEntry, AnalysisJob, CareClient, ClientNote, ClientNoteStats
 
 @admin.register(CareClient)
 class CareClientAdmin(admin.ModelAdmin):
@@ -9,6 +9,22 @@ class CareClientAdmin(admin.ModelAdmin):
 
 @admin.register(ClientNote)
 class ClientNoteAdmin(admin.ModelAdmin):
-    list_display = ('care_client', 'created_by', 'created_at', 'sentiment')
+    list_display = ('care_client', 'created_by', 'created_at', 'sentiment', 'analysis_status')
     search_fields = ('care_client__first_name', 'care_client__last_name', 'note_text')
-    list_filter = ('sentiment', 'created_at')
+    list_filter = ('sentiment', 'analysis_status', 'created_at')
+
+
+@admin.register(ClientNoteStats)
+class ClientNoteStatsAdmin(admin.ModelAdmin):
+    list_display = ('care_client', 'note_count', 'updated_at')
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('note', 'attempts', 'available_at', 'locked_by', 'locked_at')
+    search_fields = ('last_error',)
+
+
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'hit_count', 'created_at', 'last_used_at', 'expires_at')
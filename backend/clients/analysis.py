@@ -0,0 +1,486 @@
+"""
+AI analysis of client notes.
+
+Each note gets three independent model calls: sentiment, emotions and a
+safeguarding evaluation. They are fanned out over a shared thread pool so the
+time taken to analyse a note is bounded by the slowest call rather than the
+sum of all three. Alternatively, ``AI_ANALYSIS_STRATEGY = 'combined'`` asks for
+all three results in one structured JSON response. Results are cached by
+note text, so unchanged or repeated text never reaches the model twice.
+
+``stream_chat_completion`` and ``stream_text_completion`` are the async,
+token-by-token counterparts of the two completion helpers, used by the
+server-sent-event views in ``clients.streaming``.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+from django.conf import settings
+
+from . import cache as analysis_cache
+from . import monitoring
+from .models import AnalysisStatusChoices, NoteSentimentChoices
+from .providers import get_provider
+from .resilience import guarded_call, guarded_stream
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# Bump whenever a prompt changes so cached results from the old prompts are not reused
+# and notes analysed with them are picked up by `manage.py reanalyze_notes`.
+PROMPT_VERSION = 1
+
+SENTIMENT_FALLBACK = NoteSentimentChoices.UNCATEGORISED.value
+SAFEGUARDING_FALLBACK = "Unable to analyze safeguarding risks at this time."
+
+# How often a note's analysis checks whether calls queued behind other requests have started.
+QUEUE_POLL_INTERVAL = 0.05
+
+_executor = None
+_executor_lock = threading.Lock()
+_completion_listeners = []
+
+
+def get_executor():
+    """Return the process-wide thread pool used to fan out model calls."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.AI_ANALYSIS_MAX_WORKERS,
+                    thread_name_prefix='note-analysis',
+                )
+    return _executor
+
+
+def chat_completion(**kwargs):
+    """
+    Send a chat completion request to the configured provider (see
+    ``clients.providers``), rate limited, retried and circuit-broken by
+    ``clients.resilience`` within ``request_timeout`` seconds in all.
+    """
+    kwargs.setdefault('model', settings.AI_ANALYSIS_MODEL)
+    timeout = kwargs.pop('request_timeout', settings.AI_ANALYSIS_TIMEOUT)
+    prompt = "\n".join(message['content'] for message in kwargs['messages'])
+    provider = get_provider()
+    start = time.perf_counter()
+    try:
+        completion = guarded_call(
+            lambda remaining: provider.chat_completion(request_timeout=remaining, **kwargs),
+            prompt, kwargs.get('max_tokens'), timeout,
+        )
+    except Exception:
+        monitoring.record_model_call('chat', kwargs['model'], time.perf_counter() - start)
+        raise
+
+    elapsed = time.perf_counter() - start
+    monitoring.record_model_call('chat', kwargs['model'], elapsed, completion)
+    for listener in list(_completion_listeners):
+        listener(completion, elapsed)
+    return completion
+
+
+def text_completion(**kwargs):
+    """Send a (legacy) text completion request to the configured provider, guarded like ``chat_completion``."""
+    kwargs.setdefault('engine', settings.AI_ANALYSIS_MODEL)
+    timeout = kwargs.pop('request_timeout', settings.AI_ANALYSIS_TIMEOUT)
+    provider = get_provider()
+    start = time.perf_counter()
+    try:
+        completion = guarded_call(
+            lambda remaining: provider.text_completion(request_timeout=remaining, **kwargs),
+            kwargs['prompt'], kwargs.get('max_tokens'), timeout,
+        )
+    except Exception:
+        monitoring.record_model_call('text', kwargs['engine'], time.perf_counter() - start)
+        raise
+
+    elapsed = time.perf_counter() - start
+    monitoring.record_model_call('text', kwargs['engine'], elapsed, completion)
+    for listener in list(_completion_listeners):
+        listener(completion, elapsed)
+    return completion
+
+
+async def stream_chat_completion(**kwargs):
+    """Async generator of the pieces of a chat completion's text as the model produces them."""
+    kwargs.setdefault('model', settings.AI_ANALYSIS_MODEL)
+    kwargs.setdefault('request_timeout', settings.AI_ANALYSIS_TIMEOUT)
+    prompt = "\n".join(message['content'] for message in kwargs['messages'])
+    chunks = guarded_stream(get_provider().stream_chat_completion(**kwargs), prompt,
+                            kwargs.get('max_tokens'), kwargs['request_timeout'])
+    async for piece in _stream(chunks, kwargs, prompt, lambda choice: getattr(choice.delta, 'content', None)):
+        yield piece
+
+
+async def stream_text_completion(**kwargs):
+    """Async generator of the pieces of a (legacy) text completion as the model produces them."""
+    kwargs.setdefault('engine', settings.AI_ANALYSIS_MODEL)
+    kwargs.setdefault('request_timeout', settings.AI_ANALYSIS_TIMEOUT)
+    chunks = guarded_stream(get_provider().stream_text_completion(**kwargs), kwargs['prompt'],
+                            kwargs.get('max_tokens'), kwargs['request_timeout'])
+    async for piece in _stream(chunks, kwargs, kwargs['prompt'], lambda choice: getattr(choice, 'text', None)):
+        yield piece
+
+
+async def _stream(chunks, kwargs, prompt, text_of):
+    start = time.perf_counter()
+    pieces = []
+    async for chunk in chunks:
+        piece = text_of(chunk.choices[0]) if chunk.choices else None
+        if piece:
+            pieces.append(piece)
+            yield piece
+
+    # Streamed responses carry no usage; report one token per chunk, like the API sends them.
+    content = "".join(pieces)
+    usage = SimpleNamespace(prompt_tokens=max(1, len(prompt) // 4), completion_tokens=len(pieces))
+    usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+    completion = SimpleNamespace(
+        model=kwargs.get('model') or kwargs.get('engine'), usage=usage,
+        choices=[SimpleNamespace(index=0, text=content, message=SimpleNamespace(role='assistant', content=content))],
+    )
+    elapsed = time.perf_counter() - start
+    monitoring.record_model_call('stream', completion.model, elapsed, completion)
+    for listener in list(_completion_listeners):
+        listener(completion, elapsed)
+
+
+def add_completion_listener(listener):
+    """Call ``listener(completion, elapsed_seconds)`` after every successful model call."""
+    _completion_listeners.append(listener)
+
+
+def remove_completion_listener(listener):
+    _completion_listeners.remove(listener)
+
+
+class AnalysisError(Exception):
+    """Raised when one or more analyses of a note failed."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{field}: {error}" for field, error in errors.items()))
+
+
+def analyze_sentiment(note_text):
+    prompt = (
+        "You are a sentiment analysis system. "
+        "Return exactly one of these words: Positive, Negative, or Neutral. "
+        "Do not include any additional text or punctuation.\n\n"
+        f"Text: \"{note_text}\""
+    )
+
+    completion = chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0
+    )
+
+    if (not completion or
+            not completion.choices or
+            not completion.choices[0].message or
+            not completion.choices[0].message.content):
+        raise ValueError("Invalid response from OpenAI API for sentiment analysis.")
+
+    sentiment_response = completion.choices[0].message.content.strip()
+    return parse_sentiment(sentiment_response)
+
+
+def parse_sentiment(sentiment_response):
+    # Note: The model choices are:
+    # Positive, Neutral, Negative, Uncategorised
+    # We'll map the model's response directly to these keys:
+    sentiment_mapping = {
+        "Positive": "Positive",
+        "Negative": "Negative",
+        "Neutral": "Neutral"
+    }
+    return sentiment_mapping.get(sentiment_response, SENTIMENT_FALLBACK)
+
+
+def analyze_emotions(note_text):
+    # We provide a list of mental health related emotions as a guide.
+    # The model should return them if found, along with their scores.
+    prompt = (
+        "You are a system that identifies mental-health-related emotions in a given text. "
+        "Return only a valid JSON object with double-quoted keys and numeric values between 0 and 1. "
+        "Keys should be emotion names (strings), and values should be their associated intensity scores. "
+        "Only include emotions relevant to mental health if they are present in the text. "
+        "If no mental-health-related emotions are found, return an empty JSON object `{}`.\n\n"
+        "Some examples of mental-health-related emotions are: \"sadness\", \"anxiety\", \"depression\", \"fear\", "
+        "\"stress\", \"hopelessness\", \"worry\", \"loneliness\", \"shame\", \"guilt\", \"anger\", \"helplessness\".\n\n"
+        "Analyze the following text:\n"
+        f"\"{note_text}\"\n\n"
+        "Example Output:\n"
+        "{\"anxiety\": 0.8, \"sadness\": 0.2}\n\n"
+        "Now produce only the JSON object (no extra text):"
+    )
+
+    completion = chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,  # More deterministic output
+        max_tokens=200
+    )
+
+    if not completion or not completion.choices or not completion.choices[0].message:
+        raise ValueError("Invalid response from OpenAI API for emotion analysis.")
+
+    emotion_response = completion.choices[0].message.content.strip()
+    logger.debug(f"Emotion analysis response: {emotion_response}")
+    return parse_emotions(emotion_response)
+
+
+def parse_emotions(emotion_response):
+    # Validate if response looks like JSON
+    if not (emotion_response.startswith("{") and emotion_response.endswith("}")):
+        raise ValueError(f"Emotion analysis returned non-JSON format: {emotion_response}")
+
+    try:
+        emotion_tags = json.loads(emotion_response)
+    except json.JSONDecodeError as jde:
+        raise ValueError(f"JSON decode error: {str(jde)}. Response was: {emotion_response}")
+
+    return clamp_emotion_scores(emotion_tags)
+
+
+def clamp_emotion_scores(emotion_tags):
+    """Keep only emotions whose score is a number between 0 and 1."""
+    validated_tags = {}
+    for emotion, score in emotion_tags.items():
+        try:
+            float_score = float(score)
+            if 0 <= float_score <= 1:
+                validated_tags[emotion] = float_score
+            else:
+                logger.warning(f"Score out of range for emotion '{emotion}': {score}")
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid score for emotion '{emotion}': {score}")
+            # Skip invalid scores
+
+    return validated_tags
+
+
+def safeguarding_prompt(note_text):
+    return (
+        "You are acting as a safeguarding officer. Read the following care note carefully and "
+        "identify all potential risks to the patient’s well-being, such as signs of abuse, neglect, "
+        "self-harm, unmet care needs, or environmental hazards. Then provide a list of suggestions "
+        "for safeguarding actions that could be taken to protect the patient. "
+        "Present your answer in plain text, clearly separating the identified risks and the suggested "
+        "safeguarding measures.\n\n"
+        f"Care Note: \"{note_text}\""
+    )
+
+
+def evaluate_for_safeguarding(note_text):
+    completion = chat_completion(
+        messages=[{"role": "user", "content": safeguarding_prompt(note_text)}],
+        temperature=0
+    )
+
+    safeguarding_response = completion.choices[0].message.content.strip()
+    return safeguarding_response
+
+
+def analyze_combined(note_text):
+    """
+    Run all three analyses with a single prompt that returns one JSON document.
+
+    Returns ``(results, errors)``: each field of the document is validated on
+    its own, so a bad emotions object does not throw away a good sentiment.
+    """
+    prompt = (
+        "You are a care-note analysis system. Analyse the care note below and return only a valid JSON "
+        "object (no extra text) with exactly these keys:\n"
+        "\"sentiment\": exactly one of \"Positive\", \"Negative\" or \"Neutral\".\n"
+        "\"emotions\": an object whose keys are mental-health-related emotions present in the note "
+        "(for example \"sadness\", \"anxiety\", \"depression\", \"fear\", \"stress\", \"hopelessness\", "
+        "\"worry\", \"loneliness\", \"shame\", \"guilt\", \"anger\", \"helplessness\") and whose values are "
+        "intensity scores between 0 and 1. Use {} if none are present.\n"
+        "\"safeguarding\": plain text written as a safeguarding officer, identifying all potential risks "
+        "to the patient’s well-being (abuse, neglect, self-harm, unmet care needs, environmental hazards) "
+        "and then suggested safeguarding measures, clearly separated.\n\n"
+        f"Care Note: \"{note_text}\""
+    )
+
+    completion = chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0
+    )
+
+    if not completion or not completion.choices or not completion.choices[0].message:
+        raise ValueError("Invalid response from OpenAI API for combined analysis.")
+
+    return parse_combined(completion.choices[0].message.content.strip())
+
+
+def parse_combined(response):
+    """Validate a combined analysis document against ``COMBINED_SCHEMA``."""
+    document = json.loads(response)
+    if not isinstance(document, dict):
+        raise ValueError(f"Combined analysis returned a {type(document).__name__}, not an object.")
+
+    results, errors = {}, {}
+    for field, (key, parse) in COMBINED_SCHEMA.items():
+        try:
+            if key not in document:
+                raise ValueError(f"missing key '{key}'")
+            results[field] = parse(document[key])
+        except (TypeError, ValueError, AttributeError) as e:
+            errors[field] = ValueError(f"invalid '{key}' in combined analysis: {e}")
+    return results, errors
+
+
+def _parse_combined_sentiment(value):
+    if value not in ("Positive", "Negative", "Neutral"):
+        raise ValueError(f"unexpected sentiment {value!r}")
+    return value
+
+
+def _parse_combined_emotions(value):
+    if not isinstance(value, dict):
+        raise TypeError("emotions must be an object")
+    return clamp_emotion_scores(value)
+
+
+def _parse_combined_safeguarding(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("safeguarding must be non-empty text")
+    return value.strip()
+
+
+# Note field -> (key in the combined document, validator)
+COMBINED_SCHEMA = {
+    'sentiment': ('sentiment', _parse_combined_sentiment),
+    'emotion_tags': ('emotions', _parse_combined_emotions),
+    'ai_evaluated_notes': ('safeguarding', _parse_combined_safeguarding),
+}
+
+
+# Note field -> (analysis function, fallback factory)
+ANALYSES = {
+    'sentiment': (analyze_sentiment, lambda: SENTIMENT_FALLBACK),
+    'emotion_tags': (analyze_emotions, dict),
+    'ai_evaluated_notes': (evaluate_for_safeguarding, lambda: SAFEGUARDING_FALLBACK),
+}
+
+
+def run_analysis(field, note_text):
+    with monitoring.timed_analysis(field):
+        return ANALYSES[field][0](note_text)
+
+
+def run_separate(note_text, fields, concurrent):
+    """
+    Run the single-purpose analysis for each of ``fields``; return ``(results, errors)``.
+
+    Concurrent calls share the process's pool, so one may wait there behind
+    other notes' calls; each gets ``AI_ANALYSIS_TIMEOUT`` seconds from when it
+    starts running, not from when it was queued.
+    """
+    results, errors = {}, {}
+    if concurrent:
+        timeout = settings.AI_ANALYSIS_TIMEOUT
+        started = {}
+
+        def start(field):
+            started[field] = time.monotonic()
+            return run_analysis(field, note_text)
+
+        executor = get_executor()
+        # Each call runs in a copy of this context, so its metrics count towards the current request.
+        pending = {field: executor.submit(contextvars.copy_context().run, start, field) for field in fields}
+        while pending:
+            now = time.monotonic()
+            for field in [field for field in pending if field in started and now >= started[field] + timeout]:
+                if not pending[field].done():
+                    del pending[field]
+                    errors[field] = TimeoutError(f"timed out after {timeout}s")
+            if not pending:
+                break
+            # Wake for the next deadline, or shortly to pick up the deadline of a call still queued.
+            deadlines = [started[field] + timeout for field in pending if field in started]
+            wake = min(deadlines) if len(deadlines) == len(pending) else min(deadlines + [now + QUEUE_POLL_INTERVAL])
+            done, _ = wait(pending.values(), timeout=max(0, wake - now), return_when=FIRST_COMPLETED)
+            for field in [field for field, future in pending.items() if future in done]:
+                future = pending.pop(field)
+                if future.exception() is not None:
+                    errors[field] = future.exception()
+                else:
+                    results[field] = future.result()
+    else:
+        for field in fields:
+            try:
+                results[field] = run_analysis(field, note_text)
+            except Exception as e:
+                errors[field] = e
+    return results, errors
+
+
+def analyze_note(note_text, concurrent=None, fallback=True, strategy=None, use_cache=None, refresh=False):
+    """
+    Run every analysis for ``note_text`` and return the AI fields of a note.
+
+    ``strategy`` (defaults to ``AI_ANALYSIS_STRATEGY``) is either 'separate',
+    one prompt per field, or 'combined', a single prompt for all fields where
+    any field that fails validation is retried with its separate prompt.
+
+    With ``concurrent`` (defaults to ``AI_ANALYSIS_CONCURRENT``) separate calls
+    are submitted together and each one is given ``AI_ANALYSIS_TIMEOUT`` seconds.
+    An analysis that fails or times out is replaced by its fallback value, or
+    raises ``AnalysisError`` when ``fallback`` is False.
+
+    Fully successful results are cached (``AI_CACHE_ENABLED``) and returned
+    without any model call the next time the same text is analysed. With
+    ``refresh`` the cache is not read, only written: the model is always asked
+    and a successful result replaces the cached one.
+    """
+    if concurrent is None:
+        concurrent = settings.AI_ANALYSIS_CONCURRENT
+    if strategy is None:
+        strategy = settings.AI_ANALYSIS_STRATEGY
+    if use_cache is None:
+        use_cache = settings.AI_CACHE_ENABLED
+
+    if use_cache:
+        key = analysis_cache.cache_key(note_text, PROMPT_VERSION, strategy, settings.AI_ANALYSIS_MODEL)
+        cached = None if refresh else analysis_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+    if strategy == 'combined':
+        try:
+            with monitoring.timed_analysis('combined'):
+                results, errors = analyze_combined(note_text)
+        except Exception as e:
+            logger.warning(f"Combined analysis error: {str(e)}")
+            results, errors = {}, dict.fromkeys(ANALYSES, e)
+        if errors:
+            logger.warning(f"Falling back to separate analysis for: {', '.join(errors)}")
+            retried, errors = run_separate(note_text, list(errors), concurrent)
+            results.update(retried)
+    else:
+        results, errors = run_separate(note_text, list(ANALYSES), concurrent)
+
+    for field, error in errors.items():
+        logger.error(f"Analysis '{field}' error: {str(error)}", exc_info=error)
+
+    if errors:
+        if not fallback:
+            raise AnalysisError(errors)
+        for field in errors:
+            results[field] = ANALYSES[field][1]()
+    elif use_cache:
+        analysis_cache.put(key, results)
+    return results
+
+
+def completed_fields(results):
+    """The note fields to save for a complete analysis: ``results`` plus its status and prompt version."""
+    return {**results, 'analysis_status': AnalysisStatusChoices.COMPLETE, 'analysis_version': PROMPT_VERSION}
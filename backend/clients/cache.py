@@ -0,0 +1,138 @@
+"""
+Content-addressed cache of note analysis results.
+
+Entries are keyed by a SHA-256 of the normalised note text, the prompt
+version, the analysis strategy and the model name, so identical text is only
+ever sent to the model once per prompt revision. Entries live in the database
+with a TTL and least-recently-used eviction; a Django cache alias can be
+placed in front of the table with ``AI_CACHE_DJANGO_ALIAS``.
+
+The cache is best-effort: a database error while reading or writing an entry
+is logged and treated as a miss, never as a failed analysis.
+"""
+import hashlib
+import logging
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F, Sum
+from django.utils.timezone import now
+
+from .models import AnalysisCacheEntry
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+_counters = {'hits': 0, 'misses': 0, 'stores': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+        return _counters[name]
+
+
+def normalise(note_text):
+    """Collapse runs of whitespace so trivially re-formatted text shares an entry."""
+    return re.sub(r'\s+', ' ', note_text or '').strip()
+
+
+def cache_key(note_text, prompt_version, strategy, model):
+    material = "\0".join([str(prompt_version), strategy, model, normalise(note_text)])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _front_cache():
+    alias = settings.AI_CACHE_DJANGO_ALIAS
+    return caches[alias] if alias else None
+
+
+def get(key):
+    """Return the cached result for ``key`` or None, updating hit/miss counters."""
+    front = _front_cache()
+    if front is not None:
+        result = front.get(f"analysis:{key}")
+        if result is not None:
+            _count('hits')
+            return result
+
+    try:
+        entry = AnalysisCacheEntry.objects.filter(key=key, expires_at__gt=now()).only('result').first()
+        if entry is not None:
+            AnalysisCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=now(), hit_count=F('hit_count') + 1)
+    except DatabaseError as e:
+        logger.warning(f"Analysis cache lookup failed: {e}")
+        entry = None
+
+    if entry is None:
+        _count('misses')
+        return None
+
+    _count('hits')
+    if front is not None:
+        front.set(f"analysis:{key}", entry.result, settings.AI_CACHE_TTL)
+    return entry.result
+
+
+def put(key, result):
+    """Store ``result`` under ``key``, pruning the table every ``AI_CACHE_PRUNE_EVERY`` stores."""
+    stamp = now()
+    defaults = {'result': result, 'last_used_at': stamp, 'expires_at': stamp + timedelta(seconds=settings.AI_CACHE_TTL)}
+    try:
+        AnalysisCacheEntry.objects.update_or_create(key=key, defaults=defaults)
+    except IntegrityError:
+        # Another process stored the same key first; its result is just as good.
+        pass
+    except DatabaseError as e:
+        logger.warning(f"Analysis cache store failed: {e}")
+        return
+
+    front = _front_cache()
+    if front is not None:
+        front.set(f"analysis:{key}", result, settings.AI_CACHE_TTL)
+
+    if _count('stores') % settings.AI_CACHE_PRUNE_EVERY == 0:
+        prune()
+
+
+def prune():
+    """Delete expired entries, then the least recently used ones above ``AI_CACHE_MAX_ENTRIES``."""
+    expired, _ = AnalysisCacheEntry.objects.filter(expires_at__lte=now()).delete()
+
+    evicted = 0
+    cutoff = (AnalysisCacheEntry.objects.order_by('-last_used_at')
+              .values_list('last_used_at', flat=True)[settings.AI_CACHE_MAX_ENTRIES:settings.AI_CACHE_MAX_ENTRIES + 1])
+    if cutoff:
+        evicted, _ = AnalysisCacheEntry.objects.filter(last_used_at__lte=cutoff[0]).delete()
+
+    if expired or evicted:
+        logger.info(f"Pruned analysis cache: {expired} expired, {evicted} evicted")
+    return expired, evicted
+
+
+def stats():
+    """Hit/miss counters for this process plus totals stored in the database."""
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = counters['hits'] + counters['misses']
+    totals = AnalysisCacheEntry.objects.aggregate(stored_hits=Sum('hit_count'))
+    return {
+        **counters,
+        'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None,
+        'entries': AnalysisCacheEntry.objects.count(),
+        'stored_hits': totals['stored_hits'] or 0,
+    }
+
+
+def clear():
+    """
+    Delete every stored entry. Copies held in the front cache are left to
+    expire on their own, since the alias may be shared with other data.
+    """
+    deleted, _ = AnalysisCacheEntry.objects.all().delete()
+    return deleted
@@ -0,0 +1,325 @@
+"""
+Note embeddings and "similar notes" search.
+
+Enriching a note also embeds its text with a local model and stores the
+vector as float32 bytes in ``NoteEmbedding``. The embedder is chosen with
+``AI_EMBEDDING_BACKEND``:
+
+- ``hashing`` (default): built in and dependency-free. Words and word pairs
+  are hashed into ``AI_EMBEDDING_DIMENSIONS`` buckets, so notes that share
+  wording and phrases come out similar. Works offline with nothing to download.
+- ``sentence-transformers``: a local transformer model (``AI_EMBEDDING_MODEL``)
+  that also matches paraphrases. Needs the sentence-transformers package and
+  the model files.
+
+Vectors are L2-normalised, so cosine similarity is a dot product. Each process
+keeps the vectors in memory: as one NumPy matrix scored in a single
+matrix-vector product, or, from ``AI_EMBEDDING_ANN_THRESHOLD`` vectors, as an
+HNSW graph (hnswlib, in requirements.txt; without it searches stay exact, with
+a warning). Before each search the index picks up vectors written since it
+was loaded. ``manage.py rebuild_embeddings``
+re-embeds notes, e.g. after changing the embedder.
+"""
+import logging
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import NoteEmbedding
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"[a-z0-9']+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i in is it its of on or she so that the "
+    "their them they this to was were with".split()
+)
+
+# With an HNSW index, filtered searches over at most this many notes are scored exactly instead.
+EXACT_SUBSET = 20000
+
+
+# Embedders *********************************************************************
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word pairs with sublinear term frequency."""
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self.name = f"hashing-v1-{dimensions}"
+
+    def features(self, text):
+        words = [word for word in TOKEN.findall((text or '').lower()) if word not in STOP_WORDS]
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array([zlib.crc32(feature.encode('utf-8')) for feature in self.features(text)], dtype=np.int64)
+            if len(hashes):
+                np.add.at(matrix[row], hashes % self.dimensions, np.where(hashes & 0x80000000, 1.0, -1.0))
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        return normalised(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model run locally on the CPU."""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        self.name = f"sentence-transformers-{model_name}"[:200]
+
+    def embed(self, texts):
+        vectors = self.model.encode([text or '' for text in texts], convert_to_numpy=True, normalize_embeddings=True)
+        return vectors.astype(np.float32)
+
+
+def normalised(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+_embedders = {}
+
+
+def get_embedder():
+    backend = settings.AI_EMBEDDING_BACKEND
+    key = (backend, settings.AI_EMBEDDING_MODEL, settings.AI_EMBEDDING_DIMENSIONS)
+    if key not in _embedders:
+        if backend == 'hashing':
+            _embedders[key] = HashingEmbedder(settings.AI_EMBEDDING_DIMENSIONS)
+        elif backend == 'sentence-transformers':
+            _embedders[key] = SentenceTransformerEmbedder(settings.AI_EMBEDDING_MODEL)
+        else:
+            raise ValueError(f"Unknown AI_EMBEDDING_BACKEND {backend!r}")
+    return _embedders[key]
+
+
+def to_bytes(vector):
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(data, dtype='<f4')
+
+# End Embedders ******************************************************************
+
+
+def store_embeddings(notes, embedder=None):
+    """Embed the text of ``notes`` (objects with ``pk`` and ``note_text``) and save the vectors."""
+    embedder = embedder or get_embedder()
+    vectors = embedder.embed([note.note_text for note in notes])
+    NoteEmbedding.objects.bulk_create(
+        [NoteEmbedding(note_id=note.pk, model=embedder.name, vector=to_bytes(vector))
+         for note, vector in zip(notes, vectors)],
+        update_conflicts=True, unique_fields=['note'], update_fields=['model', 'vector', 'updated_at'],
+        batch_size=500,
+    )
+    return len(notes)
+
+
+def embed_notes(notes):
+    """
+    The embedding stage of note enrichment. Failures are logged rather than
+    raised so they never fail the note itself; ``rebuild_embeddings --missing``
+    fills the gaps.
+    """
+    notes = [note for note in notes if note.pk is not None]
+    if not notes:
+        return 0
+    try:
+        return store_embeddings(notes)
+    except Exception as e:
+        logger.error(f"Error embedding {len(notes)} notes: {str(e)}", exc_info=True)
+        return 0
+
+
+# Vector indexes ****************************************************************
+
+class BruteForceIndex:
+    """Exact search: every vector scored in one matrix-vector product."""
+
+    def __init__(self, dimensions, capacity=0):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, dimensions), dtype=np.float32)
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, note_id):
+        return note_id in self.positions
+
+    def add(self, ids, vectors):
+        new_ids, new_vectors = [], []
+        for note_id, vector in zip(ids, vectors):
+            if note_id in self.positions:
+                self.matrix[self.positions[note_id]] = vector
+            else:
+                self.positions[note_id] = len(self.ids) + len(new_ids)
+                new_ids.append(note_id)
+                new_vectors.append(vector)
+        if new_ids:
+            self.ids = np.concatenate([self.ids, np.array(new_ids, dtype=np.int64)])
+            self.matrix = np.concatenate([self.matrix, np.array(new_vectors, dtype=np.float32)])
+
+    def search(self, vector, k, allowed=None):
+        scores = self.matrix @ vector
+        if allowed is not None:
+            scores = np.where(np.isin(self.ids, allowed), scores, -np.inf)
+        return top_k(self.ids, scores, k)
+
+
+class HNSWIndex:
+    """Approximate search over an HNSW graph (hnswlib), for organisations with many notes."""
+
+    def __init__(self, dimensions, capacity=0):
+        import hnswlib
+        self.graph = hnswlib.Index(space='ip', dim=dimensions)
+        self.graph.init_index(max_elements=max(capacity, 1000), ef_construction=200, M=16)
+        self.labels = set()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, note_id):
+        return note_id in self.labels
+
+    def add(self, ids, vectors):
+        needed = len(self.labels | set(ids))
+        if needed > self.graph.get_max_elements():
+            self.graph.resize_index(max(needed, 2 * self.graph.get_max_elements()))
+        # Existing labels get their vector replaced.
+        self.graph.add_items(np.asarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+        self.labels.update(ids)
+
+    def search(self, vector, k, allowed=None):
+        if allowed is not None:
+            allowed = [note_id for note_id in allowed.tolist() if note_id in self.labels]
+            if len(allowed) <= EXACT_SUBSET:
+                if not allowed:
+                    return []
+                ids = np.array(allowed, dtype=np.int64)
+                return top_k(ids, np.asarray(self.graph.get_items(ids), dtype=np.float32) @ vector, k)
+        k = min(k, len(self.labels) if allowed is None else len(allowed))
+        if not k:
+            return []
+        self.graph.set_ef(max(64, 2 * k))
+        allowed_set = set(allowed) if allowed is not None else None
+        labels, distances = self.graph.knn_query(
+            vector, k=k, filter=allowed_set.__contains__ if allowed_set is not None else None,
+        )
+        # hnswlib's inner-product "distance" is 1 - dot product.
+        return [(int(label), float(1 - distance)) for label, distance in zip(labels[0], distances[0])]
+
+
+def top_k(ids, scores, k):
+    """The ``k`` best ``(id, score)`` pairs, best first, skipping excluded (-inf) scores."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [(int(ids[i]), float(scores[i])) for i in best if scores[i] > -np.inf]
+
+
+def index_class(size):
+    if size >= settings.AI_EMBEDDING_ANN_THRESHOLD:
+        try:
+            import hnswlib  # noqa: F401
+            return HNSWIndex
+        except ImportError:
+            logger.warning(f"{size} note vectors but hnswlib is not installed; using exact search.")
+    return BruteForceIndex
+
+
+class _Loaded:
+    def __init__(self, index, count, latest):
+        self.index, self.count, self.latest = index, count, latest
+
+
+_indexes = {}
+# One lock per (database, model), so updating one index never holds up searches of another.
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_for(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _current(loaded, state):
+    return loaded is not None and (loaded.count, loaded.latest) == (state['count'], state['latest'])
+
+
+def get_index(using, embedder):
+    """
+    This process's index of ``embedder``'s vectors, brought up to date with the
+    table: vectors written since the last call are added, and anything else
+    (deleted notes, a much larger table) reloads it.
+
+    The freshness check runs without a lock, so searches that find the index
+    current never wait; only updating it is serialised, per index.
+    """
+    rows = NoteEmbedding.objects.using(using).filter(model=embedder.name)
+    key = (using, embedder.name)
+    state = rows.aggregate(count=Count('pk'), latest=Max('updated_at'))
+    loaded = _indexes.get(key)
+    if _current(loaded, state):
+        return loaded.index
+
+    with _lock_for(key):
+        # Another thread may have brought the index up to date while this one waited.
+        state = rows.aggregate(count=Count('pk'), latest=Max('updated_at'))
+        loaded = _indexes.get(key)
+        if _current(loaded, state):
+            return loaded.index
+
+        if loaded is not None and loaded.latest is not None and index_class(state['count']) is type(loaded.index):
+            changed = list(rows.filter(updated_at__gte=loaded.latest).values_list('note_id', 'vector'))
+            added = sum(1 for note_id, _ in changed if note_id not in loaded.index)
+            if len(loaded.index) + added == state['count']:
+                if changed:
+                    loaded.index.add([note_id for note_id, _ in changed], [from_bytes(vector) for _, vector in changed])
+                loaded.count, loaded.latest = state['count'], state['latest']
+                return loaded.index
+
+        index = index_class(state['count'])(embedder.dimensions, state['count'])
+        batch = []
+        for row in rows.values_list('note_id', 'vector').iterator(chunk_size=5000):
+            batch.append(row)
+            if len(batch) >= 5000:
+                index.add([note_id for note_id, _ in batch], [from_bytes(vector) for _, vector in batch])
+                batch = []
+        if batch:
+            index.add([note_id for note_id, _ in batch], [from_bytes(vector) for _, vector in batch])
+        _indexes[key] = _Loaded(index, state['count'], state['latest'])
+        logger.info(f"Loaded {len(index)} note vectors into a {type(index).__name__}")
+        return index
+
+# End Vector indexes *************************************************************
+
+
+def similar_notes(note, candidates=None, limit=10, using=None):
+    """
+    The notes most similar to ``note`` as ``(note_id, similarity)`` pairs,
+    best first. ``candidates``, a ``ClientNote`` queryset, restricts the
+    search, e.g. to other clients' notes.
+    """
+    embedder = get_embedder()
+    using = using or (candidates.db if candidates is not None else 'default')
+    vector = embedder.embed([note.note_text])[0]
+    allowed = None
+    if candidates is not None:
+        allowed = np.fromiter(candidates.order_by().values_list('id', flat=True).iterator(chunk_size=10000),
+                              dtype=np.int64)
+    hits = get_index(using, embedder).search(vector, limit + 1, allowed)
+    return [(note_id, score) for note_id, score in hits if note_id != note.pk][:limit]
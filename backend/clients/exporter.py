@@ -0,0 +1,169 @@
+"""
+Streaming export of care records.
+
+A client's record is its ``CareClient`` row plus every ``ClientNote``,
+including the AI fields, as CSV, JSON Lines or a zip bundle of both. Every
+exporter is a generator of byte chunks that reads the notes with
+``.iterator(chunk_size=...)``, so memory stays flat however many notes a
+client has; the views wrap them in a ``StreamingHttpResponse`` and
+``manage.py export_care_records`` writes them to files. The zip archives are
+written as they are streamed, without seeking.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import CareClient, ClientNote
+
+FORMATS = ('csv', 'jsonl', 'zip')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+
+CLIENT_FIELDS = (
+    'id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'address', 'contact_number', 'care_notes',
+    'emergency_contact_name', 'emergency_contact_number', 'care_status', 'assigned_caregiver__username',
+    'created_at', 'updated_at',
+)
+NOTE_FIELDS = (
+    'id', 'created_at', 'created_by__username', 'note_text', 'sentiment', 'emotion_tags', 'ai_evaluated_notes',
+    'analysis_status',
+)
+# Column names without the lookups
+NOTE_COLUMNS = tuple(field.replace('__username', '') for field in NOTE_FIELDS)
+CLIENT_COLUMNS = tuple(field.replace('__username', '') for field in CLIENT_FIELDS)
+
+CHUNK_SIZE = 2000
+
+
+def client_record(care_client_id, using=None):
+    record = CareClient.objects.using(using).filter(pk=care_client_id).values_list(*CLIENT_FIELDS).first()
+    return dict(zip(CLIENT_COLUMNS, record)) if record else None
+
+
+def note_records(care_client_id, using=None, chunk_size=CHUNK_SIZE):
+    notes = (ClientNote.objects.using(using).filter(care_client_id=care_client_id)
+             .order_by('created_at', 'id').values_list(*NOTE_FIELDS))
+    for values in notes.iterator(chunk_size=chunk_size):
+        yield dict(zip(NOTE_COLUMNS, values))
+
+
+def to_json(record):
+    return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def export_jsonl(care_client_id, using=None):
+    """The client as the first line (``"record": "client"``), then one line per note."""
+    client = client_record(care_client_id, using)
+    if client is None:
+        return
+    yield (to_json({'record': 'client', **client}) + '\n').encode('utf-8')
+    batch = []
+    for note in note_records(care_client_id, using):
+        batch.append(to_json({'record': 'note', 'client_id': care_client_id, **note}) + '\n')
+        if len(batch) >= 100:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
+
+
+def export_csv(care_client_id, using=None):
+    """One row per note, with the client's id and name on every row."""
+    client = client_record(care_client_id, using)
+    if client is None:
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('client_id', 'client_name') + NOTE_COLUMNS)
+    name = f"{client['first_name']} {client['last_name']}"
+    for i, note in enumerate(note_records(care_client_id, using), start=1):
+        note['emotion_tags'] = json.dumps(note['emotion_tags']) if note['emotion_tags'] is not None else ''
+        writer.writerow((care_client_id, name) + tuple(note.values()))
+        if i % 100 == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable file object that hands back whatever the zip writer wrote since the last drain."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """Zip ``(name, chunks)`` entries, yielding the archive as it is written."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            # Sizes aren't known up front, so allow for entries over 2 GiB.
+            with archive.open(name, 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield from _drained(sink)
+            yield from _drained(sink)
+    yield from _drained(sink)
+
+
+def _drained(sink):
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def export_zip(care_client_id, using=None):
+    """``client.json``, ``notes.csv`` and ``notes.jsonl`` in one archive."""
+    client = client_record(care_client_id, using)
+    if client is None:
+        return
+    yield from stream_zip([
+        ('client.json', [json.dumps(client, cls=DjangoJSONEncoder, indent=2).encode('utf-8')]),
+        ('notes.csv', export_csv(care_client_id, using)),
+        ('notes.jsonl', export_jsonl(care_client_id, using)),
+    ])
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'jsonl': export_jsonl,
+    'zip': export_zip,
+}
+
+
+def filename(care_client_id, fmt):
+    return f"client-{care_client_id}.{fmt}"
+
+
+def export_client(care_client_id, fmt, using=None):
+    return EXPORTERS[fmt](care_client_id, using)
+
+
+def export_organisation(fmt, clients=None, using=None):
+    """A zip with one ``fmt`` file per client (default: every client)."""
+    clients = CareClient.objects.using(using).all() if clients is None else clients
+    # Only ids, so holding them all is cheap and avoids nesting a cursor around each client's notes.
+    client_ids = list(clients.order_by('id').values_list('id', flat=True))
+    return stream_zip((filename(care_client_id, fmt), export_client(care_client_id, fmt, using))
+                      for care_client_id in client_ids)
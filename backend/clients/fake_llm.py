@@ -0,0 +1,207 @@
+"""
+Offline stand-in for the OpenAI chat completion API.
+
+Selected with ``AI_ANALYSIS_BACKEND = 'fake'``. Responses are derived from a
+small keyword lexicon so they are deterministic, and every call sleeps to
+mimic a model round-trip: ``FAKE_LLM_LATENCY`` seconds, or with
+``FAKE_LLM_LATENCY_DISTRIBUTION`` a time drawn around it (``uniform``: within
+``FAKE_LLM_LATENCY_SPREAD`` of it either way, as a fraction; ``lognormal``: a
+median of ``FAKE_LLM_LATENCY`` with a long tail, sigma ``FAKE_LLM_LATENCY_SPREAD``).
+``seed_latency`` makes the draws repeatable. Streamed
+responses (``acreate``) arrive word by word, starting after
+``FAKE_LLM_FIRST_TOKEN_LATENCY``. This lets the analysis pipeline be
+exercised and benchmarked without network access.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+
+POSITIVE_WORDS = {'happy', 'cheerful', 'calm', 'good', 'well', 'smiling', 'enjoyed', 'content', 'comfortable'}
+NEGATIVE_WORDS = {'sad', 'upset', 'angry', 'fell', 'fall', 'pain', 'crying', 'refused', 'anxious', 'worried', 'alone'}
+
+EMOTION_LEXICON = {
+    'sadness': {'sad', 'crying', 'tearful', 'low'},
+    'anxiety': {'anxious', 'nervous', 'panic', 'restless'},
+    'worry': {'worried', 'worry', 'concerned'},
+    'anger': {'angry', 'shouting', 'agitated', 'aggressive'},
+    'loneliness': {'alone', 'lonely', 'isolated'},
+    'fear': {'afraid', 'scared', 'frightened'},
+    'hopelessness': {'hopeless', 'pointless', 'giving up'},
+}
+
+SAFEGUARDING_WORDS = {'fell', 'fall', 'bruise', 'bruising', 'refused', 'self-harm', 'hopeless', 'neglect'}
+
+NOTE_PATTERNS = (
+    re.compile(r'Text: "(.*)"\Z', re.DOTALL),
+    re.compile(r'Analyze the following text:\n"(.*)"\n\nExample Output', re.DOTALL),
+    re.compile(r'Care Note: "(.*)"\Z', re.DOTALL),
+)
+
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+_latency_rng = random.Random(0)
+
+
+def seed_latency(seed):
+    _latency_rng.seed(seed)
+
+
+def sample_latency():
+    """Seconds the next fake call takes, per ``FAKE_LLM_LATENCY`` and its distribution settings."""
+    latency = settings.FAKE_LLM_LATENCY
+    distribution = settings.FAKE_LLM_LATENCY_DISTRIBUTION
+    spread = settings.FAKE_LLM_LATENCY_SPREAD
+    if distribution == 'fixed' or not latency:
+        return latency
+    if distribution == 'uniform':
+        return latency * _latency_rng.uniform(max(0.0, 1 - spread), 1 + spread)
+    if distribution == 'lognormal':
+        return latency * _latency_rng.lognormvariate(0, spread)
+    raise ValueError(f"Unknown FAKE_LLM_LATENCY_DISTRIBUTION {distribution!r}")
+
+
+def extract_note_text(prompt):
+    """Pull the quoted note out of an analysis prompt."""
+    for pattern in NOTE_PATTERNS:
+        match = pattern.search(prompt)
+        if match:
+            return match.group(1)
+    return prompt
+
+
+def words_in(text):
+    return set(re.findall(r"[a-z\-]+", text.lower()))
+
+
+def fake_sentiment(note_text):
+    words = words_in(note_text)
+    score = len(words & POSITIVE_WORDS) - len(words & NEGATIVE_WORDS)
+    if score > 0:
+        return "Positive"
+    if score < 0:
+        return "Negative"
+    return "Neutral"
+
+
+def fake_emotions(note_text):
+    words = words_in(note_text)
+    return {
+        emotion: round(min(1.0, 0.4 + 0.2 * len(words & triggers)), 2)
+        for emotion, triggers in EMOTION_LEXICON.items()
+        if words & triggers
+    }
+
+
+def fake_safeguarding(note_text):
+    risks = sorted(words_in(note_text) & SAFEGUARDING_WORDS)
+    if not risks:
+        return "Identified risks: none identified.\n\nSuggested safeguarding measures: continue routine monitoring."
+    return (
+        f"Identified risks: note mentions {', '.join(risks)}.\n\n"
+        "Suggested safeguarding measures: review the care plan and inform the safeguarding lead."
+    )
+
+
+def fake_response(prompt):
+    """Return the text a real model would be expected to produce for ``prompt``."""
+    note_text = extract_note_text(prompt)
+    if prompt.startswith("You are a sentiment analysis system"):
+        return fake_sentiment(note_text)
+    if prompt.startswith("You are a system that identifies mental-health-related emotions"):
+        return json.dumps(fake_emotions(note_text))
+    if prompt.startswith("You are acting as a safeguarding officer"):
+        return fake_safeguarding(note_text)
+    if prompt.startswith("Based on the following patient data"):
+        return (
+            "The patient's notes show a mix of sentiments; monitor the most frequent emotions and "
+            "review the care plan with the patient's care team."
+        )
+    if prompt.startswith("You are a care-note analysis system"):
+        return json.dumps({
+            'sentiment': fake_sentiment(note_text),
+            'emotions': fake_emotions(note_text),
+            'safeguarding': fake_safeguarding(note_text),
+        })
+    return "Analysis unavailable in offline mode."
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def fake_completion(content, prompt, model):
+    usage = SimpleNamespace(prompt_tokens=estimate_tokens(prompt), completion_tokens=estimate_tokens(content))
+    usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+    return SimpleNamespace(model=model, usage=usage)
+
+
+async def fake_stream(content, make_chunk, latency=None):
+    """
+    Yield ``content`` word by word like a streaming model: the first piece
+    after ``FAKE_LLM_FIRST_TOKEN_LATENCY``, the rest spread over what is left
+    of ``latency``.
+    """
+    if latency is None:
+        latency = sample_latency()
+    first_token_latency = min(settings.FAKE_LLM_FIRST_TOKEN_LATENCY, latency)
+    pieces = re.findall(r'\s*\S+', content) or ['']
+    delay = (latency - first_token_latency) / len(pieces)
+    await asyncio.sleep(first_token_latency)
+    for i, piece in enumerate(pieces):
+        if i:
+            await asyncio.sleep(delay)
+        yield make_chunk(piece)
+
+
+class FakeChatCompletion:
+    """Mimics ``openai.ChatCompletion`` closely enough for the analysis code."""
+
+    @classmethod
+    def create(cls, messages, latency=None, **kwargs):
+        if latency is None:
+            latency = sample_latency()
+        time.sleep(latency)
+
+        prompt = "\n".join(message['content'] for message in messages)
+        content = fake_response(prompt)
+        completion = fake_completion(content, prompt, kwargs.get('model'))
+        message = SimpleNamespace(role='assistant', content=content)
+        completion.choices = [SimpleNamespace(index=0, message=message, finish_reason='stop')]
+        return completion
+
+    @classmethod
+    async def acreate(cls, messages, stream=True, latency=None, **kwargs):
+        """Streaming only, like ``openai.ChatCompletion.acreate(stream=True)``."""
+        content = fake_response("\n".join(message['content'] for message in messages))
+        return fake_stream(content, lambda piece: SimpleNamespace(
+            choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece), finish_reason=None)],
+        ), latency)
+
+
+class FakeCompletion:
+    """Mimics ``openai.Completion`` (legacy text completions)."""
+
+    @classmethod
+    def create(cls, prompt, latency=None, **kwargs):
+        if latency is None:
+            latency = sample_latency()
+        time.sleep(latency)
+
+        content = fake_response(prompt)
+        completion = fake_completion(content, prompt, kwargs.get('engine'))
+        completion.choices = [SimpleNamespace(index=0, text=content, finish_reason='stop')]
+        return completion
+
+    @classmethod
+    async def acreate(cls, prompt, stream=True, latency=None, **kwargs):
+        """Streaming only, like ``openai.Completion.acreate(stream=True)``."""
+        return fake_stream(fake_response(prompt), lambda piece: SimpleNamespace(
+            choices=[SimpleNamespace(index=0, text=piece, finish_reason=None)],
+        ), latency)
@@ -0,0 +1,80 @@
+"""
+Query-parameter filters for the client and note list endpoints.
+
+Each backend maps a handful of query parameters straight onto indexed
+columns; unknown values are rejected with a 400 rather than ignored.
+"""
+from datetime import datetime, time
+
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import AnalysisStatusChoices, CareStatusChoices, NoteSentimentChoices
+
+
+def parse_boundary(name, value, end_of_day=False):
+    """Accept an ISO date or datetime; a bare date covers the whole day."""
+    try:
+        # Well-formed but impossible values (2024-02-30) raise rather than return None.
+        parsed = parse_datetime(value)
+        day = parse_date(value) if parsed is None else None
+    except ValueError:
+        parsed = day = None
+    if parsed is None:
+        if day is None:
+            raise ValidationError({name: f"Enter a valid ISO date or datetime, not '{value}'."})
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    return make_aware(parsed) if is_naive(parsed) else parsed
+
+
+def parse_choice(name, value, choices):
+    if value not in choices.values:
+        raise ValidationError({name: f"Must be one of: {', '.join(choices.values)}."})
+    return value
+
+
+def parse_id(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "Must be an integer id."})
+
+
+def filter_created_range(queryset, params):
+    if params.get('created_after'):
+        queryset = queryset.filter(created_at__gte=parse_boundary('created_after', params['created_after']))
+    if params.get('created_before'):
+        queryset = queryset.filter(created_at__lte=parse_boundary('created_before', params['created_before'], end_of_day=True))
+    return queryset
+
+
+class CareClientFilterBackend(BaseFilterBackend):
+    """``?care_status=Active&assigned_caregiver=3&created_after=2024-01-01&created_before=2024-06-30``"""
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if params.get('care_status'):
+            queryset = queryset.filter(care_status=parse_choice('care_status', params['care_status'], CareStatusChoices))
+        if params.get('assigned_caregiver'):
+            queryset = queryset.filter(assigned_caregiver_id=parse_id('assigned_caregiver', params['assigned_caregiver']))
+        return filter_created_range(queryset, params)
+
+
+class ClientNoteFilterBackend(BaseFilterBackend):
+    """``?care_client=5&created_by=3&sentiment=Negative&analysis_status=Failed&created_after=...&created_before=...``"""
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if params.get('care_client'):
+            queryset = queryset.filter(care_client_id=parse_id('care_client', params['care_client']))
+        if params.get('created_by'):
+            queryset = queryset.filter(created_by_id=parse_id('created_by', params['created_by']))
+        if params.get('sentiment'):
+            queryset = queryset.filter(sentiment=parse_choice('sentiment', params['sentiment'], NoteSentimentChoices))
+        if params.get('analysis_status'):
+            queryset = queryset.filter(
+                analysis_status=parse_choice('analysis_status', params['analysis_status'], AnalysisStatusChoices)
+            )
+        return filter_created_range(queryset, params)
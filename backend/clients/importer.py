@@ -0,0 +1,271 @@
+"""
+Bulk import of historical client notes.
+
+Rows are read lazily from JSON Lines or CSV, validated, and written with
+``bulk_create`` one chunk per transaction. Every imported note is queued for
+analysis in the same transaction, so a crash never leaves a note that nobody
+will enrich; enrichment then either runs inline in bounded-concurrency
+batches or is left to ``manage.py run_analysis_workers``.
+"""
+import csv
+import io
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from . import providers, rollups, search, stats
+from .analysis import AnalysisError, analyze_note, completed_fields
+from .embeddings import embed_notes
+from .models import AnalysisJob, AnalysisStatusChoices, CareClient, ClientNote
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+FORMATS = ('jsonl', 'csv')
+
+# Errors worth waiting out rather than failing the row for.
+TRANSIENT_ERRORS = (
+    providers.RateLimitError,
+    providers.ServiceUnavailableError,
+    providers.APIConnectionError,
+    providers.Timeout,
+    TimeoutError,
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield ``(line_number, row_dict)`` from a text or binary stream without
+    reading it all into memory. Line numbers start at 1 for the first data row.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        for line_number, row in enumerate(csv.DictReader(stream), start=1):
+            yield line_number, row
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, RowError(f"Invalid JSON: {e}")
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError("Each line must be a JSON object.")
+
+
+def build_note(row, client_ids, created_by):
+    """Validate one input row and return an unsaved ``ClientNote``."""
+    if isinstance(row, RowError):
+        raise row
+
+    try:
+        care_client_id = int(row.get('care_client') or 0)
+    except (TypeError, ValueError):
+        raise RowError(f"Invalid care_client: {row.get('care_client')!r}")
+    if care_client_id not in client_ids:
+        raise RowError(f"Care client {care_client_id} does not exist.")
+
+    note_text = (row.get('note_text') or '').strip()
+    if not note_text:
+        raise RowError("note_text is required.")
+
+    note = ClientNote(
+        care_client_id=care_client_id,
+        created_by=created_by,
+        note_text=note_text,
+        analysis_status=AnalysisStatusChoices.PENDING,
+    )
+    if row.get('created_at'):
+        created_at = parse_datetime(str(row['created_at']))
+        if created_at is None:
+            raise RowError(f"Invalid created_at: {row['created_at']!r}")
+        note.created_at = make_aware(created_at) if is_naive(created_at) else created_at
+    return note
+
+
+def analyze_with_backoff(note_text, max_retries=None, refresh=False):
+    """``analyze_note`` that sleeps and retries while the provider is rate limiting us."""
+    max_retries = settings.AI_IMPORT_MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        try:
+            return analyze_note(note_text, fallback=False, refresh=refresh)
+        except AnalysisError as e:
+            transient = [error for error in e.errors.values() if isinstance(error, TRANSIENT_ERRORS)]
+            if not transient or attempt == max_retries:
+                raise
+            retry_after = _retry_after(transient[0])
+            delay = retry_after or settings.AI_IMPORT_RETRY_BACKOFF * 2 ** attempt
+            time.sleep(delay + random.uniform(0, delay / 4))
+
+
+def _retry_after(error):
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _analyze_in_thread(note_text, refresh):
+    try:
+        return analyze_with_backoff(note_text, refresh=refresh)
+    finally:
+        # Pool threads are short-lived; don't leave their cache lookups' connections open.
+        connections.close_all()
+
+
+def enrich_notes(notes, concurrency, refresh=False):
+    """
+    Analyse ``notes`` with at most ``concurrency`` in flight and save the results.
+    Notes that still fail are left as they were; imported notes keep their
+    queued job for the analysis workers. Returns the number of notes enriched.
+    With ``refresh`` the analysis cache is written but not read (see ``analyze_note``).
+    """
+    enriched, changes = [], []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='note-import') as pool:
+        futures = {pool.submit(_analyze_in_thread, note.note_text, refresh): note for note in notes}
+        for future in as_completed(futures):
+            note = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.warning(f"Enrichment of note {note.pk} failed: {e}")
+                continue
+            previous = stats.Contribution.of(note)
+            for field, value in completed_fields(results).items():
+                setattr(note, field, value)
+            enriched.append(note)
+            changes.append((previous, stats.Contribution.of(note)))
+
+    with transaction.atomic():
+        ClientNote.objects.bulk_update(
+            enriched, ['sentiment', 'emotion_tags', 'ai_evaluated_notes', 'analysis_status', 'analysis_version'],
+            batch_size=500,
+        )
+        AnalysisJob.objects.filter(note__in=enriched).delete()
+        # bulk_update bypasses the signals that keep the statistics, rollups and search index current.
+        stats.apply_changes(changes)
+        rollups.refresh(rollups.key_of(note.care_client_id, note.created_at) for note in enriched)
+        search.index_notes(enriched)
+    embed_notes(enriched)
+    return len(enriched)
+
+
+class NoteImporter:
+    """
+    Import rows in chunks of ``chunk_size``.
+
+    ``enrich`` is 'inline' (analyse each chunk before moving on), 'queue'
+    (leave it to the analysis workers) or 'none' (no analysis job created).
+    ``on_chunk(report)`` is called as soon as a chunk is committed, before it
+    is enriched, which is where callers record a checkpoint: everything up to
+    ``report['last_line']`` is durable and can be skipped with ``start_after``
+    on the next run. Notes whose enrichment is interrupted keep their queued
+    job. A row repeating an earlier row of the same import (client, time and
+    text, or client and text for rows without a time) is skipped, and so is a
+    row with a ``created_at`` if the client already has a note with that time
+    and text, so re-running a chunk that was committed but not checkpointed
+    does not duplicate it; rows without one are stamped with the import time
+    and cannot be recognised across runs. ``report['queued']`` counts the
+    notes left waiting for the analysis workers.
+    Daily rollups are rebuilt once per affected client when the run ends
+    (or is interrupted), rather than refreshed day by day with every chunk.
+    ``clients`` limits the care clients rows may refer to (default: all).
+    """
+
+    def __init__(self, created_by, chunk_size=500, enrich='queue', concurrency=4, on_chunk=None, clients=None):
+        self.created_by = created_by
+        self.clients = CareClient.objects.all() if clients is None else clients
+        self.chunk_size = chunk_size
+        self.enrich = enrich
+        self.concurrency = concurrency
+        self.on_chunk = on_chunk
+        self.report = {'last_line': 0, 'created': 0, 'duplicates': 0, 'enriched': 0, 'queued': 0, 'errors': []}
+        self.imported_client_ids = set()
+        self.seen = set()
+
+    def run(self, rows, start_after=0):
+        rows = ((line, row) for line, row in rows if line > start_after)
+        self.report['last_line'] = start_after
+        try:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    return self.report
+                notes = self.import_chunk(chunk)
+                if self.on_chunk:
+                    self.on_chunk(self.report)
+                if self.enrich == 'inline' and notes:
+                    enriched = enrich_notes(notes, self.concurrency)
+                    self.report['enriched'] += enriched
+                    self.report['queued'] -= enriched
+        finally:
+            for care_client_id in sorted(self.imported_client_ids):
+                rollups.rebuild(care_client_id)
+            self.imported_client_ids.clear()
+
+    def import_chunk(self, chunk):
+        wanted_ids = set()
+        for _, row in chunk:
+            if isinstance(row, dict):
+                try:
+                    wanted_ids.add(int(row.get('care_client') or 0))
+                except (TypeError, ValueError):
+                    pass
+        client_ids = set(self.clients.filter(pk__in=wanted_ids).values_list('pk', flat=True))
+
+        notes, dated = [], []
+        for line_number, row in chunk:
+            try:
+                note = build_note(row, client_ids, self.created_by)
+            except RowError as e:
+                self.report['errors'].append({'line': line_number, 'error': str(e)})
+                continue
+            key = (note.care_client_id, note.created_at if row.get('created_at') else None, note.note_text)
+            if key in self.seen:
+                self.report['duplicates'] += 1
+                continue
+            self.seen.add(key)
+            notes.append(note)
+            if row.get('created_at'):
+                dated.append(note)
+        if dated:
+            existing = set(ClientNote.objects.filter(
+                care_client_id__in={note.care_client_id for note in dated},
+                created_at__in={note.created_at for note in dated},
+            ).values_list('care_client_id', 'created_at', 'note_text'))
+            duplicates = {id(note) for note in dated
+                          if (note.care_client_id, note.created_at, note.note_text) in existing}
+            notes = [note for note in notes if id(note) not in duplicates]
+            self.report['duplicates'] += len(duplicates)
+
+        with transaction.atomic():
+            notes = ClientNote.objects.bulk_create(notes)
+            stats.apply_changes([(None, stats.Contribution.of(note)) for note in notes])
+            search.index_notes(notes)
+            if self.enrich != 'none':
+                AnalysisJob.objects.bulk_create([AnalysisJob(note=note) for note in notes])
+                self.report['queued'] += len(notes)
+
+        self.imported_client_ids.update(note.care_client_id for note in notes)
+        self.report['created'] += len(notes)
+        self.report['last_line'] = chunk[-1][0]
+        return notes
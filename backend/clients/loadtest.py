@@ -0,0 +1,190 @@
+"""
+Offline load test of the care API.
+
+``manage.py load_test`` seeds a throwaway database with ``seed.seed_dataset``,
+answers model calls with the fake LLM (``clients.fake_llm``, with a chosen
+latency distribution) and sends a weighted mix of requests from concurrent
+threads through the full Django stack, each as a caregiver (with their JWT)
+on one of the clients assigned to them:
+
+- ``create_note``: POST a note, analysed inline (or queued in deferred mode).
+- ``list_notes``: a page of one client's notes through the note list filters.
+- ``client_notes``: the same through ``client-notes/<id>/notes/``.
+- ``note_distribution``: a client's sentiment and emotion distribution.
+
+Each scenario is reported with p50/p95/p99 latency, throughput, errors and
+the mean number of database queries per request. A report saved as a
+baseline can be compared with a later run: a p95 or query count above the
+baseline, or a throughput below it, by more than the tolerance is a regression.
+"""
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend.metrics import RequestStats
+
+from .seed import NOTE_TEMPLATES
+
+
+# Scenarios *********************************************************************
+
+class Scenario:
+    """A kind of request: ``request(client, care_client, rng)`` sends it and returns the response."""
+
+    def __init__(self, name, weight, request, ok=(200,)):
+        self.name = name
+        self.weight = weight
+        self.request = request
+        self.ok = ok
+
+
+def create_note(client, care_client, rng):
+    sentiment = rng.choice(list(NOTE_TEMPLATES))
+    note_text = f"{rng.choice(NOTE_TEMPLATES[sentiment])} Visit {rng.randrange(10 ** 6)}."
+    return client.post('/api/clients/client-notes/', {'care_client': care_client.pk, 'note_text': note_text},
+                       content_type='application/json')
+
+
+def list_notes(client, care_client, rng):
+    return client.get('/api/clients/client-notes/', {'care_client': care_client.pk})
+
+
+def client_notes(client, care_client, rng):
+    return client.get(f'/api/clients/client-notes/{care_client.pk}/notes/')
+
+
+def note_distribution(client, care_client, rng):
+    return client.get(f'/api/clients/anaytics/client/{care_client.pk}/note-distribution/')
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in [
+        Scenario('create_note', 1, create_note, ok=(201,)),
+        Scenario('list_notes', 3, list_notes),
+        Scenario('client_notes', 3, client_notes),
+        Scenario('note_distribution', 2, note_distribution),
+    ]
+}
+
+# End Scenarios ******************************************************************
+
+
+class Sample:
+    __slots__ = ('scenario', 'seconds', 'ok', 'queries')
+
+    def __init__(self, scenario, seconds, ok, queries):
+        self.scenario, self.seconds, self.ok, self.queries = scenario, seconds, ok, queries
+
+
+def run_load(caregivers, care_clients, scenarios=None, requests=500, concurrency=8, seed=0):
+    """
+    Send ``requests`` requests, picked by scenario weight, from ``concurrency``
+    threads. Each request acts as a random caregiver on one of their clients.
+    Returns ``(samples, wall_seconds)``.
+    """
+    scenarios = [SCENARIOS[name] for name in (scenarios or SCENARIOS)]
+    caseloads = {}
+    for care_client in care_clients:
+        caseloads.setdefault(care_client.assigned_caregiver_id, []).append(care_client)
+    caseloads = [(str(RefreshToken.for_user(caregiver).access_token), caseloads[caregiver.pk])
+                 for caregiver in caregivers if caregiver.pk in caseloads]
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    samples = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        # Server errors are counted, not raised.
+        client = Client(raise_request_exception=False)
+        own = []
+        try:
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                scenario = rng.choices(scenarios, weights=[s.weight for s in scenarios])[0]
+                token, caseload = rng.choice(caseloads)
+                client.defaults['HTTP_AUTHORIZATION'] = f"Bearer {token}"
+                stats = RequestStats()
+                start = time.perf_counter()
+                with connections['default'].execute_wrapper(stats.time_query):
+                    response = scenario.request(client, rng.choice(caseload), rng)
+                own.append(Sample(scenario.name, time.perf_counter() - start,
+                                  response.status_code in scenario.ok, stats.db_queries))
+        finally:
+            connections.close_all()
+            with lock:
+                samples.extend(own)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load-test') as pool:
+        for future in [pool.submit(worker, index) for index in range(concurrency)]:
+            future.result()
+    return samples, time.perf_counter() - start
+
+
+def percentile(values, p):
+    """The ``p``-th percentile of ``values`` by linear interpolation between closest ranks."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarise(samples, wall_seconds):
+    """Per-scenario (and ``all``) latency percentiles in ms, requests/s, errors and mean queries."""
+    groups = {name: [sample for sample in samples if sample.scenario == name] for name in SCENARIOS}
+    groups['all'] = samples
+    report = {}
+    for name, group in groups.items():
+        if not group:
+            continue
+        latencies = [sample.seconds * 1000 for sample in group]
+        report[name] = {
+            'requests': len(group),
+            'errors': sum(1 for sample in group if not sample.ok),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'throughput_rps': round(len(group) / wall_seconds, 2),
+            'queries': round(sum(sample.queries for sample in group) / len(group), 2),
+        }
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Regressions of ``report`` against ``baseline``, as human-readable strings."""
+    regressions = []
+    for name, current in report.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if current['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms, baseline {before['p95_ms']}ms")
+        if current['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['throughput_rps']} req/s, baseline {before['throughput_rps']} req/s")
+        # Query counts hardly vary between runs of the same mix, so they get no tolerance beyond noise.
+        if current['queries'] > before['queries'] + 0.5:
+            regressions.append(f"{name}: {current['queries']} queries/request, baseline {before['queries']}")
+        if current['errors'] > before['errors']:
+            regressions.append(f"{name}: {current['errors']} errors, baseline {before['errors']}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)['scenarios']
+
+
+def save_baseline(path, report, config):
+    with open(path, 'w') as f:
+        json.dump({'config': config, 'scenarios': report}, f, indent=2, sort_keys=True)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from clients import cache as analysis_cache
+
+
+class Command(BaseCommand):
+    help = "Inspect, prune or clear the cache of note analysis results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help="Delete expired and least recently used entries.")
+        parser.add_argument('--clear', action='store_true', help="Delete every cache entry.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f"Deleted {analysis_cache.clear()} entries.")
+        elif options['prune']:
+            expired, evicted = analysis_cache.prune()
+            self.stdout.write(f"Deleted {expired} expired and {evicted} least recently used entries.")
+
+        for name, value in analysis_cache.stats().items():
+            self.stdout.write(f"{name}: {value}")
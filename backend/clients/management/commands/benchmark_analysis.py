@@ -0,0 +1,63 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from clients.analysis import add_completion_listener, analyze_note, remove_completion_listener
+
+SAMPLE_NOTES = [
+    "Client was cheerful this morning and enjoyed breakfast in the garden.",
+    "Client seemed anxious and worried about her daughter's visit, crying at lunch.",
+    "Client fell in the bathroom, small bruise on left arm. Refused pain relief.",
+    "Quiet day, client watched television and had a good nap.",
+]
+
+# Mode name -> analyze_note keyword arguments
+MODES = {
+    'serial': {'concurrent': False, 'strategy': 'separate'},
+    'concurrent': {'concurrent': True, 'strategy': 'separate'},
+    'combined': {'concurrent': True, 'strategy': 'combined'},
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark the note analysis strategies (wall time, requests and tokens) against the offline fake LLM."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notes', type=int, default=10, help="Number of notes to analyse per mode.")
+        parser.add_argument('--latency', type=float, default=0.5, help="Fake model latency per call, in seconds.")
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+
+    def handle(self, *args, **options):
+        notes = [SAMPLE_NOTES[i % len(SAMPLE_NOTES)] for i in range(options['notes'])]
+
+        with override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=options['latency'], AI_CACHE_ENABLED=False):
+            for mode in options['modes']:
+                timings, requests, tokens = self.run(notes, **MODES[mode])
+                self.stdout.write(
+                    f"{mode:>10}: mean {statistics.mean(timings):.3f}s  max {max(timings):.3f}s  "
+                    f"total {sum(timings):.3f}s  requests/note {requests / len(notes):.1f}  "
+                    f"tokens/note {tokens / len(notes):.0f}"
+                )
+
+    def run(self, notes, **kwargs):
+        usage = {'requests': 0, 'tokens': 0}
+        lock = threading.Lock()
+
+        def record(completion, elapsed):
+            with lock:
+                usage['requests'] += 1
+                usage['tokens'] += completion.usage.total_tokens
+
+        add_completion_listener(record)
+        try:
+            timings = []
+            for note_text in notes:
+                start = time.perf_counter()
+                analyze_note(note_text, **kwargs)
+                timings.append(time.perf_counter() - start)
+        finally:
+            remove_completion_listener(record)
+        return timings, usage['requests'], usage['tokens']
@@ -0,0 +1,65 @@
+import statistics
+import time
+import tracemalloc
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from clients import stats
+from clients.models import ClientNote
+from clients.seed import seed_dataset
+
+
+def model_instances(notes):
+    """The original endpoint loop: full ClientNote instances, summed in Python."""
+    emotion_sums = defaultdict(float)
+    for note in notes:
+        if isinstance(note.emotion_tags, dict):
+            for emotion, score in note.emotion_tags.items():
+                emotion_sums[emotion] += score
+    return emotion_sums
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with one client's notes and compare the time and peak Python memory "
+        "of summing emotion_tags over model instances, a values_list iterator and json_each/jsonb_each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notes', type=int, default=100000)
+        parser.add_argument('--text-size', type=int, default=2000,
+                            help="Pad note_text and ai_evaluated_notes to this many characters, like real notes.")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per approach; the median is reported.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            self.stdout.write(f"Seeding {options['notes']} notes for one client on {connection.vendor}...")
+            _, care_clients = seed_dataset(clients=1, notes_per_client=options['notes'], caregivers=1)
+            padding = 'x' * options['text_size']
+            ClientNote.objects.update(note_text=padding, ai_evaluated_notes=padding)
+            notes = ClientNote.objects.filter(care_client=care_clients[0])
+
+            approaches = {
+                "model instances": lambda: model_instances(notes.all()),
+                "values_list iterator": lambda: stats.emotion_aggregates(notes.all(), native=False),
+                "json_each / jsonb_each": lambda: stats.emotion_aggregates(notes.all()),
+            }
+            self.stdout.write(f"\n{'approach':<24} {'median ms':>10} {'peak MiB':>9}")
+            for name, run in approaches.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    run()
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                tracemalloc.start()
+                run()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(f"{name:<24} {statistics.median(timings):>10.1f} {peak / 2 ** 20:>9.2f}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,87 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import Trunc
+
+from clients.models import CareClient, ClientNote, DailySentimentRollup
+from clients.seed import seed_dataset
+
+
+def hot_queries(care_client, caregiver):
+    """The queries behind the busiest endpoints, keyed by a short description."""
+    return {
+        "client notes, newest first": ClientNote.objects.filter(care_client=care_client).order_by('-created_at', '-id')[:50],
+        "client sentiment counts": (ClientNote.objects.filter(care_client=care_client)
+                                    .values('sentiment').annotate(count=Count('id')).order_by()),
+        "client negative notes": ClientNote.objects.filter(care_client=care_client, sentiment='Negative')[:50],
+        "caregiver active caseload": CareClient.objects.filter(assigned_caregiver=caregiver, care_status='Active')[:100],
+        "client list by name": CareClient.objects.order_by('last_name', 'first_name', 'id')[:100],
+        "pending analysis": ClientNote.objects.filter(analysis_status='Pending').order_by('id')[:100],
+        "client weekly trend": (DailySentimentRollup.objects.filter(care_client=care_client)
+                                .annotate(period=Trunc('day', 'week', output_field=DateField()))
+                                .values('period', 'sentiment').annotate(count=Sum('note_count')).order_by()),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with N clients x M notes and print timings and EXPLAIN output for "
+        "the clients app's hot queries without and with the tuned indexes. Works on SQLite and PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--notes', type=int, default=100, help="Notes per client.")
+        parser.add_argument('--caregivers', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query; the median is reported.")
+        parser.add_argument('--explain', action='store_true', help="Print the query plans.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            self.stdout.write(f"Seeding {options['clients']} clients x {options['notes']} notes on {connection.vendor}...")
+            carers, care_clients = seed_dataset(options['clients'], options['notes'], options['caregivers'])
+            queries = hot_queries(care_clients[len(care_clients) // 2], carers[0])
+
+            indexes = [(model, index) for model in (CareClient, ClientNote) for index in model._meta.indexes]
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+            self.analyze()
+            before = self.measure(queries, options, "without tuned indexes")
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+            self.analyze()
+            after = self.measure(queries, options, "with tuned indexes")
+
+            self.stdout.write("\nMedian time per query (ms)")
+            for name in queries:
+                speedup = before[name] / after[name] if after[name] else float('inf')
+                self.stdout.write(f"  {name:<28} {before[name]:>9.3f} -> {after[name]:>9.3f}  ({speedup:.1f}x)")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def analyze(self):
+        """Refresh planner statistics so EXPLAIN reflects the seeded data."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, queries, options, label):
+        self.stdout.write(f"\n== {label} ==")
+        timings = {}
+        for name, queryset in queries.items():
+            runs = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset.all())
+                runs.append((time.perf_counter() - start) * 1000)
+            timings[name] = statistics.median(runs)
+            if options['explain']:
+                self.stdout.write(f"-- {name}\n{queryset.explain()}")
+        return timings
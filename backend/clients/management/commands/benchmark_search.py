@@ -0,0 +1,50 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from clients import search
+from clients.models import ClientNote
+from clients.seed import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with N clients x M notes and print the median latency of typical "
+        "note searches (first page, highlights included). Works on SQLite and PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--notes', type=int, default=100, help="Notes per client.")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per search; the median is reported.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            self.stdout.write(f"Seeding {options['clients']} clients x {options['notes']} notes on {connection.vendor}...")
+            _, care_clients = seed_dataset(options['clients'], options['notes'], caregivers=20, batch_size=5000)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            care_client = care_clients[len(care_clients) // 2]
+            notes = ClientNote.objects.all()
+
+            searches = {
+                "rare word, best match": (notes, 'hopeless', 'rank'),
+                "phrase, newest first": (notes, '"pain relief"', 'recent'),
+                "exclusion, newest first": (notes, 'lunch -anxious', 'recent'),
+                "one client, best match": (notes.filter(care_client=care_client), 'anxious crying', 'rank'),
+                "one client, newest first": (notes.filter(care_client=care_client), 'garden', 'recent'),
+            }
+            self.stdout.write("\nMedian time per search (ms)")
+            for name, (queryset, text, order) in searches.items():
+                runs = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    search.search(queryset, text, order)
+                    runs.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(f"  {name:<28} {text!r:<18} {statistics.median(runs):>9.3f}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clients import exporter
+from clients.models import CareClient
+
+
+class Command(BaseCommand):
+    help = "Export full care records (client details, notes and AI fields), one file per client."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, action='append', help="Only this client id (repeatable); default all.")
+        parser.add_argument('--format', choices=exporter.FORMATS, default='jsonl')
+        parser.add_argument('--output-dir', default='.', help="Directory the files are written to.")
+
+    def handle(self, *args, **options):
+        clients = CareClient.objects.all()
+        if options['client']:
+            clients = clients.filter(pk__in=options['client'])
+            missing = set(options['client']) - set(clients.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"No such client: {', '.join(map(str, sorted(missing)))}.")
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        exported = 0
+        for care_client_id in list(clients.order_by('id').values_list('id', flat=True)):
+            path = os.path.join(options['output_dir'], exporter.filename(care_client_id, options['format']))
+            with open(path, 'wb') as f:
+                for chunk in exporter.export_client(care_client_id, options['format']):
+                    f.write(chunk)
+            exported += 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {exported} care records to {options['output_dir']}."))
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.importer import FORMATS, NoteImporter, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk import client notes from a JSON Lines or CSV file, resuming from a checkpoint after a crash."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File with one note per row (care_client, note_text, optional created_at).")
+        parser.add_argument('--format', choices=FORMATS, help="Input format; guessed from the file extension by default.")
+        parser.add_argument('--user', required=True, help="Username recorded as the author of the imported notes.")
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--enrich', choices=['inline', 'queue', 'none'], default='queue',
+                            help="Analyse notes while importing, queue them for the workers, or skip analysis.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Notes analysed at once with --enrich inline.")
+        parser.add_argument('--checkpoint', help="Checkpoint file; defaults to <path>.checkpoint.")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').replace('ndjson', 'jsonl')
+        if fmt not in FORMATS:
+            raise CommandError(f"Cannot tell the format of '{path}'; pass --format.")
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        start_after = 0
+        if os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                start_after = json.load(f)['last_line']
+            self.stdout.write(f"Resuming after line {start_after}.")
+
+        started = time.perf_counter()
+
+        def on_chunk(report):
+            with open(checkpoint_path, 'w') as f:
+                json.dump({'last_line': report['last_line']}, f)
+            for error in report['errors'][self.reported_errors:]:
+                self.stderr.write(f"line {error['line']}: {error['error']}")
+            self.reported_errors = len(report['errors'])
+            rate = report['created'] / (time.perf_counter() - started)
+            self.stdout.write(
+                f"line {report['last_line']}: {report['created']} created, {report['enriched']} enriched, "
+                f"{len(report['errors'])} errors ({rate:.0f} notes/s)"
+            )
+
+        self.reported_errors = 0
+        importer = NoteImporter(
+            created_by=user,
+            chunk_size=options['chunk_size'],
+            enrich=options['enrich'],
+            concurrency=options['concurrency'],
+            on_chunk=on_chunk,
+        )
+        with open(path, 'rb') as stream:
+            report = importer.run(iter_rows(stream, fmt), start_after=start_after)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} notes ({report['enriched']} enriched, {report['queued']} queued for the "
+            f"analysis workers, {report['duplicates']} duplicates skipped) with {len(report['errors'])} errors."
+        ))
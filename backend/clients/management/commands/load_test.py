@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from clients import fake_llm, loadtest
+from clients.seed import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database, then drive concurrent requests (note creation, note lists, client notes, "
+        "note distribution) through the API against the fake LLM. Reports p50/p95/p99 latency, throughput and "
+        "queries per request, and fails if a saved baseline is missed by more than the tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--notes', type=int, default=50, help="Notes per client.")
+        parser.add_argument('--caregivers', type=int, default=10)
+        parser.add_argument('--requests', type=int, default=500, help="Requests to send in total.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once.")
+        parser.add_argument('--scenarios', nargs='+', choices=list(loadtest.SCENARIOS), default=list(loadtest.SCENARIOS))
+        parser.add_argument('--llm-latency', type=float, default=0.05, help="Fake model latency per call (median), in seconds.")
+        parser.add_argument('--llm-distribution', choices=fake_llm.LATENCY_DISTRIBUTIONS, default='lognormal')
+        parser.add_argument('--llm-spread', type=float, default=0.5, help="Uniform: +/- fraction; lognormal: sigma.")
+        parser.add_argument('--analysis-mode', choices=['sync', 'deferred'], default='sync')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', help="Compare with this saved report; exits non-zero on a regression.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed slowdown against the baseline, as a fraction; latency under load is noisy.")
+        parser.add_argument('--save-baseline', help="Save this run's report here.")
+
+    def handle(self, *args, **options):
+        baseline = loadtest.load_baseline(options['baseline']) if options['baseline'] else None
+        config = {key: options[key] for key in (
+            'clients', 'notes', 'caregivers', 'requests', 'concurrency', 'scenarios', 'llm_latency',
+            'llm_distribution', 'llm_spread', 'analysis_mode', 'seed',
+        )}
+
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # A file rather than the usual in-memory test database, so the request threads share it,
+                # in WAL mode with write transactions that take the lock up front, so they queue up
+                # instead of deadlocking.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'load_test.sqlite3')
+                connection.settings_dict['OPTIONS'].update(
+                    transaction_mode='IMMEDIATE', init_command='PRAGMA journal_mode=WAL;',
+                )
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+            try:
+                with override_settings(
+                    AI_ANALYSIS_BACKEND='fake', AI_CACHE_ENABLED=False, AI_ANALYSIS_MODE=options['analysis_mode'],
+                    FAKE_LLM_LATENCY=options['llm_latency'], FAKE_LLM_LATENCY_DISTRIBUTION=options['llm_distribution'],
+                    FAKE_LLM_LATENCY_SPREAD=options['llm_spread'], AI_SUMMARY_BACKGROUND_REFRESH=False,
+                    METRICS_LOG_REQUESTS=False,
+                ):
+                    report = self.run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"\n{'scenario':<18} {'requests':>8} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p99 ms':>9} {'req/s':>8} {'queries':>8}")
+        for name, row in report.items():
+            self.stdout.write(
+                f"{name:<18} {row['requests']:>8} {row['errors']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+                f"{row['p99_ms']:>9.1f} {row['throughput_rps']:>8.1f} {row['queries']:>8.1f}"
+            )
+
+        if options['save_baseline']:
+            loadtest.save_baseline(options['save_baseline'], report, config)
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}.")
+        if baseline is not None:
+            regressions = loadtest.compare(report, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def run(self, options):
+        self.stdout.write(
+            f"Seeding {options['clients']} clients x {options['notes']} notes, {options['caregivers']} caregivers "
+            f"on {connection.vendor}..."
+        )
+        caregivers, care_clients = seed_dataset(
+            options['clients'], options['notes'], options['caregivers'], seed=options['seed'],
+        )
+        fake_llm.seed_latency(options['seed'])
+        self.stdout.write(f"Sending {options['requests']} requests, {options['concurrency']} at a time...")
+        samples, wall_seconds = loadtest.run_load(
+            caregivers, care_clients, options['scenarios'], options['requests'], options['concurrency'], options['seed'],
+        )
+        return loadtest.summarise(samples, wall_seconds)
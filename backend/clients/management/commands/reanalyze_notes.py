@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.importer import enrich_notes
+from clients.pipeline import REANALYSIS_REASONS, notes_to_reanalyze
+
+
+class Command(BaseCommand):
+    help = ("Re-analyse notes whose AI fields failed, fell back, or came from an older prompt version, "
+            "in parallel batches, resuming from a checkpoint after a crash.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reason', choices=list(REANALYSIS_REASONS), action='append',
+                            help="Only notes needing it for this reason (repeatable); default all.")
+        parser.add_argument('--client', type=int, action='append', help="Only this client id (repeatable); default all.")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=4, help="Notes analysed at once.")
+        parser.add_argument('--limit', type=int, help="Stop after this many notes.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the notes that would be re-analysed.")
+        parser.add_argument('--checkpoint', help="Checkpoint file recording the last note id done.")
+        parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--batch-size and --concurrency must be at least 1.")
+        notes = notes_to_reanalyze(options['reason'])
+        if options['client']:
+            notes = notes.filter(care_client_id__in=options['client'])
+
+        checkpoint_path = options['checkpoint']
+        last_id = 0
+        if checkpoint_path and os.path.exists(checkpoint_path) and not options['restart']:
+            with open(checkpoint_path) as f:
+                last_id = json.load(f)['last_id']
+            self.stdout.write(f"Resuming after note {last_id}.")
+        notes = notes.filter(id__gt=last_id)
+
+        total = notes.count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+        if options['dry_run']:
+            for reason in options['reason'] or REANALYSIS_REASONS:
+                self.stdout.write(f"{reason}: {notes.filter(REANALYSIS_REASONS[reason]).count()}")
+            self.stdout.write(self.style.SUCCESS(f"{total} notes would be re-analysed."))
+            return
+
+        started = time.perf_counter()
+        done = enriched = 0
+        while done < total:
+            batch = list(notes.filter(id__gt=last_id).order_by('id')[:min(options['batch_size'], total - done)])
+            if not batch:
+                break
+            # Ask the model again rather than reuse a cached answer for the same text; store the new one.
+            enriched += enrich_notes(batch, options['concurrency'], refresh=True)
+            done += len(batch)
+            last_id = batch[-1].pk
+            if checkpoint_path:
+                with open(checkpoint_path, 'w') as f:
+                    json.dump({'last_id': last_id}, f)
+            elapsed = time.perf_counter() - started
+            rate = done / elapsed
+            self.stdout.write(
+                f"note {last_id}: {done}/{total} done, {enriched} re-analysed, {done - enriched} failed "
+                f"({rate:.1f} notes/s, {(total - done) / rate:.0f}s left)"
+            )
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-analysed {enriched} of {done} notes ({done - enriched} failed) "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clients import embeddings
+from clients.models import ClientNote, NoteEmbedding
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed notes for similarity search with the configured embedder (AI_EMBEDDING_BACKEND), "
+        "e.g. after changing it, and drop vectors made by other embedders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, action='append', help="Only this client's notes (repeatable).")
+        parser.add_argument('--missing', action='store_true', help="Only notes without a vector from this embedder.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        embedder = embeddings.get_embedder()
+        notes = ClientNote.objects.order_by('id')
+        if options['client']:
+            notes = notes.filter(care_client_id__in=options['client'])
+        if options['missing']:
+            notes = notes.exclude(embedding__model=embedder.name)
+
+        start = time.perf_counter()
+        embedded = 0
+        batch = []
+        for note in notes.only('id', 'note_text').iterator(chunk_size=options['batch_size']):
+            batch.append(note)
+            if len(batch) >= options['batch_size']:
+                embedded += embeddings.store_embeddings(batch, embedder)
+                batch = []
+        if batch:
+            embedded += embeddings.store_embeddings(batch, embedder)
+
+        if not options['client'] and not options['missing']:
+            NoteEmbedding.objects.exclude(model=embedder.name).delete()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Embedded {embedded} notes with {embedder.name} in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients import rollups, stats
+from clients.models import CareClient, ClientNoteStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-client note statistics and daily trend rollups from the notes table, "
+        "or verify the statistics against it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, action='append', help="Only this client id (repeatable).")
+        parser.add_argument('--verify', action='store_true', help="Compare stored statistics with a full scan without writing.")
+
+    def handle(self, *args, **options):
+        client_ids = options['client'] or CareClient.objects.values_list('id', flat=True).iterator()
+        checked = mismatched = 0
+
+        for care_client_id in client_ids:
+            checked += 1
+            if not options['verify']:
+                stats.rebuild(care_client_id)
+                rollups.rebuild(care_client_id)
+                continue
+
+            stored = ClientNoteStats.objects.filter(care_client_id=care_client_id).first()
+            if stored is None:
+                self.stdout.write(f"client {care_client_id}: no statistics row")
+                mismatched += 1
+                continue
+            problems = stats.differences(stored, stats.compute(care_client_id))
+            if problems:
+                mismatched += 1
+                self.stdout.write(f"client {care_client_id}: {'; '.join(problems)}")
+
+        if not options['verify']:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics and rollups for {checked} clients."))
+        elif mismatched:
+            raise CommandError(f"{mismatched} of {checked} clients have out-of-date statistics.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Statistics for all {checked} clients match the notes."))
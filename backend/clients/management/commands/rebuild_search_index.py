@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from clients import search
+from clients.models import ClientNote
+
+
+class Command(BaseCommand):
+    help = "Create the note search index if it is missing and, on SQLite, rebuild it from the notes table."
+
+    def handle(self, *args, **options):
+        using = router.db_for_write(ClientNote)
+        search.install(using=using)
+        if connections[using].vendor == 'postgresql':
+            self.stdout.write(self.style.SUCCESS("The PostgreSQL search index is maintained by the database."))
+            return
+        if not search.fts_available(using):
+            raise CommandError("SQLite FTS5 is not available; note search falls back to substring matching.")
+        search.rebuild(using)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {ClientNote.objects.using(using).count()} notes for search."))
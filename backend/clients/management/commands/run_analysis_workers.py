@@ -0,0 +1,49 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from clients.pipeline import run_worker
+
+
+def worker_main(batch_size, poll_interval, once):
+    # Each process opens its own database connections after the fork.
+    connections.close_all()
+    run_worker(batch_size=batch_size, poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = "Start a pool of worker processes that fill in the AI fields of queued client notes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Number of worker processes.")
+        parser.add_argument('--batch-size', type=int, default=None, help="Jobs claimed per worker per poll.")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        args = (options['batch_size'], options['poll_interval'], options['once'])
+
+        if options['workers'] <= 1:
+            processed = run_worker(*args)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} notes."))
+            return
+
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_main, args=args, name=f"analysis-worker-{i}")
+            for i in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} analysis workers.")
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS("Analysis workers stopped."))
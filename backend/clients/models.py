@@ -22,6 +22,13 @@ class NoteSentimentChoices(models.TextChoices):
     NEGATIVE = 'Negative', 'Negative'
     UNCATEGORISED = 'Uncategorised', 'Uncategorised'
 
+
+class AnalysisStatusChoices(models.TextChoices):
+    PENDING = 'Pending', 'Pending'
+    PROCESSING = 'Processing', 'Processing'
+    COMPLETE = 'Complete', 'Complete'
+    FAILED = 'Failed', 'Failed'
+
 # End Models choices ***********************************************************
 
 # Client information ***********************************************************
@@ -66,6 +73,14 @@ class CareClient(models.Model):
         verbose_name = "Care Client"
         verbose_name_plural = "Care Clients"
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Keyset pagination of the client list, optionally filtered by status
+            models.Index(fields=['last_name', 'first_name', 'id'], name='careclient_name_idx'),
+            models.Index(fields=['care_status', 'last_name', 'first_name', 'id'], name='careclient_status_name_idx'),
+            # A caregiver's caseload, optionally filtered by status, and paged by name (clients.access)
+            models.Index(fields=['assigned_caregiver', 'care_status'], name='careclient_carer_status_idx'),
+            models.Index(fields=['assigned_caregiver', 'last_name', 'first_name', 'id'], name='careclient_carer_name_idx'),
+        ]
 
 # End Client information ***********************************************************
 
@@ -79,6 +94,8 @@ class ClientNote(models.Model):
     ai_evaluated_notes = models.TextField(blank=True, null=True, help_text="The AI evaluated notes.")
     sentiment = models.CharField(max_length=20, choices=NoteSentimentChoices.choices, default=NoteSentimentChoices.UNCATEGORISED, help_text="The sentiment of the note (e.g., Positive, Neutral, Negative, Uncategorised).")
     emotion_tags = models.JSONField(blank=True, null=True, help_text="Tags for emotions detected in the note (e.g., {'happiness': 0.8, 'anxiety': 0.2}).")
+    analysis_status = models.CharField(max_length=20, choices=AnalysisStatusChoices.choices, default=AnalysisStatusChoices.PENDING, help_text="Progress of the AI analysis of this note.")
+    analysis_version = models.PositiveIntegerField(blank=True, null=True, help_text="Prompt version the AI fields were produced with (analysis.PROMPT_VERSION).")
 
     def __str__(self):
         return f"Note for {self.care_client} by {self.created_by} on {self.created_at:%Y-%m-%d}"
@@ -87,3 +104,145 @@ class ClientNote(models.Model):
         verbose_name = "Client Note"
         verbose_name_plural = "Client Notes"
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of all notes and of one client's notes, newest first
+            models.Index(fields=['-created_at', '-id'], name='clientnote_created_idx'),
+            models.Index(fields=['care_client', '-created_at', '-id'], name='clientnote_client_created_idx'),
+            # Per-client sentiment counts and sentiment filters
+            models.Index(fields=['care_client', 'sentiment'], name='clientnote_client_sent_idx'),
+            # Only the (few) notes still waiting for analysis, for backfills and monitoring
+            models.Index(fields=['id'], condition=models.Q(analysis_status='Pending'), name='clientnote_pending_idx'),
+        ]
+
+
+
+class ClientNoteStats(models.Model):
+    """
+    Running totals of a client's note sentiments and emotion scores, kept up to
+    date as notes change so analytics never have to scan the notes table.
+    """
+    care_client = models.OneToOneField(CareClient, on_delete=models.CASCADE, primary_key=True, related_name='note_stats')
+    note_count = models.PositiveIntegerField(default=0)
+    sentiment_counts = models.JSONField(default=dict, help_text="Number of notes per sentiment, e.g. {'Positive': 3}.")
+    emotion_sums = models.JSONField(default=dict, help_text="Sum of each emotion's score across notes, e.g. {'anxiety': 1.4}.")
+    analysis_summary = models.TextField(blank=True, default='', help_text="The last GPT analysis summary generated for this client.")
+    summary_fingerprint = models.CharField(max_length=64, blank=True, default='', help_text="Hash of the distributions the summary was generated from.")
+    summary_generated_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Note statistics for {self.care_client}"
+
+    class Meta:
+        verbose_name = "Client Note Statistics"
+        verbose_name_plural = "Client Note Statistics"
+
+
+class DailySentimentRollup(models.Model):
+    """Number of a client's notes with one sentiment on one day, for the trends endpoint."""
+    care_client = models.ForeignKey(CareClient, on_delete=models.CASCADE, related_name='sentiment_rollups')
+    day = models.DateField(help_text="Day the notes were written (in TIME_ZONE).")
+    sentiment = models.CharField(max_length=20, choices=NoteSentimentChoices.choices)
+    note_count = models.PositiveIntegerField(default=0)
+    flagged_count = models.PositiveIntegerField(default=0, help_text="How many of these notes' safeguarding evaluations raise a flag.")
+
+    def __str__(self):
+        return f"{self.sentiment} notes for {self.care_client} on {self.day}"
+
+    class Meta:
+        verbose_name = "Daily Sentiment Rollup"
+        verbose_name_plural = "Daily Sentiment Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['care_client', 'day', 'sentiment'], name='sentiment_rollup_unique'),
+        ]
+        indexes = [
+            # Organisation-wide trends
+            models.Index(fields=['day'], name='sentiment_rollup_day_idx'),
+        ]
+
+
+class DailyEmotionRollup(models.Model):
+    """Sum and count of one emotion's scores across a client's notes on one day."""
+    care_client = models.ForeignKey(CareClient, on_delete=models.CASCADE, related_name='emotion_rollups')
+    day = models.DateField(help_text="Day the notes were written (in TIME_ZONE).")
+    emotion = models.CharField(max_length=100)
+    score_sum = models.FloatField(default=0)
+    score_count = models.PositiveIntegerField(default=0, help_text="Number of notes the emotion was detected in.")
+    score_max = models.FloatField(default=0, help_text="Highest score of the emotion that day.")
+
+    def __str__(self):
+        return f"{self.emotion} for {self.care_client} on {self.day}"
+
+    class Meta:
+        verbose_name = "Daily Emotion Rollup"
+        verbose_name_plural = "Daily Emotion Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['care_client', 'day', 'emotion'], name='emotion_rollup_unique'),
+        ]
+        indexes = [
+            # Organisation-wide trends
+            models.Index(fields=['day'], name='emotion_rollup_day_idx'),
+        ]
+
+
+class NoteEmbedding(models.Model):
+    """A note's text embedding, for finding similar notes (see clients.embeddings)."""
+    note = models.OneToOneField(ClientNote, on_delete=models.CASCADE, primary_key=True, related_name='embedding')
+    model = models.CharField(max_length=200, help_text="Embedder that produced the vector; others' vectors are ignored.")
+    vector = models.BinaryField(help_text="L2-normalised float32 array.")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding of note {self.note_id}"
+
+    class Meta:
+        verbose_name = "Note Embedding"
+        verbose_name_plural = "Note Embeddings"
+        indexes = [
+            # Loading the index and picking up vectors written since it was loaded
+            models.Index(fields=['model', 'updated_at'], name='note_embedding_model_idx'),
+        ]
+
+# End Client Notes *****************************************************************
+
+# Analysis Queue *******************************************************************
+
+class AnalysisJob(models.Model):
+    """A note waiting for its AI fields to be filled in by an analysis worker."""
+    note = models.OneToOneField(ClientNote, on_delete=models.CASCADE, related_name='analysis_job', help_text="The note to analyse.")
+    attempts = models.PositiveIntegerField(default=0, help_text="Number of failed analysis attempts so far.")
+    available_at = models.DateTimeField(default=now, db_index=True, help_text="Earliest time a worker may pick up this job.")
+    locked_at = models.DateTimeField(blank=True, null=True, help_text="When a worker claimed this job.")
+    locked_by = models.CharField(max_length=100, blank=True, default='', help_text="Identifier of the worker holding this job.")
+    last_error = models.TextField(blank=True, default='', help_text="Error from the most recent failed attempt.")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Analysis job for note {self.note_id} (attempt {self.attempts + 1})"
+
+    class Meta:
+        verbose_name = "Analysis Job"
+        verbose_name_plural = "Analysis Jobs"
+        ordering = ['available_at', 'id']
+
+# End Analysis Queue ***************************************************************
+
+# Analysis Cache *******************************************************************
+
+class AnalysisCacheEntry(models.Model):
+    """AI analysis results keyed by a hash of the note text, prompt version and model."""
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the normalised note text, prompt version and model.")
+    result = models.JSONField(help_text="The AI fields produced for this text.")
+    hit_count = models.PositiveIntegerField(default=0, help_text="Number of times this entry has been reused.")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=now, db_index=True, help_text="Used for least-recently-used eviction.")
+    expires_at = models.DateTimeField(db_index=True, help_text="The entry is ignored and pruned after this time.")
+
+    def __str__(self):
+        return f"Analysis cache entry {self.key[:12]}"
+
+    class Meta:
+        verbose_name = "Analysis Cache Entry"
+        verbose_name_plural = "Analysis Cache Entries"
+
+# End Analysis Cache ***************************************************************
@@ -0,0 +1,77 @@
+"""
+Metrics of the note analysis, served with the request metrics at ``/metrics``
+(see ``backend.metrics``).
+
+``clients.analysis`` records every model call and every analysis of a note;
+the cache hit counters, queue depth and circuit state are read when the
+metrics are scraped.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db.models import Count, Q
+
+from backend import metrics
+
+MODEL_CALL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+MODEL_CALL_SECONDS = metrics.histogram(
+    'ai_model_call_seconds', "Latency of model calls, retries included.", ('kind', 'model', 'outcome'),
+    MODEL_CALL_BUCKETS,
+)
+MODEL_TOKENS = metrics.counter('ai_model_tokens_total', "Tokens used by model calls.", ('model', 'type'))
+ANALYSIS_SECONDS = metrics.histogram(
+    'ai_analysis_seconds', "Latency of each analysis of a note.", ('analysis', 'outcome'), MODEL_CALL_BUCKETS,
+)
+
+
+def record_model_call(kind, model, seconds, completion=None):
+    """Record a model call; ``completion`` is None if it failed."""
+    MODEL_CALL_SECONDS.observe(seconds, kind=kind, model=model, outcome='ok' if completion is not None else 'error')
+    usage = getattr(completion, 'usage', None)
+    tokens = 0
+    if usage is not None:
+        MODEL_TOKENS.inc(usage.prompt_tokens, model=model, type='prompt')
+        MODEL_TOKENS.inc(usage.completion_tokens, model=model, type='completion')
+        tokens = usage.total_tokens
+    request = metrics.current_request()
+    if request is not None:
+        request.add_model_call(seconds, tokens)
+
+
+@contextmanager
+def timed_analysis(analysis):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        ANALYSIS_SECONDS.observe(time.perf_counter() - start, analysis=analysis, outcome=outcome)
+
+
+# Scrape-time metrics *************************************************************
+
+def cache_lookups():
+    from . import cache
+    with cache._counters_lock:
+        return {('hit',): cache._counters['hits'], ('miss',): cache._counters['misses']}
+
+
+def queue_depth():
+    from .models import AnalysisJob
+    jobs = AnalysisJob.objects.aggregate(waiting=Count('pk', filter=Q(locked_at__isnull=True)), claimed=Count('locked_at'))
+    return {('waiting',): jobs['waiting'], ('claimed',): jobs['claimed']}
+
+
+def circuit_open():
+    from .resilience import get_guard
+    return int(get_guard().breaker.state != 'closed')
+
+
+metrics.collected('ai_analysis_cache_lookups_total', "Analysis cache lookups in this process.", cache_lookups,
+                  ('result',), type='counter')
+metrics.collected('ai_analysis_queue_jobs', "Notes queued for the analysis workers.", queue_depth, ('state',))
+metrics.collected('ai_circuit_open', "1 while the model provider's circuit breaker is open or half-open.", circuit_open)
+
+# End Scrape-time metrics **********************************************************
@@ -0,0 +1,187 @@
+"""
+Deferred note enrichment.
+
+With ``AI_ANALYSIS_MODE = 'deferred'`` a note is saved immediately with its
+AI fields pending and an ``AnalysisJob`` row is queued for it. Workers started
+with ``manage.py run_analysis_workers`` claim jobs from the table, run the
+analyses and fill in the note (then embed it, see ``clients.embeddings``),
+retrying failures with exponential backoff.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .analysis import PROMPT_VERSION, SAFEGUARDING_FALLBACK, SENTIMENT_FALLBACK, analyze_note, completed_fields
+from .embeddings import embed_notes
+from .resilience import CircuitOpenError
+from .models import AnalysisJob, AnalysisStatusChoices, ClientNote
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+def is_deferred():
+    return settings.AI_ANALYSIS_MODE == 'deferred'
+
+
+def enqueue_analysis(note):
+    """Mark ``note`` as pending and queue it for the analysis workers."""
+    with transaction.atomic():
+        ClientNote.objects.filter(pk=note.pk).update(analysis_status=AnalysisStatusChoices.PENDING)
+        AnalysisJob.objects.update_or_create(
+            note=note,
+            defaults={'attempts': 0, 'available_at': now(), 'locked_at': None, 'locked_by': '', 'last_error': ''},
+        )
+    note.analysis_status = AnalysisStatusChoices.PENDING
+
+
+# Why a note's AI fields need producing again (``manage.py reanalyze_notes``).
+REANALYSIS_REASONS = {
+    'failed': Q(analysis_status=AnalysisStatusChoices.FAILED),
+    'outdated': Q(analysis_status=AnalysisStatusChoices.COMPLETE) & (
+        Q(analysis_version__isnull=True) | Q(analysis_version__lt=PROMPT_VERSION)
+    ),
+    'fallback': Q(analysis_status=AnalysisStatusChoices.COMPLETE) & (
+        # An empty emotion map is also a genuine result, so only missing tags count.
+        Q(sentiment=SENTIMENT_FALLBACK) | Q(emotion_tags__isnull=True) | Q(ai_evaluated_notes=SAFEGUARDING_FALLBACK)
+    ),
+}
+
+
+def notes_to_reanalyze(reasons=None):
+    """
+    Notes for any of ``reasons`` (default all): analysis gave up, ran with an
+    older prompt version, or saved a fallback. Notes still queued for the
+    workers are theirs.
+    """
+    condition = Q()
+    for reason in reasons or REANALYSIS_REASONS:
+        condition |= REANALYSIS_REASONS[reason]
+    return ClientNote.objects.filter(condition, analysis_job__isnull=True)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_jobs(worker, limit):
+    """
+    Lock up to ``limit`` due jobs for ``worker`` and return them.
+
+    Jobs whose lock is older than ``AI_QUEUE_LOCK_TIMEOUT`` are treated as
+    abandoned by a crashed worker and can be claimed again. The conditional
+    UPDATE makes claiming safe on databases without ``SKIP LOCKED``.
+    """
+    claimed_at = now()
+    claimable = Q(locked_at__isnull=True) | Q(locked_at__lt=claimed_at - timedelta(seconds=settings.AI_QUEUE_LOCK_TIMEOUT))
+
+    with transaction.atomic():
+        due = AnalysisJob.objects.filter(claimable, available_at__lte=claimed_at)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        job_ids = list(due.values_list('id', flat=True)[:limit])
+        AnalysisJob.objects.filter(claimable, id__in=job_ids).update(locked_at=claimed_at, locked_by=worker)
+
+    jobs = list(AnalysisJob.objects.select_related('note').filter(locked_by=worker, locked_at=claimed_at))
+    ClientNote.objects.filter(analysis_job__in=jobs).update(analysis_status=AnalysisStatusChoices.PROCESSING)
+    return jobs
+
+
+def process_job(job):
+    """
+    Analyse the job's note; on failure reschedule the job or give up on it.
+    The result is dropped if the note's text or analysis changed while the
+    model was working (an edit, or a synchronous re-analysis).
+    """
+    note = job.note
+    try:
+        results = analyze_note(note.note_text, fallback=False)
+    except Exception as e:
+        fail_job(job, e)
+        return False
+
+    with transaction.atomic():
+        # The note may have been edited (and re-queued) while we were working.
+        if not AnalysisJob.objects.filter(pk=job.pk, locked_by=job.locked_by, locked_at=job.locked_at).exists():
+            return False
+        # Locked until the save, so nothing can change it between the comparison and the write.
+        current = (ClientNote.objects.select_for_update().filter(pk=note.pk)
+                   .values_list('note_text', 'analysis_version').first())
+        if current != (note.note_text, note.analysis_version):
+            logger.info(f"Note {note.pk} changed during its analysis; dropping the stale result")
+            job.delete()
+            return False
+        fields = completed_fields(results)
+        for field, value in fields.items():
+            setattr(note, field, value)
+        note.save(update_fields=list(fields))
+        job.delete()
+    embed_notes([note])
+    return True
+
+
+def fail_job(job, error):
+    retry_in = circuit_retry_in(error)
+    if retry_in is not None:
+        # The provider is being given a rest; wait for it without using up the note's attempts.
+        AnalysisJob.objects.filter(pk=job.pk).update(
+            available_at=now() + timedelta(seconds=max(retry_in, settings.AI_QUEUE_POLL_INTERVAL)),
+            locked_at=None,
+            locked_by='',
+            last_error=str(error),
+        )
+        ClientNote.objects.filter(pk=job.note_id).update(analysis_status=AnalysisStatusChoices.PENDING)
+        return
+
+    attempts = job.attempts + 1
+    logger.warning(f"Analysis of note {job.note_id} failed (attempt {attempts}): {error}")
+
+    if attempts >= settings.AI_QUEUE_MAX_ATTEMPTS:
+        with transaction.atomic():
+            ClientNote.objects.filter(pk=job.note_id).update(analysis_status=AnalysisStatusChoices.FAILED)
+            job.delete()
+        logger.error(f"Giving up on analysis of note {job.note_id} after {attempts} attempts")
+        return
+
+    delay = settings.AI_QUEUE_RETRY_BACKOFF * 2 ** (attempts - 1)
+    AnalysisJob.objects.filter(pk=job.pk).update(
+        attempts=attempts,
+        available_at=now() + timedelta(seconds=delay),
+        locked_at=None,
+        locked_by='',
+        last_error=str(error),
+    )
+    ClientNote.objects.filter(pk=job.note_id).update(analysis_status=AnalysisStatusChoices.PENDING)
+
+
+def circuit_retry_in(error):
+    """If ``error`` is only the provider's circuit being open, seconds until it lets calls through; else None."""
+    errors = list(getattr(error, 'errors', {}).values()) or [error]
+    if all(isinstance(e, CircuitOpenError) for e in errors):
+        return max(e.retry_in for e in errors)
+    return None
+
+
+def run_worker(batch_size=None, poll_interval=None, once=False):
+    """Drain the analysis queue until interrupted (or until it is empty with ``once``)."""
+    batch_size = batch_size or settings.AI_QUEUE_BATCH_SIZE
+    poll_interval = poll_interval if poll_interval is not None else settings.AI_QUEUE_POLL_INTERVAL
+    worker = worker_id()
+    processed = 0
+
+    while True:
+        jobs = claim_jobs(worker, batch_size)
+        if not jobs:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        for job in jobs:
+            processed += process_job(job)
@@ -0,0 +1,263 @@
+"""
+Model providers behind the note analysis.
+
+``clients.analysis`` sends every completion, streamed or not, through the
+``AnalysisProvider`` named by ``AI_ANALYSIS_BACKEND``:
+
+- ``openai``: the OpenAI API, or any OpenAI-compatible server, at
+  ``OPEN_AI_BASE_URL``.
+- ``azure``: Azure OpenAI, with ``OPEN_AI_BASE_URL`` as the resource endpoint
+  and the model name as the deployment.
+- ``fake``: the deterministic local stand-in in ``clients.fake_llm``; no
+  network, for tests, benchmarks and offline development.
+
+The HTTP providers keep one pooled httpx client per process (and one async
+client per event loop), so calls reuse keep-alive connections instead of
+paying a TLS handshake each, and send the API key as a per-request header
+rather than through process-global state. Responses are attribute-access
+objects shaped like the OpenAI SDK's, so callers read
+``completion.choices[0].message.content`` whichever provider answered.
+"""
+import asyncio
+import json
+import threading
+import weakref
+from types import SimpleNamespace
+
+import httpx
+from django.conf import settings
+
+
+class ProviderError(Exception):
+    """A model call failed. ``status`` and ``headers`` are set for HTTP errors."""
+
+    def __init__(self, message, status=None, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class RateLimitError(ProviderError):
+    pass
+
+
+class ServiceUnavailableError(ProviderError):
+    pass
+
+
+class APIConnectionError(ProviderError):
+    pass
+
+
+class Timeout(ProviderError):
+    pass
+
+
+def to_object(value):
+    """JSON data as nested objects with attribute access."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [to_object(item) for item in value]
+    return value
+
+
+class AnalysisProvider:
+    """
+    A source of model completions. Arguments follow the OpenAI completion
+    APIs: ``model`` (``engine`` for text completions), ``request_timeout`` in
+    seconds, and any other request parameters as keywords.
+    """
+    name = None
+
+    def chat_completion(self, messages, model, request_timeout=None, **params):
+        raise NotImplementedError
+
+    def text_completion(self, prompt, engine, request_timeout=None, **params):
+        raise NotImplementedError
+
+    async def stream_chat_completion(self, messages, model, request_timeout=None, **params):
+        """Async iterator of completion chunks (``chunk.choices[0].delta.content``)."""
+        raise NotImplementedError
+        yield
+
+    async def stream_text_completion(self, prompt, engine, request_timeout=None, **params):
+        """Async iterator of completion chunks (``chunk.choices[0].text``)."""
+        raise NotImplementedError
+        yield
+
+    def close(self):
+        pass
+
+
+class FakeProvider(AnalysisProvider):
+    name = 'fake'
+
+    def chat_completion(self, messages, model, request_timeout=None, **params):
+        from .fake_llm import FakeChatCompletion
+        return FakeChatCompletion.create(messages=messages, model=model, **params)
+
+    def text_completion(self, prompt, engine, request_timeout=None, **params):
+        from .fake_llm import FakeCompletion
+        return FakeCompletion.create(prompt=prompt, engine=engine, **params)
+
+    async def stream_chat_completion(self, messages, model, request_timeout=None, **params):
+        from .fake_llm import FakeChatCompletion
+        async for chunk in await FakeChatCompletion.acreate(messages=messages, model=model, **params):
+            yield chunk
+
+    async def stream_text_completion(self, prompt, engine, request_timeout=None, **params):
+        from .fake_llm import FakeCompletion
+        async for chunk in await FakeCompletion.acreate(prompt=prompt, engine=engine, **params):
+            yield chunk
+
+
+class OpenAIProvider(AnalysisProvider):
+    """The OpenAI REST API, or a compatible one, over pooled keep-alive connections."""
+    name = 'openai'
+
+    def __init__(self, api_key, base_url, max_connections=20, keepalive_expiry=30.0, transport=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # Only for tests: an httpx.MockTransport / AsyncBaseTransport answering instead of the network.
+        self.transport = transport
+        self.client = httpx.Client(limits=self.limits, transport=transport)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def url(self, path, model):
+        return f"{self.base_url}/{path}"
+
+    def headers(self):
+        return {'Authorization': f"Bearer {self.api_key}"}
+
+    def query(self):
+        return None
+
+    def body(self, model, **fields):
+        return {'model': model, **fields}
+
+    def async_client(self):
+        """The async client of the running event loop; connections can't be shared between loops."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, transport=self.transport)
+            self._async_clients[loop] = client
+        return client
+
+    def chat_completion(self, messages, model, request_timeout=None, **params):
+        return self._post('chat/completions', model, request_timeout, self.body(model, messages=messages, **params))
+
+    def text_completion(self, prompt, engine, request_timeout=None, **params):
+        return self._post('completions', engine, request_timeout, self.body(engine, prompt=prompt, **params))
+
+    async def stream_chat_completion(self, messages, model, request_timeout=None, **params):
+        body = self.body(model, messages=messages, stream=True, **params)
+        async for chunk in self._stream('chat/completions', model, request_timeout, body):
+            yield chunk
+
+    async def stream_text_completion(self, prompt, engine, request_timeout=None, **params):
+        body = self.body(engine, prompt=prompt, stream=True, **params)
+        async for chunk in self._stream('completions', engine, request_timeout, body):
+            yield chunk
+
+    def _post(self, path, model, timeout, body):
+        try:
+            response = self.client.post(
+                self.url(path, model), params=self.query(), headers=self.headers(), json=body, timeout=timeout,
+            )
+        except httpx.TimeoutException as e:
+            raise Timeout(f"Request timed out: {e}") from e
+        except httpx.TransportError as e:
+            raise APIConnectionError(f"Error communicating with the model provider: {e}") from e
+        if response.status_code != 200:
+            raise error_for(response.status_code, response.headers, response.text)
+        return to_object(response.json())
+
+    async def _stream(self, path, model, timeout, body):
+        request = self.async_client().stream(
+            'POST', self.url(path, model), params=self.query(), headers=self.headers(), json=body, timeout=timeout,
+        )
+        try:
+            async with request as response:
+                if response.status_code != 200:
+                    raise error_for(response.status_code, response.headers, (await response.aread()).decode())
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        return
+                    yield to_object(json.loads(data))
+        except httpx.TimeoutException as e:
+            raise Timeout(f"Request timed out: {e}") from e
+        except httpx.TransportError as e:
+            raise APIConnectionError(f"Error communicating with the model provider: {e}") from e
+
+    def close(self):
+        self.client.close()
+
+
+class AzureOpenAIProvider(OpenAIProvider):
+    """Azure OpenAI: the model names a deployment of the resource at ``base_url``."""
+    name = 'azure'
+
+    def __init__(self, api_key, base_url, api_version, **kwargs):
+        super().__init__(api_key, base_url, **kwargs)
+        self.api_version = api_version
+
+    def url(self, path, model):
+        return f"{self.base_url}/openai/deployments/{model}/{path}"
+
+    def headers(self):
+        return {'api-key': self.api_key}
+
+    def query(self):
+        return {'api-version': self.api_version}
+
+    def body(self, model, **fields):
+        # The deployment in the URL picks the model.
+        return fields
+
+
+def error_for(status, headers, text):
+    message = f"Model provider returned HTTP {status}: {text[:500]}"
+    if status == 429:
+        return RateLimitError(message, status, headers)
+    if status >= 500:
+        return ServiceUnavailableError(message, status, headers)
+    return ProviderError(message, status, headers)
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider():
+    """The process's provider for the current settings (created on first use)."""
+    backend = settings.AI_ANALYSIS_BACKEND
+    key = (backend, settings.OPEN_AI_API, settings.OPEN_AI_BASE_URL, settings.AZURE_OPENAI_API_VERSION,
+           settings.AI_HTTP_MAX_CONNECTIONS, settings.AI_HTTP_KEEPALIVE_EXPIRY)
+    provider = _providers.get(key)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(key)
+            if provider is None:
+                provider = _providers[key] = build_provider(backend)
+    return provider
+
+
+def build_provider(backend):
+    pool = {'max_connections': settings.AI_HTTP_MAX_CONNECTIONS, 'keepalive_expiry': settings.AI_HTTP_KEEPALIVE_EXPIRY}
+    if backend == 'fake':
+        return FakeProvider()
+    if backend == 'openai':
+        return OpenAIProvider(settings.OPEN_AI_API, settings.OPEN_AI_BASE_URL, **pool)
+    if backend == 'azure':
+        return AzureOpenAIProvider(settings.OPEN_AI_API, settings.OPEN_AI_BASE_URL,
+                                   settings.AZURE_OPENAI_API_VERSION, **pool)
+    raise ValueError(f"Unknown AI_ANALYSIS_BACKEND {backend!r}")
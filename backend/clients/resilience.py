@@ -0,0 +1,242 @@
+"""
+Client-side protection for model calls.
+
+Every completion in ``clients.analysis`` goes through ``guarded_call`` (or
+``guarded_stream``):
+
+- A token-bucket ``RateLimiter`` keeps this process within
+  ``AI_RATE_LIMIT_RPM`` requests and ``AI_RATE_LIMIT_TPM`` tokens per minute
+  (0 for no limit), waiting for capacity instead of provoking 429s. Tokens are
+  estimated before the call and corrected from the response's usage.
+- Transient failures (throttling, 5xx, connection errors, timeouts) are
+  retried with full-jitter exponential backoff, honouring ``Retry-After``,
+  but only within the call's ``request_timeout``: that is the longest a
+  request thread waits in total, however many attempts it takes.
+- A ``CircuitBreaker`` opens after ``AI_BREAKER_FAILURE_THRESHOLD``
+  consecutive failed attempts and then fails fast with ``CircuitOpenError``
+  for ``AI_BREAKER_RESET_TIMEOUT`` seconds, after which a single trial call
+  decides whether it closes again. Meanwhile notes are left to the analysis
+  queue (see ``ClientNoteSerializer`` and ``pipeline.fail_job``).
+
+The limiter and breaker belong to the process and are shared by its threads,
+so the budgets should be the provider account's limits divided by the number
+of processes calling it.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from .providers import APIConnectionError, ProviderError, RateLimitError, ServiceUnavailableError, Timeout
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# Provider failures worth retrying, and counted against the provider's health.
+TRANSIENT_ERRORS = (RateLimitError, ServiceUnavailableError, APIConnectionError, Timeout)
+
+# Completion tokens assumed for a call that doesn't set max_tokens.
+DEFAULT_COMPLETION_TOKENS = 500
+
+
+class CircuitOpenError(ProviderError):
+    """The provider is considered unhealthy; no call was made."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Model provider circuit is open; retrying in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class BudgetExhausted(RateLimitError):
+    """The local rate limit would not allow the call before its deadline; no call was made."""
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_for(self, amount, now):
+        """Seconds until ``amount`` is available (a request over the whole budget waits for a full bucket)."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets, as token buckets."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens, deadline):
+        """
+        Take one request and ``tokens`` tokens if they are available now and
+        return 0, or return how long to wait before trying again. Raises
+        ``BudgetExhausted`` if that would be after ``deadline``.
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.wait_for(1, now) if self.requests else 0.0,
+                self.tokens.wait_for(tokens, now) if self.tokens else 0.0,
+            )
+            if wait == 0:
+                if self.requests:
+                    self.requests.level -= 1
+                if self.tokens:
+                    self.tokens.level -= tokens
+                return 0.0
+        if now + wait > deadline:
+            raise BudgetExhausted(f"Rate limit budget exhausted for {wait:.1f}s")
+        return wait
+
+    def acquire(self, tokens, deadline):
+        while wait := self.reserve(tokens, deadline):
+            time.sleep(wait)
+
+    async def aacquire(self, tokens, deadline):
+        while wait := self.reserve(tokens, deadline):
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated, actual):
+        """Correct a reservation of ``estimated`` tokens to what the call really used."""
+        if self.tokens:
+            with self.lock:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+
+
+class CircuitBreaker:
+    """Closed, open, or half-open with one trial call in flight."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.state == 'closed':
+                return
+            retry_in = self.retry_in()
+            if retry_in > 0:
+                raise CircuitOpenError(retry_in)
+            # Open for long enough, or a trial call that never reported back: let one (more) through.
+            self.state, self.opened_at = 'half-open', time.monotonic()
+            logger.info("Model provider circuit half-open; sending a trial call")
+
+    def retry_in(self):
+        if self.state == 'closed':
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                logger.info("Model provider circuit closed")
+            self.state, self.failures = 'closed', 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half-open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                logger.error(f"Model provider circuit open after {self.failures} failures")
+                self.state, self.opened_at = 'open', time.monotonic()
+
+
+class Guard:
+    def __init__(self):
+        self.limiter = RateLimiter(settings.AI_RATE_LIMIT_RPM, settings.AI_RATE_LIMIT_TPM)
+        self.breaker = CircuitBreaker(settings.AI_BREAKER_FAILURE_THRESHOLD, settings.AI_BREAKER_RESET_TIMEOUT)
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard():
+    """The process's limiter and breaker for the current provider settings."""
+    key = (settings.AI_ANALYSIS_BACKEND, settings.AI_RATE_LIMIT_RPM, settings.AI_RATE_LIMIT_TPM,
+           settings.AI_BREAKER_FAILURE_THRESHOLD, settings.AI_BREAKER_RESET_TIMEOUT)
+    with _guards_lock:
+        if key not in _guards:
+            _guards[key] = Guard()
+        return _guards[key]
+
+
+def estimate_tokens(prompt, max_tokens=None):
+    return max(1, len(prompt) // 4) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def backoff(attempt, error=None):
+    """Full-jitter exponential backoff, or the provider's ``Retry-After`` if it sent one."""
+    try:
+        return float(getattr(error, 'headers', {}).get('retry-after'))
+    except (TypeError, ValueError):
+        pass
+    return random.uniform(0, min(settings.AI_RETRY_MAX_BACKOFF, settings.AI_RETRY_BACKOFF * 2 ** attempt))
+
+
+def guarded_call(send, prompt, max_tokens=None, timeout=None):
+    """
+    ``send(timeout)`` under the rate limit, retries and circuit breaker, all
+    within ``timeout`` seconds; ``send`` gets the time left for its attempt.
+    """
+    guard = get_guard()
+    timeout = settings.AI_ANALYSIS_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    estimated = estimate_tokens(prompt, max_tokens)
+    attempt = 0
+    while True:
+        guard.breaker.before_call()
+        guard.limiter.acquire(estimated, deadline)
+        try:
+            completion = send(max(0.1, deadline - time.monotonic()))
+        except TRANSIENT_ERRORS as e:
+            guard.limiter.settle(estimated, 0)
+            guard.breaker.record_failure()
+            attempt += 1
+            delay = backoff(attempt - 1, e)
+            if attempt >= settings.AI_RETRY_MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+                raise
+            logger.warning(f"Model call failed ({e}); retry {attempt} in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        except ProviderError:
+            # The provider answered, it just didn't like the request.
+            guard.breaker.record_success()
+            raise
+
+        guard.breaker.record_success()
+        usage = getattr(completion, 'usage', None)
+        if usage is not None:
+            guard.limiter.settle(estimated, usage.total_tokens)
+        return completion
+
+
+async def guarded_stream(chunks, prompt, max_tokens=None, timeout=None):
+    """
+    Relay an async iterator of chunks under the rate limit and circuit
+    breaker. Not retried: the caller may already have relayed chunks.
+    """
+    guard = get_guard()
+    timeout = settings.AI_ANALYSIS_TIMEOUT if timeout is None else timeout
+    guard.breaker.before_call()
+    await guard.limiter.aacquire(estimate_tokens(prompt, max_tokens), time.monotonic() + timeout)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except TRANSIENT_ERRORS:
+        guard.breaker.record_failure()
+        raise
+    guard.breaker.record_success()
@@ -0,0 +1,168 @@
+"""
+Daily rollups behind the trends endpoint.
+
+For every client and day with notes there is one ``DailySentimentRollup`` row
+per sentiment and one ``DailyEmotionRollup`` row per detected emotion. When
+notes change, only the affected client-days are recomputed from their notes
+(see ``clients.signals`` and the importer), so the rows are always exact and
+a trend over a year reads at most a few thousand small rows, bucketed with
+``Trunc`` in the database. The same rows rank clients for the risk dashboard.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, FilteredRelation, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf, Trunc, TruncDate
+from django.utils.timezone import localdate, make_aware
+
+from . import stats
+from .models import CareClient, ClientNote, DailyEmotionRollup, DailySentimentRollup, NoteSentimentChoices
+
+INTERVALS = ('day', 'week', 'month')
+
+# Safeguarding evaluations (ai_evaluated_notes) that count as a flag on the risk dashboard.
+# Deliberately narrow: the evaluations routinely mention abuse and neglect in passing.
+SAFEGUARDING_FLAG_PATTERN = r'self[- ]?harm|suicid|overdos|harm (him|her|them)self'
+FLAGGED = Count('id', filter=Q(ai_evaluated_notes__iregex=SAFEGUARDING_FLAG_PATTERN))
+
+# Emotions whose peak score ranks a client on the risk dashboard.
+RISK_EMOTIONS = ('hopelessness', 'helplessness', 'depression', 'fear', 'loneliness')
+
+EMOTION_MAX_LENGTH = DailyEmotionRollup._meta.get_field('emotion').max_length
+
+
+def key_of(care_client_id, created_at):
+    """The (client, day) a note with these values is rolled up into."""
+    return care_client_id, localdate(created_at)
+
+
+def refresh(keys):
+    """Recompute the rollup rows of each ``(care_client_id, day)`` in ``keys`` from that day's notes."""
+    for care_client_id, day in sorted(set(keys)):
+        start = make_aware(datetime.combine(day, time.min))
+        with transaction.atomic():
+            # Serialises refreshes of the same client, so their delete-and-insert can't interleave.
+            if CareClient.objects.select_for_update().filter(pk=care_client_id).first() is None:
+                continue
+            notes = ClientNote.objects.filter(
+                care_client_id=care_client_id, created_at__gte=start, created_at__lt=start + timedelta(days=1),
+            )
+            sentiments = list(notes.order_by().values_list('sentiment').annotate(count=Count('id'), flagged=FLAGGED))
+            emotions = stats.emotion_aggregates(notes)
+
+            DailySentimentRollup.objects.filter(care_client_id=care_client_id, day=day).delete()
+            DailyEmotionRollup.objects.filter(care_client_id=care_client_id, day=day).delete()
+            DailySentimentRollup.objects.bulk_create([
+                DailySentimentRollup(care_client_id=care_client_id, day=day, sentiment=sentiment,
+                                     note_count=count, flagged_count=flagged)
+                for sentiment, count, flagged in sentiments
+            ])
+            DailyEmotionRollup.objects.bulk_create([
+                DailyEmotionRollup(care_client_id=care_client_id, day=day, emotion=emotion,
+                                   score_sum=values['sum'], score_count=values['count'], score_max=values['max'])
+                for emotion, values in emotions.items() if len(emotion) <= EMOTION_MAX_LENGTH
+            ])
+
+
+def rebuild(care_client_id):
+    """
+    Recompute all of a client's rollups, e.g. after notes were written with
+    ``bulk_create``: one GROUP BY for sentiments and one pass over the
+    ``emotion_tags`` column instead of a refresh per day.
+    """
+    notes = ClientNote.objects.filter(care_client_id=care_client_id).order_by()
+    with transaction.atomic():
+        sentiments = list(notes.annotate(day=TruncDate('created_at'))
+                          .values_list('day', 'sentiment').annotate(count=Count('id'), flagged=FLAGGED))
+        emotions = defaultdict(lambda: [0.0, 0, 0.0])
+        for created_at, emotion_tags in notes.values_list('created_at', 'emotion_tags').iterator(chunk_size=2000):
+            if isinstance(emotion_tags, dict):
+                for emotion, score in emotion_tags.items():
+                    if stats.is_score(score) and len(emotion) <= EMOTION_MAX_LENGTH:
+                        totals = emotions[localdate(created_at), emotion]
+                        totals[0] += score
+                        totals[1] += 1
+                        totals[2] = max(totals[2], score)
+
+        DailySentimentRollup.objects.filter(care_client_id=care_client_id).delete()
+        DailyEmotionRollup.objects.filter(care_client_id=care_client_id).delete()
+        DailySentimentRollup.objects.bulk_create([
+            DailySentimentRollup(care_client_id=care_client_id, day=day, sentiment=sentiment,
+                                 note_count=count, flagged_count=flagged)
+            for day, sentiment, count, flagged in sentiments
+        ], batch_size=2000)
+        DailyEmotionRollup.objects.bulk_create([
+            DailyEmotionRollup(care_client_id=care_client_id, day=day, emotion=emotion,
+                               score_sum=score_sum, score_count=score_count, score_max=score_max)
+            for (day, emotion), (score_sum, score_count, score_max) in emotions.items()
+        ], batch_size=2000)
+
+
+def trends(interval, start, end, care_client_id=None, caregiver_id=None, caregiver_ids=None):
+    """
+    Per-``interval`` buckets of sentiment counts and mean emotion scores for
+    the notes written between ``start`` and ``end`` (inclusive dates), for one
+    client, one caregiver's clients or (with neither) the whole organisation.
+    ``caregiver_ids`` limits any of these to those caregivers' clients.
+    """
+    scope = Q(day__gte=start, day__lte=end)
+    if care_client_id is not None:
+        scope &= Q(care_client_id=care_client_id)
+    if caregiver_id is not None:
+        scope &= Q(care_client__assigned_caregiver_id=caregiver_id)
+    if caregiver_ids is not None:
+        scope &= Q(care_client__assigned_caregiver_id__in=caregiver_ids)
+    period = Trunc('day', interval, output_field=DateField())
+
+    buckets = {}
+
+    def bucket(day):
+        return buckets.setdefault(day, {'period': day, 'note_count': 0, 'sentiments': {}, 'emotions': {}})
+
+    sentiment_rows = (DailySentimentRollup.objects.filter(scope).annotate(period=period)
+                      .values('period', 'sentiment').annotate(count=Sum('note_count')).order_by())
+    for row in sentiment_rows:
+        entry = bucket(row['period'])
+        entry['sentiments'][row['sentiment']] = row['count']
+        entry['note_count'] += row['count']
+
+    emotion_rows = (DailyEmotionRollup.objects.filter(scope).annotate(period=period)
+                    .values('period', 'emotion').annotate(total=Sum('score_sum'), notes=Sum('score_count')).order_by())
+    for row in emotion_rows:
+        bucket(row['period'])['emotions'][row['emotion']] = {
+            'mean': round(row['total'] / row['notes'], 4), 'notes': row['notes'],
+        }
+
+    return [buckets[day] for day in sorted(buckets)]
+
+
+def risk_ranking(since, clients=None):
+    """
+    ``clients`` (default: all) annotated with their note figures since the
+    ``since`` date and ordered most at-risk first: by share of negative notes,
+    then peak risk-emotion score, then safeguarding flags. One query over the
+    rollups, with the peak emotion as a correlated subquery so the two rollup
+    tables aren't joined into each other. The window is part of the join
+    condition, so only the recent rollup rows are joined (clients without any
+    still get a row of zeros).
+    """
+    clients = CareClient.objects.all() if clients is None else clients
+    peaks = (DailyEmotionRollup.objects
+             .filter(care_client=OuterRef('pk'), day__gte=since, emotion__in=RISK_EMOTIONS)
+             .order_by('-score_max', 'emotion'))
+
+    return (clients
+            .annotate(recent=FilteredRelation('sentiment_rollups', condition=Q(sentiment_rollups__day__gte=since)))
+            .annotate(
+                recent_notes=Coalesce(Sum('recent__note_count'), 0),
+                negative_notes=Coalesce(Sum('recent__note_count', filter=Q(
+                    recent__sentiment=NoteSentimentChoices.NEGATIVE)), 0),
+                flagged_notes=Coalesce(Sum('recent__flagged_count'), 0),
+                peak_emotion=Subquery(peaks.values('emotion')[:1]),
+                peak_emotion_score=Coalesce(Subquery(peaks.values('score_max')[:1]), 0.0),
+            )
+            .annotate(negative_ratio=Coalesce(
+                Cast(F('negative_notes'), FloatField()) / NullIf(F('recent_notes'), 0), 0.0,
+            ))
+            .order_by('-negative_ratio', '-peak_emotion_score', '-flagged_notes', 'id'))
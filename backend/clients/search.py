@@ -0,0 +1,232 @@
+"""
+Full-text search over note text and safeguarding evaluations.
+
+PostgreSQL: a stored generated ``tsvector`` column (``search_document``,
+``to_tsvector('english', note_text || ' ' || ai_evaluated_notes)``) that
+PostgreSQL recomputes when a note is written, with a GIN index on it; queries
+match and rank (``websearch_to_tsquery``, ``ts_rank_cd``) against the column,
+so no row's vector is rebuilt at read time, and only ``ts_headline`` reads
+the text, for the page being returned.
+
+SQLite: an FTS5 table (``clients_clientnote_fts``, rowid = note id) with the
+porter stemmer, kept in step with the notes by ``clients.signals`` and by the
+bulk write paths; queries rank with ``bm25`` and highlight with ``snippet``.
+
+Both are created after ``migrate`` (see ``install``). Other backends fall
+back to an unranked substring search. Either way a search is two queries:
+the ranked page of note ids, then highlights for just that page.
+"""
+import html
+import logging
+import re
+
+from django.db import OperationalError, connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import ClientNote
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'clients_clientnote_fts'
+DOCUMENT_COLUMN = 'search_document'
+GIN_INDEX = 'clientnote_document_gin_idx'
+# The expression index used before the stored column; dropped by ``install``.
+EXPRESSION_GIN_INDEX = 'clientnote_search_gin_idx'
+SEARCH_CONFIG = 'english'
+
+# Markers placed around matches by the database, swapped for <mark> after escaping the text.
+START, STOP = '\x02', '\x03'
+
+_fts_available = {}
+
+
+# Index maintenance *************************************************************
+
+def search_document():
+    """The stored ``search_document`` column, which the model does not declare (it only exists on PostgreSQL)."""
+    from django.contrib.postgres.search import SearchVectorField
+    return RawSQL(f'"{ClientNote._meta.db_table}"."{DOCUMENT_COLUMN}"', [], output_field=SearchVectorField())
+
+
+def install(sender=None, using='default', **kwargs):
+    """``post_migrate`` handler: create the search index for the database if it is missing."""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    f"USING fts5(note_text, ai_evaluated_notes, tokenize='porter unicode61')"
+                )
+            except OperationalError as e:
+                logger.warning(f"SQLite FTS5 unavailable, note search falls back to substring matching: {e}")
+                return
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+            if cursor.fetchone()[0] == 0:
+                rebuild(using)
+        _fts_available.pop(using, None)
+    elif connection.vendor == 'postgresql':
+        table = ClientNote._meta.db_table
+        with connection.cursor() as cursor:
+            columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+            existing = connection.introspection.get_constraints(cursor, table)
+            if DOCUMENT_COLUMN not in columns:
+                cursor.execute(
+                    f"ALTER TABLE {connection.ops.quote_name(table)} ADD COLUMN {DOCUMENT_COLUMN} tsvector "
+                    f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+                    f"coalesce(note_text, '') || ' ' || coalesce(ai_evaluated_notes, ''))) STORED"
+                )
+            if EXPRESSION_GIN_INDEX in existing:
+                cursor.execute(f"DROP INDEX IF EXISTS {EXPRESSION_GIN_INDEX}")
+            if GIN_INDEX not in existing:
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON {connection.ops.quote_name(table)} "
+                    f"USING gin ({DOCUMENT_COLUMN})"
+                )
+
+
+def fts_available(using):
+    if using not in _fts_available:
+        connection = connections[using]
+        _fts_available[using] = (connection.vendor == 'sqlite'
+                                 and FTS_TABLE in connection.introspection.table_names())
+    return _fts_available[using]
+
+
+def index_notes(notes):
+    """(Re-)index ``notes`` after they were written. Only SQLite needs this."""
+    using = router.db_for_write(ClientNote)
+    if not notes or not fts_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(note.pk,) for note in notes])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, note_text, ai_evaluated_notes) VALUES (%s, %s, %s)",
+            [(note.pk, note.note_text or '', note.ai_evaluated_notes or '') for note in notes],
+        )
+
+
+def remove_notes(note_ids):
+    using = router.db_for_write(ClientNote)
+    if not note_ids or not fts_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(note_id,) for note_id in note_ids])
+
+
+def rebuild(using=None):
+    """Rebuild the SQLite index from the notes table."""
+    using = using or router.db_for_write(ClientNote)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, note_text, ai_evaluated_notes) "
+            f"SELECT id, coalesce(note_text, ''), coalesce(ai_evaluated_notes, '') FROM {ClientNote._meta.db_table}"
+        )
+
+# End Index maintenance **********************************************************
+
+
+def fts5_query(text):
+    """
+    Turn a search box query into FTS5 syntax: words and "quoted phrases" must
+    all match, ``-word`` excludes. Returns None if nothing would be searched.
+    """
+    include, exclude = [], []
+    for negated_phrase, phrase, negated_word, word in re.findall(r'(-?)"([^"]*)"|(-?)(\S+)', text):
+        words = re.findall(r'\w+', phrase or word)
+        if words:
+            (exclude if negated_phrase or negated_word else include).append('"' + ' '.join(words) + '"')
+    if not include:
+        return None
+    query = ' AND '.join(include)
+    for term in exclude:
+        query = f'({query}) NOT {term}'
+    return query
+
+
+def highlight(fragment):
+    return html.escape(fragment or '').replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+def search(notes, text, order='rank', offset=0, limit=20):
+    """
+    The notes in the ``notes`` queryset matching ``text``, best match first
+    (or newest first with ``order='recent'``). Returns ``(notes, has_more)``,
+    each note carrying ``rank``, ``note_text_highlight`` and
+    ``ai_evaluated_notes_highlight``.
+    """
+    connection = connections[notes.db]
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(notes, text, order, offset, limit)
+    if fts_available(notes.db):
+        return _search_fts5(notes, text, order, offset, limit)
+    return _search_substring(notes, text, offset, limit)
+
+
+def _page(notes, offset, limit):
+    rows = list(notes[offset:offset + limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def _search_fts5(notes, text, order, offset, limit):
+    query = fts5_query(text)
+    if query is None:
+        return [], False
+    # bm25() is lower for better matches; matches in the note itself count double.
+    matched = notes.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {ClientNote._meta.db_table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[query],
+        select={'rank': f'-bm25({FTS_TABLE}, 1.0, 0.5)'},
+    )
+    page, has_more = _page(matched.order_by('-rank', '-id') if order == 'rank' else matched.order_by('-created_at', '-id'),
+                           offset, limit)
+    if page:
+        with connections[notes.db].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', 24), snippet({FTS_TABLE}, 1, %s, %s, '…', 24) "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({', '.join(['%s'] * len(page))})",
+                [START, STOP, START, STOP, query] + [note.pk for note in page],
+            )
+            snippets = {row[0]: row[1:] for row in cursor.fetchall()}
+        for note in page:
+            note.note_text_highlight, note.ai_evaluated_notes_highlight = map(highlight, snippets.get(note.pk, ('', '')))
+    return page, has_more
+
+
+def _search_postgresql(notes, text, order, offset, limit):
+    from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    matched = notes.annotate(document=search_document()).filter(document=query).annotate(
+        rank=SearchRank(search_document(), query, cover_density=True),
+    )
+    page, has_more = _page(matched.order_by('-rank', '-id') if order == 'rank' else matched.order_by('-created_at', '-id'),
+                           offset, limit)
+    if page:
+        options = {'config': SEARCH_CONFIG, 'start_sel': START, 'stop_sel': STOP, 'max_fragments': 2}
+        highlights = ClientNote.objects.using(notes.db).filter(pk__in=[note.pk for note in page]).annotate(
+            note_text_highlight=SearchHeadline('note_text', query, **options),
+            ai_evaluated_notes_highlight=SearchHeadline('ai_evaluated_notes', query, **options),
+        ).values_list('pk', 'note_text_highlight', 'ai_evaluated_notes_highlight')
+        snippets = {row[0]: row[1:] for row in highlights}
+        for note in page:
+            note.note_text_highlight, note.ai_evaluated_notes_highlight = map(highlight, snippets.get(note.pk, ('', '')))
+    return page, has_more
+
+
+def _search_substring(notes, text, offset, limit):
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return [], False
+    for term in terms:
+        notes = notes.filter(Q(note_text__icontains=term) | Q(ai_evaluated_notes__icontains=term))
+    page, has_more = _page(notes.order_by('-created_at', '-id'), offset, limit)
+    for note in page:
+        note.rank = None
+        note.note_text_highlight = html.escape(note.note_text or '')
+        note.ai_evaluated_notes_highlight = html.escape(note.ai_evaluated_notes or '')
+    return page, has_more
@@ -0,0 +1,107 @@
+"""
+Synthetic data for benchmarks and load tests.
+
+Generates caregivers, care clients and notes with realistic sentiment and
+emotion_tags distributions, inserted with ``bulk_create`` in batches. Note
+statistics, daily rollups and the search index are updated explicitly because
+``bulk_create`` bypasses the signals that normally maintain them.
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+from . import rollups, search, stats
+from .analysis import PROMPT_VERSION
+from .models import (AnalysisStatusChoices, CareClient, CareStatusChoices, ClientNote, GenderChoices,
+                     NoteSentimentChoices)
+
+FIRST_NAMES = ['Ada', 'Bea', 'Cyril', 'Dora', 'Edwin', 'Flora', 'Gus', 'Hilda', 'Ivor', 'Joan', 'Ken', 'Lena']
+LAST_NAMES = ['Adams', 'Baker', 'Clarke', 'Davies', 'Evans', 'Fisher', 'Green', 'Hughes', 'Jones', 'King', 'Lewis']
+
+NOTE_TEMPLATES = {
+    NoteSentimentChoices.POSITIVE: [
+        "Client was cheerful this morning and enjoyed breakfast in the garden.",
+        "Client chatted happily with family on the phone and ate well.",
+    ],
+    NoteSentimentChoices.NEUTRAL: [
+        "Quiet day, client watched television and had a nap after lunch.",
+        "Medication given as prescribed. No concerns raised.",
+    ],
+    NoteSentimentChoices.NEGATIVE: [
+        "Client seemed anxious and worried about her daughter's visit, crying at lunch.",
+        "Client fell in the bathroom, small bruise on left arm. Refused pain relief.",
+        "Client said she feels lonely and that things are hopeless.",
+    ],
+}
+
+EMOTIONS = ['sadness', 'anxiety', 'worry', 'loneliness', 'fear', 'anger', 'hopelessness', 'stress']
+
+# Rough share of notes per sentiment in real care records.
+SENTIMENT_WEIGHTS = {
+    NoteSentimentChoices.POSITIVE: 0.35,
+    NoteSentimentChoices.NEUTRAL: 0.35,
+    NoteSentimentChoices.NEGATIVE: 0.25,
+    NoteSentimentChoices.UNCATEGORISED: 0.05,
+}
+
+
+def random_emotions(rng, sentiment):
+    if sentiment == NoteSentimentChoices.POSITIVE or rng.random() < 0.2:
+        return {}
+    count = rng.randint(1, 3) if sentiment == NoteSentimentChoices.NEGATIVE else 1
+    high = 0.9 if sentiment == NoteSentimentChoices.NEGATIVE else 0.4
+    return {emotion: round(rng.uniform(0.1, high), 2) for emotion in rng.sample(EMOTIONS, count)}
+
+
+def seed_dataset(clients=100, notes_per_client=50, caregivers=10, days=365, seed=0, batch_size=2000):
+    """
+    Create ``caregivers`` users, ``clients`` care clients spread across them and
+    ``notes_per_client`` notes each over the last ``days`` days. Returns the
+    created caregivers and clients.
+    """
+    rng = random.Random(seed)
+    prefix = f"seed{seed}-{rng.randrange(10 ** 8)}"
+    carers = User.objects.bulk_create([User(username=f"{prefix}-carer{i}") for i in range(caregivers)])
+
+    care_clients = CareClient.objects.bulk_create([
+        CareClient(
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            date_of_birth=date(1930, 1, 1) + timedelta(days=rng.randrange(365 * 40)),
+            gender=rng.choice(GenderChoices.values),
+            care_status=rng.choices(CareStatusChoices.values, weights=[0.8, 0.15, 0.05])[0],
+            assigned_caregiver=carers[i % len(carers)] if carers else None,
+        )
+        for i in range(clients)
+    ], batch_size=batch_size)
+
+    sentiments, weights = zip(*SENTIMENT_WEIGHTS.items())
+    start = now() - timedelta(days=days)
+    batch = []
+    for care_client in care_clients:
+        for _ in range(notes_per_client):
+            sentiment = rng.choices(sentiments, weights=weights)[0]
+            status = AnalysisStatusChoices.PENDING if rng.random() < 0.02 else AnalysisStatusChoices.COMPLETE
+            templates = NOTE_TEMPLATES.get(sentiment, NOTE_TEMPLATES[NoteSentimentChoices.NEUTRAL])
+            batch.append(ClientNote(
+                care_client=care_client,
+                created_by=care_client.assigned_caregiver or carers[0],
+                created_at=start + timedelta(seconds=rng.randrange(days * 86400)),
+                note_text=rng.choice(templates),
+                ai_evaluated_notes="Identified risks: none identified.",
+                sentiment=sentiment,
+                emotion_tags=random_emotions(rng, sentiment),
+                analysis_status=status,
+                analysis_version=PROMPT_VERSION if status == AnalysisStatusChoices.COMPLETE else None,
+            ))
+            if len(batch) >= batch_size:
+                search.index_notes(ClientNote.objects.bulk_create(batch))
+                batch = []
+    search.index_notes(ClientNote.objects.bulk_create(batch))
+
+    for care_client in care_clients:
+        stats.rebuild(care_client.id)
+        rollups.rebuild(care_client.id)
+    return carers, care_clients
@@ -1,14 +1,20 @@
 from rest_framework import serializers
 from datetime import date
 from .models import CareClient, ClientNote
-import openai
-from django.conf import settings
-import json
+from django.db import transaction
+from django.db.models.functions import Substr
+from . import access
+from .analysis import AnalysisError, analyze_note, completed_fields
+from .embeddings import embed_notes
+from .pipeline import enqueue_analysis, is_deferred
 import logging
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+EXCERPT_LENGTH = 200  # Characters of note text shown in the note lists
+
+
 class CareClientSerializer(serializers.ModelSerializer):
     age = serializers.ReadOnlyField()  # Include the age property as a read-only field
 
@@ -20,7 +26,19 @@ class CareClientSerializer(serializers.ModelSerializer):
             'emergency_contact_number', 'care_status', 'assigned_caregiver',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'assigned_caregiver']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate_assigned_caregiver(self, value):
+        """
+        Clients can only be handed to a caregiver whose caseload the requesting
+        user can see (themselves, or a member of a team they manage); staff can
+        assign anyone, or no one.
+        """
+        request = self.context.get('request')
+        ids = access.caregiver_ids(request.user) if request else frozenset()
+        if ids is not None and (value is None or value.pk not in ids):
+            raise serializers.ValidationError("You can only assign clients to yourself or members of your teams.")
+        return value
 
     def validate_date_of_birth(self, value):
         """
@@ -33,173 +51,153 @@ class CareClientSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
-            # Set the currently logged-in user as the assigned caregiver
-            validated_data['assigned_caregiver'] = request.user
+            # Unless another caregiver is given, the currently logged-in user is the assigned caregiver
+            validated_data.setdefault('assigned_caregiver', request.user)
         return super().create(validated_data)
 
-    def update(self, instance, validated_data):
-        request = self.context.get('request')
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            # Update the assigned caregiver to the currently logged-in user
-            validated_data['assigned_caregiver'] = request.user
-        return super().update(instance, validated_data)
 
+class CareClientListSerializer(serializers.ModelSerializer):
+    """
+    A client in the client list: enough for the dashboard cards, without the
+    care notes and contact details the detail view returns.
+    """
+    age = serializers.ReadOnlyField()
+    assigned_caregiver_username = serializers.CharField(source='assigned_caregiver.username', default=None, read_only=True)
 
-class ClientNoteSerializer(serializers.ModelSerializer):
     class Meta:
-        model = ClientNote
-        fields = '__all__'
-        read_only_fields = ['sentiment', 'emotion_tags','ai_evaluated_notes', 'created_at', 'created_by']
-
-    def analyze_sentiment(self, note_text):
-        openai.api_key = settings.OPEN_AI_API
-        # If you're using a custom endpoint (e.g., Azure OpenAI), set openai.api_base:
-        # openai.api_base = settings.OPEN_AI_BASE_URL
-
-        prompt = (
-            "You are a sentiment analysis system. "
-            "Return exactly one of these words: Positive, Negative, or Neutral. "
-            "Do not include any additional text or punctuation.\n\n"
-            f"Text: \"{note_text}\""
+        model = CareClient
+        fields = [
+            'id', 'first_name', 'last_name', 'age', 'gender', 'address', 'care_status',
+            'assigned_caregiver', 'assigned_caregiver_username', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def list_queryset(cls, queryset):
+        """Load the caregiver with each client, and only the columns the list shows."""
+        return queryset.select_related('assigned_caregiver').only(
+            'id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'address', 'care_status',
+            'assigned_caregiver__id', 'assigned_caregiver__username', 'updated_at',
         )
 
-        try:
-            completion = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-
-            if (not completion or
-                    not completion.choices or
-                    not completion.choices[0].message or
-                    not completion.choices[0].message.content):
-                raise ValueError("Invalid response from OpenAI API for sentiment analysis.")
-
-            sentiment_response = completion.choices[0].message.content.strip()
-            # Note: The model choices are:
-            # Positive, Neutral, Negative, Uncategorised
-            # We'll map the model's response directly to these keys:
-            sentiment_mapping = {
-                "Positive": "Positive",
-                "Negative": "Negative",
-                "Neutral": "Neutral"
-            }
-
-            return sentiment_mapping.get(sentiment_response, "Uncategorised")
-        except Exception as e:
-            logger.error(f"Sentiment analysis error: {str(e)}", exc_info=True)
-            return "Uncategorised"
-
-    def analyze_emotions(self, note_text):
-        openai.api_key = settings.OPEN_AI_API
-        # If using a custom endpoint (like Azure), uncomment and set:
-        # openai.api_base = settings.OPEN_AI_BASE_URL
-
-        # We provide a list of mental health related emotions as a guide.
-        # The model should return them if found, along with their scores.
-        prompt = (
-            "You are a system that identifies mental-health-related emotions in a given text. "
-            "Return only a valid JSON object with double-quoted keys and numeric values between 0 and 1. "
-            "Keys should be emotion names (strings), and values should be their associated intensity scores. "
-            "Only include emotions relevant to mental health if they are present in the text. "
-            "If no mental-health-related emotions are found, return an empty JSON object `{}`.\n\n"
-            "Some examples of mental-health-related emotions are: \"sadness\", \"anxiety\", \"depression\", \"fear\", "
-            "\"stress\", \"hopelessness\", \"worry\", \"loneliness\", \"shame\", \"guilt\", \"anger\", \"helplessness\".\n\n"
-            "Analyze the following text:\n"
-            f"\"{note_text}\"\n\n"
-            "Example Output:\n"
-            "{\"anxiety\": 0.8, \"sadness\": 0.2}\n\n"
-            "Now produce only the JSON object (no extra text):"
-        )
 
-        try:
-            completion = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,  # More deterministic output
-                max_tokens=200
-            )
-
-            if not completion or not completion.choices or not completion.choices[0].message:
-                raise ValueError("Invalid response from OpenAI API for emotion analysis.")
-
-            emotion_response = completion.choices[0].message.content.strip()
-            logger.debug(f"Emotion analysis response: {emotion_response}")
-
-            # Validate if response looks like JSON
-            if not (emotion_response.startswith("{") and emotion_response.endswith("}")):
-                logger.error(f"Emotion analysis returned non-JSON format: {emotion_response}")
-                return {}
-
-            # Attempt to parse JSON
-            emotion_tags = json.loads(emotion_response)
-
-            # Validate and clamp scores
-            validated_tags = {}
-            for emotion, score in emotion_tags.items():
-                try:
-                    float_score = float(score)
-                    if 0 <= float_score <= 1:
-                        validated_tags[emotion] = float_score
-                    else:
-                        logger.warning(f"Score out of range for emotion '{emotion}': {score}")
-                except (TypeError, ValueError):
-                    logger.warning(f"Invalid score for emotion '{emotion}': {score}")
-                    # Skip invalid scores
-
-            return validated_tags
-        except json.JSONDecodeError as jde:
-            logger.error(f"JSON decode error: {str(jde)}. Response was: {emotion_response}", exc_info=True)
-            return {}
-        except Exception as e:
-            logger.error(f"Emotion analysis error: {str(e)}", exc_info=True)
-            return {}
-
-    def evaluate_for_safeguarding(self, note_text):
-        openai.api_key = settings.OPEN_AI_API
-
-        prompt = (
-            "You are acting as a safeguarding officer. Read the following care note carefully and "
-            "identify all potential risks to the patient’s well-being, such as signs of abuse, neglect, "
-            "self-harm, unmet care needs, or environmental hazards. Then provide a list of suggestions "
-            "for safeguarding actions that could be taken to protect the patient. "
-            "Present your answer in plain text, clearly separating the identified risks and the suggested "
-            "safeguarding measures.\n\n"
-            f"Care Note: \"{note_text}\""
-        )
+class ClientNoteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ClientNote
+        fields = '__all__'
+        read_only_fields = ['sentiment', 'emotion_tags','ai_evaluated_notes', 'analysis_status', 'analysis_version', 'created_at', 'created_by']
 
-        try:
-            completion = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-
-            safeguarding_response = completion.choices[0].message.content.strip()
-            return safeguarding_response
-        except Exception as e:
-            logger.error(f"Safeguarding analysis error: {str(e)}", exc_info=True)
-            return "Unable to analyze safeguarding risks at this time."
+    def validate_care_client(self, value):
+        """Notes can only be written for clients in the author's caseload."""
+        request = self.context.get('request')
+        if request and not access.clients_for(request.user).filter(pk=value.pk).exists():
+            raise serializers.ValidationError(f'Invalid pk "{value.pk}" - object does not exist.')
+        return value
 
     def create(self, validated_data):
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             validated_data['created_by'] = request.user
 
-        note_text = validated_data.get('note_text', '')
-        validated_data['sentiment'] = self.analyze_sentiment(note_text)
-        validated_data['ai_evaluated_notes'] = self.evaluate_for_safeguarding(note_text)
-        validated_data['emotion_tags'] = self.analyze_emotions(note_text)
-        return super().create(validated_data)
+        results = None if is_deferred() else self.analyze(validated_data.get('note_text', ''))
+        if results is None:
+            # Save straight away and let the analysis workers fill in the AI fields.
+            with transaction.atomic():
+                note = super().create(validated_data)
+                enqueue_analysis(note)
+            return note
+
+        validated_data.update(completed_fields(results))
+        note = super().create(validated_data)
+        embed_notes([note])
+        return note
 
     def update(self, instance, validated_data):
-        if 'note_text' in validated_data:
-            note_text = validated_data['note_text']
-            instance.sentiment = self.analyze_sentiment(note_text)
-            instance.emotion_tags = self.analyze_emotions(note_text)
-            instance.ai_evaluated_notes = self.evaluate_for_safeguarding(note_text)
+        if validated_data.get('note_text', instance.note_text) == instance.note_text:
+            # Unchanged text keeps its existing analysis.
+            validated_data.pop('note_text', None)
 
+        if 'note_text' in validated_data:
+            results = None if is_deferred() else self.analyze(validated_data['note_text'])
+            if results is None:
+                with transaction.atomic():
+                    note = super().update(instance, validated_data)
+                    enqueue_analysis(note)
+                return note
+
+            validated_data.update(completed_fields(results))
+            note = super().update(instance, validated_data)
+            embed_notes([note])
+            return note
 
         return super().update(instance, validated_data)
 
+    def analyze(self, note_text):
+        """
+        The note's AI fields, or None if any analysis failed (the provider is
+        throttling, down or its circuit is open): the note is then queued for
+        re-analysis rather than saved with fallback values.
+        """
+        try:
+            return analyze_note(note_text, fallback=False)
+        except AnalysisError as e:
+            logger.warning(f"Analysis deferred to the queue: {str(e)}")
+            return None
+
+
+class ClientNoteListSerializer(serializers.ModelSerializer):
+    """
+    A note in the note lists: its metadata and analysis with the first
+    ``EXCERPT_LENGTH`` characters of the text. The full text and the
+    safeguarding evaluation are on the note itself (``client-notes/<id>/``).
+    """
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True)
+    excerpt = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ClientNote
+        fields = [
+            'id', 'care_client', 'created_by', 'created_by_username', 'created_at', 'sentiment', 'emotion_tags',
+            'analysis_status', 'excerpt',
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def list_queryset(cls, queryset):
+        """
+        Load the author with each note and cut the excerpt in the database, so
+        neither long text column is read.
+        """
+        return queryset.select_related('created_by').only(
+            'id', 'care_client_id', 'created_by__id', 'created_by__username', 'created_at', 'sentiment',
+            'emotion_tags', 'analysis_status',
+        ).annotate(note_start=Substr('note_text', 1, EXCERPT_LENGTH + 1))
+
+    def get_excerpt(self, note):
+        text = note.note_start
+        if len(text) <= EXCERPT_LENGTH:
+            return text
+        return text[:EXCERPT_LENGTH].rstrip() + '…'
+
+
+class NoteSearchResultSerializer(serializers.ModelSerializer):
+    """A search hit: the note's metadata with highlighted (HTML-escaped) matches instead of the full text."""
+    rank = serializers.ReadOnlyField()
+    note_text_highlight = serializers.ReadOnlyField()
+    ai_evaluated_notes_highlight = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ClientNote
+        fields = [
+            'id', 'care_client', 'created_by', 'created_at', 'sentiment', 'analysis_status', 'rank',
+            'note_text_highlight', 'ai_evaluated_notes_highlight',
+        ]
+
+
+class SimilarNoteSerializer(ClientNoteListSerializer):
+    """A similar note: the list fields (with an excerpt, not the full text) and its cosine similarity."""
+    similarity = serializers.ReadOnlyField()
+
+    class Meta(ClientNoteListSerializer.Meta):
+        fields = ClientNoteListSerializer.Meta.fields + ['similarity']
+        read_only_fields = fields
@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import rollups, search, stats
+from .models import ClientNote
+
+
+@receiver(pre_save, sender=ClientNote)
+def remember_note_contribution(sender, instance, **kwargs):
+    """Keep what the note contributed before this save so only the difference is applied."""
+    instance._previous_contribution = instance._previous_rollup_key = instance._previous_evaluation = None
+    if instance.pk:
+        previous = (ClientNote.objects.filter(pk=instance.pk)
+                    .values('care_client_id', 'sentiment', 'emotion_tags', 'created_at', 'ai_evaluated_notes').first())
+        if previous:
+            instance._previous_contribution = stats.Contribution(
+                previous['care_client_id'], previous['sentiment'], previous['emotion_tags'],
+            )
+            instance._previous_rollup_key = rollups.key_of(previous['care_client_id'], previous['created_at'])
+            instance._previous_evaluation = previous['ai_evaluated_notes']
+
+
+@receiver(post_save, sender=ClientNote)
+def update_note_stats_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_contribution', None)
+    current = stats.Contribution.of(instance)
+    stats.apply_changes([(previous, current)])
+
+    previous_key = getattr(instance, '_previous_rollup_key', None)
+    key = rollups.key_of(instance.care_client_id, instance.created_at)
+    if previous == current and previous_key == key and getattr(instance, '_previous_evaluation', None) == instance.ai_evaluated_notes:
+        # e.g. only the note text changed: nothing the rollups count
+        return
+    rollups.refresh({key, previous_key} - {None})
+
+
+@receiver(post_delete, sender=ClientNote)
+def update_note_stats_on_delete(sender, instance, **kwargs):
+    stats.apply_changes([(stats.Contribution.of(instance), None)])
+    rollups.refresh([rollups.key_of(instance.care_client_id, instance.created_at)])
+
+
+@receiver(post_save, sender=ClientNote)
+def update_search_index_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'note_text', 'ai_evaluated_notes'} & set(update_fields):
+        search.index_notes([instance])
+
+
+@receiver(post_delete, sender=ClientNote)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    search.remove_notes([instance.pk])
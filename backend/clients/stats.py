@@ -0,0 +1,223 @@
+"""
+Materialised per-client note statistics.
+
+``ClientNoteStats`` holds, for each client, the number of notes per sentiment
+and the sum of each emotion score. Every note change is applied as a delta
+(see ``clients.signals``), so the analytics endpoint reads a single row
+instead of every note. ``manage.py rebuild_note_stats`` recomputes the rows
+from the notes table for backfills and to verify the running totals.
+
+Those recomputations aggregate in the database: sentiments with a GROUP BY,
+and emotion scores by expanding ``emotion_tags`` with ``json_each``
+(SQLite) or ``jsonb_each`` (PostgreSQL). Other backends stream just the
+``emotion_tags`` column and sum in Python.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count
+
+from .models import ClientNote, ClientNoteStats
+
+# Decimal places kept on emotion sums so repeated deltas don't accumulate float noise.
+PRECISION = 6
+
+# Per-emotion sum, count and maximum over the notes selected by the subquery, in one pass.
+# Non-object tags and non-numeric scores are skipped, as in the Python fallback.
+NATIVE_EMOTION_SQL = {
+    'sqlite': (
+        "SELECT tag.key, SUM(tag.value), COUNT(*), MAX(tag.value) FROM ({notes}) AS notes, "
+        "json_each(CASE WHEN json_type(notes.emotion_tags) = 'object' THEN notes.emotion_tags ELSE '{{}}' END) AS tag "
+        "WHERE tag.type IN ('integer', 'real') GROUP BY tag.key"
+    ),
+    'postgresql': (
+        "SELECT tag.key, SUM(tag.value::float8), COUNT(*), MAX(tag.value::float8) FROM ({notes}) AS notes, "
+        "jsonb_each(CASE WHEN jsonb_typeof(notes.emotion_tags) = 'object' THEN notes.emotion_tags "
+        "ELSE '{{}}'::jsonb END) AS tag "
+        "WHERE jsonb_typeof(tag.value) = 'number' GROUP BY tag.key"
+    ),
+}
+
+
+def is_score(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Contribution:
+    """What one note adds to its client's statistics."""
+
+    def __init__(self, care_client_id, sentiment, emotion_tags):
+        self.care_client_id = care_client_id
+        self.sentiment = sentiment
+        self.emotion_tags = emotion_tags if isinstance(emotion_tags, dict) else {}
+
+    @classmethod
+    def of(cls, note):
+        return cls(note.care_client_id, note.sentiment, note.emotion_tags)
+
+    def __eq__(self, other):
+        return (isinstance(other, Contribution) and self.care_client_id == other.care_client_id
+                and self.sentiment == other.sentiment and self.emotion_tags == other.emotion_tags)
+
+
+def apply_changes(changes):
+    """
+    Apply ``(old, new)`` contribution pairs to the stored statistics.
+    ``old`` is None for a created note and ``new`` is None for a deleted one.
+
+    Must run after the notes table reflects the changes: a client without a
+    statistics row yet gets one built from a full scan instead of the delta.
+    """
+    deltas = defaultdict(lambda: {'count': 0, 'sentiments': Counter(), 'emotions': defaultdict(float), 'added': False})
+    for old, new in changes:
+        if old == new:
+            continue
+        for contribution, sign in ((old, -1), (new, 1)):
+            if contribution is None:
+                continue
+            delta = deltas[contribution.care_client_id]
+            delta['count'] += sign
+            delta['added'] |= sign > 0
+            delta['sentiments'][contribution.sentiment] += sign
+            for emotion, score in contribution.emotion_tags.items():
+                if is_score(score):
+                    delta['emotions'][emotion] += sign * score
+
+    for care_client_id, delta in deltas.items():
+        with transaction.atomic():
+            stats = ClientNoteStats.objects.select_for_update().filter(care_client_id=care_client_id).first()
+            if stats is None:
+                # Only deletions (possibly the client itself being deleted): the row
+                # will be built from the remaining notes the next time it is read.
+                if not delta['added'] or _create(care_client_id) is not None:
+                    continue
+                # Built concurrently by another request, whose scan may not have seen
+                # these changes yet: apply the delta to its row instead of dropping it.
+                stats = ClientNoteStats.objects.select_for_update().get(care_client_id=care_client_id)
+            stats.note_count = max(0, stats.note_count + delta['count'])
+            stats.sentiment_counts = _merge(stats.sentiment_counts, delta['sentiments'])
+            stats.emotion_sums = _merge(stats.emotion_sums, delta['emotions'])
+            stats.save(update_fields=['note_count', 'sentiment_counts', 'emotion_sums', 'updated_at'])
+
+
+def _create(care_client_id):
+    """
+    Build and save a client's statistics row. The scan runs inside the
+    transaction, which keeps it on the primary database (see
+    ``backend.db_router``).
+    """
+    try:
+        with transaction.atomic():
+            stats = compute(care_client_id)
+            stats.save(force_insert=True)
+            return stats
+    except IntegrityError:
+        # Built concurrently by another request.
+        return None
+
+
+def _merge(totals, delta):
+    merged = dict(totals)
+    for key, value in delta.items():
+        merged[key] = round(merged.get(key, 0) + value, PRECISION)
+        if abs(merged[key]) < 10 ** -PRECISION:
+            del merged[key]
+    return merged
+
+
+def emotion_aggregates(notes, native=True):
+    """
+    Per-emotion ``{'sum', 'count', 'average', 'max'}`` over the ``emotion_tags`` of the
+    ``notes`` queryset. With ``native`` and a supported backend this is a single
+    aggregate query; otherwise only the ``emotion_tags`` column is streamed.
+    """
+    connection = connections[notes.db]
+    template = NATIVE_EMOTION_SQL.get(connection.vendor)
+    if native and template is not None:
+        subquery, params = notes.order_by().values('emotion_tags').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(template.format(notes=subquery), params)
+            rows = cursor.fetchall()
+    else:
+        sums, counts, peaks = defaultdict(float), Counter(), {}
+        for emotion_tags in notes.values_list('emotion_tags', flat=True).iterator(chunk_size=2000):
+            if isinstance(emotion_tags, dict):
+                for emotion, score in emotion_tags.items():
+                    if is_score(score):
+                        sums[emotion] += score
+                        counts[emotion] += 1
+                        peaks[emotion] = max(score, peaks.get(emotion, score))
+        rows = [(emotion, sums[emotion], counts[emotion], peaks[emotion]) for emotion in counts]
+
+    return {
+        emotion: {'sum': total, 'count': count, 'average': total / count, 'max': peak}
+        for emotion, total, count, peak in rows
+    }
+
+
+def compute(care_client_id, native=True):
+    """Recompute a client's statistics from its notes, aggregated in the database."""
+    notes = ClientNote.objects.filter(care_client_id=care_client_id)
+    sentiments = dict(notes.order_by().values_list('sentiment').annotate(count=Count('id')))
+    emotions = emotion_aggregates(notes, native=native)
+    return ClientNoteStats(
+        care_client_id=care_client_id,
+        note_count=sum(sentiments.values()),
+        sentiment_counts=sentiments,
+        emotion_sums={
+            emotion: round(values['sum'], PRECISION)
+            for emotion, values in emotions.items() if round(values['sum'], PRECISION)
+        },
+    )
+
+
+def rebuild(care_client_id):
+    with transaction.atomic():
+        stats = compute(care_client_id)
+        existing = ClientNoteStats.objects.select_for_update().filter(care_client_id=care_client_id).first()
+        if existing is None:
+            stats.save(force_insert=True)
+            return stats
+        existing.note_count = stats.note_count
+        existing.sentiment_counts = stats.sentiment_counts
+        existing.emotion_sums = stats.emotion_sums
+        existing.save(update_fields=['note_count', 'sentiment_counts', 'emotion_sums', 'updated_at'])
+        return existing
+
+
+def get_stats(care_client_id):
+    """Return the client's statistics row, building it on first use."""
+    stats = ClientNoteStats.objects.filter(care_client_id=care_client_id).first()
+    if stats is None:
+        # Read back from the primary: a replica may not have the new row yet.
+        stats = _create(care_client_id) or ClientNoteStats.objects.using(
+            router.db_for_write(ClientNoteStats)).get(care_client_id=care_client_id)
+    return stats
+
+
+def differences(stored, expected):
+    """Describe how ``stored`` statistics differ from ``expected`` ones (empty if they match)."""
+    problems = []
+    if stored.note_count != expected.note_count:
+        problems.append(f"note_count {stored.note_count} != {expected.note_count}")
+    if {k: v for k, v in stored.sentiment_counts.items() if v} != expected.sentiment_counts:
+        problems.append(f"sentiment_counts {stored.sentiment_counts} != {expected.sentiment_counts}")
+    for emotion in set(stored.emotion_sums) | set(expected.emotion_sums):
+        if abs(stored.emotion_sums.get(emotion, 0) - expected.emotion_sums.get(emotion, 0)) > 1e-4:
+            problems.append(f"emotion_sums[{emotion}] {stored.emotion_sums.get(emotion, 0)} != "
+                            f"{expected.emotion_sums.get(emotion, 0)}")
+    return problems
+
+
+def sentiment_distribution(stats):
+    """Same shape as ``notes.values('sentiment').annotate(count=Count('sentiment'))``."""
+    return [{'sentiment': sentiment, 'count': count} for sentiment, count in stats.sentiment_counts.items() if count]
+
+
+def emotion_distribution(stats):
+    """Each emotion's share of the client's total emotion score."""
+    emotion_sums = dict(stats.emotion_sums)
+    total_emotion_score = sum(emotion_sums.values())
+    if total_emotion_score > 0:
+        return {emotion: round(value / total_emotion_score, 2) for emotion, value in emotion_sums.items()}
+    return emotion_sums
@@ -0,0 +1,153 @@
+"""
+Server-sent-event streams of model output.
+
+The safeguarding evaluation of a note and a client's analysis summary are
+streamed to the browser token by token as the model produces them, so the
+first words appear after the model's first-token latency instead of after the
+whole generation. The complete text is saved once the stream finishes, and
+only if the model produced some; a failed, empty or abandoned stream saves
+nothing.
+
+Regenerating a safeguarding evaluation overwrites the note's, so that stream
+is a POST; the summary stream only fills in a cached summary and is a GET.
+Browsers consume both with ``fetch()`` and a reader on the response body
+(``EventSource`` can't send headers), passing the access token as
+``Authorization: Bearer <token>``.
+
+These are async views: served through ``backend.asgi`` (the ``stream``
+service in docker-compose.yml, which nginx.conf routes /api/clients/stream/
+to), each open stream costs an event-loop task rather than a worker thread.
+DRF views are synchronous, so requests are authenticated here with the same
+JWT authentication DRF uses.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from accounts.authentication import JWTAuthentication
+
+from . import access, stats, summaries
+from .analysis import (PROMPT_VERSION, SAFEGUARDING_FALLBACK, safeguarding_prompt, stream_chat_completion,
+                       stream_text_completion)
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+
+def sse(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(pieces, on_complete, fallback):
+    """
+    Relay ``pieces`` as ``token`` events, then call ``on_complete(text)`` and
+    send the full text as a ``done`` event. If the model fails part-way or
+    produces no text, an ``error`` event carries ``fallback`` and nothing is saved.
+    """
+    # Sent straight away so proxies and the browser see the stream open.
+    yield ": stream open\n\n"
+    received = []
+    try:
+        async for piece in pieces:
+            received.append(piece)
+            yield sse('token', {'text': piece})
+    except Exception as e:
+        logger.error(f"Error streaming model output: {str(e)}", exc_info=True)
+        yield sse('error', {'error': fallback})
+        return
+
+    text = "".join(received).strip()
+    if not text:
+        logger.warning("Model stream finished without any text")
+        yield sse('error', {'error': fallback})
+        return
+    await sync_to_async(on_complete)(text)
+    yield sse('done', {'text': text})
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def authenticate(request):
+    """The user of the request's JWT access token, or None."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+def unauthorized():
+    return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+
+# Authenticated by token, not session cookie, so there is no CSRF to guard against.
+@csrf_exempt
+@require_POST
+async def stream_safeguarding(request, pk):
+    """Stream a fresh safeguarding evaluation of a note and save it as its ``ai_evaluated_notes``."""
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    notes = await sync_to_async(access.notes_for)(user)
+    note = await notes.filter(pk=pk).afirst()
+    if note is None:
+        return JsonResponse({"error": "Note not found"}, status=404)
+
+    def save(text):
+        note.ai_evaluated_notes = text
+        note.analysis_version = PROMPT_VERSION
+        note.save(update_fields=['ai_evaluated_notes', 'analysis_version'])
+
+    pieces = stream_chat_completion(
+        messages=[{"role": "user", "content": safeguarding_prompt(note.note_text)}],
+        temperature=0,
+    )
+    return sse_response(event_stream(pieces, save, SAFEGUARDING_FALLBACK))
+
+
+@require_GET
+async def stream_analysis_summary(request, client_id):
+    """
+    Stream a client's analysis summary. A stored summary that is still current
+    is sent as a single event without calling the model.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    clients = await sync_to_async(access.clients_for)(user)
+    if not await clients.filter(pk=client_id).aexists():
+        return JsonResponse({"error": "Client not found"}, status=404)
+
+    note_stats = await sync_to_async(stats.get_stats)(client_id)
+    sentiment_distribution = stats.sentiment_distribution(note_stats)
+    emotion_distribution = stats.emotion_distribution(note_stats)
+    current = summaries.fingerprint(sentiment_distribution, emotion_distribution)
+
+    if note_stats.analysis_summary and note_stats.summary_fingerprint == current:
+        async def stored():
+            yield note_stats.analysis_summary
+        pieces, save = stored(), lambda text: None
+    else:
+        pieces = stream_text_completion(
+            prompt=summaries.summary_prompt(sentiment_distribution, emotion_distribution),
+            max_tokens=200,
+            temperature=0.7,
+        )
+
+        def save(text):
+            summaries.store_summary(client_id, text, current)
+
+    return sse_response(event_stream(pieces, save, summaries.SUMMARY_FALLBACK))
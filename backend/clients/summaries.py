@@ -0,0 +1,122 @@
+"""
+GPT analysis summaries for the note-distribution endpoint.
+
+A summary is stored on the client's ``ClientNoteStats`` row together with a
+fingerprint of the distributions it was generated from. While the
+fingerprint still matches, the stored summary is served without a model call.
+When it no longer matches, the previous summary keeps being served while a
+new one is generated in the background.
+"""
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils.timezone import now
+
+from .analysis import text_completion
+from .models import ClientNoteStats
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+SUMMARY_FALLBACK = "Unable to generate analysis summary at this time."
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='summary-refresh')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def fingerprint(sentiment_distribution, emotion_distribution):
+    """Hash of exactly the inputs that go into the summary prompt."""
+    inputs = {
+        'sentiments': sorted((item['sentiment'], item['count']) for item in sentiment_distribution),
+        'emotions': sorted(emotion_distribution.items()),
+        'model': settings.AI_ANALYSIS_MODEL,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def summary_prompt(sentiment_distribution, emotion_distribution):
+    sentiment_data = ", ".join(
+        [f"{item['sentiment']} ({item['count']} occurrences)" for item in sentiment_distribution]
+    )
+    emotion_data = ", ".join(
+        [f"{emotion}: {score}" for emotion, score in emotion_distribution.items()]
+    )
+
+    return (
+        f"Based on the following patient data:\n\n"
+        f"Sentiment Distribution: {sentiment_data}\n"
+        f"Emotion Distribution: {emotion_data}\n\n"
+        f"1. Provide a brief analysis of the patient's mental health.\n"
+        f"2. Suggest actionable recommendations to support their mental well-being.\n\n"
+        f"Be concise and professional in your response."
+    )
+
+
+def generate_analysis_summary(sentiment_distribution, emotion_distribution):
+    """
+    Generates a summary analysis using OpenAI GPT model based on the sentiment
+    and emotion distribution. Raises if the model call fails.
+    """
+    response = text_completion(
+        prompt=summary_prompt(sentiment_distribution, emotion_distribution),
+        max_tokens=200,
+        temperature=0.7,
+    )
+    return response.choices[0].text.strip()
+
+
+def store_summary(care_client_id, summary, summary_fingerprint):
+    ClientNoteStats.objects.filter(care_client_id=care_client_id).update(
+        analysis_summary=summary, summary_fingerprint=summary_fingerprint, summary_generated_at=now(),
+    )
+
+
+def get_summary(note_stats, sentiment_distribution, emotion_distribution):
+    """
+    Return the summary to show for ``note_stats``, regenerating it only when
+    the distributions have changed since it was generated.
+    """
+    current = fingerprint(sentiment_distribution, emotion_distribution)
+    if note_stats.analysis_summary and note_stats.summary_fingerprint == current:
+        return note_stats.analysis_summary
+
+    if note_stats.analysis_summary and settings.AI_SUMMARY_BACKGROUND_REFRESH:
+        schedule_refresh(note_stats.care_client_id, sentiment_distribution, emotion_distribution, current)
+        return note_stats.analysis_summary
+
+    try:
+        summary = generate_analysis_summary(sentiment_distribution, emotion_distribution)
+    except Exception as e:
+        logger.error(f"Error generating analysis summary: {str(e)}", exc_info=True)
+        return note_stats.analysis_summary or SUMMARY_FALLBACK
+
+    store_summary(note_stats.care_client_id, summary, current)
+    note_stats.analysis_summary, note_stats.summary_fingerprint = summary, current
+    return summary
+
+
+def schedule_refresh(care_client_id, sentiment_distribution, emotion_distribution, summary_fingerprint):
+    """Regenerate a client's summary in the background unless that is already happening."""
+    with _refreshing_lock:
+        if care_client_id in _refreshing:
+            return
+        _refreshing.add(care_client_id)
+    _refresh_executor.submit(_refresh, care_client_id, sentiment_distribution, emotion_distribution, summary_fingerprint)
+
+
+def _refresh(care_client_id, sentiment_distribution, emotion_distribution, summary_fingerprint):
+    try:
+        summary = generate_analysis_summary(sentiment_distribution, emotion_distribution)
+        store_summary(care_client_id, summary, summary_fingerprint)
+    except Exception as e:
+        logger.error(f"Error refreshing analysis summary for client {care_client_id}: {str(e)}", exc_info=True)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(care_client_id)
+        connections.close_all()
@@ -1,3 +1,1418 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, router, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CareTeam
+from backend.db_router import read_from_replica
+from backend.metrics import JsonFormatter
+
+from . import cache as analysis_cache
+from . import embeddings, fake_llm, loadtest, providers, resilience, rollups, search, stats, summaries
+from .analysis import (PROMPT_VERSION, SAFEGUARDING_FALLBACK, analyze_note, chat_completion, stream_chat_completion,
+                       text_completion)
+from .importer import NoteImporter, _retry_after, iter_rows
+from .models import (AnalysisCacheEntry, AnalysisJob, CareClient, ClientNote, ClientNoteStats, DailyEmotionRollup,
+                     DailySentimentRollup, NoteEmbedding)
+from .pagination import ClientNoteKeysetPagination
+from .pipeline import notes_to_reanalyze, run_worker
+from .seed import seed_dataset
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0.2, AI_ANALYSIS_TIMEOUT=5, AI_CACHE_ENABLED=False)
+class AnalyzeNoteTests(SimpleTestCase):
+    note_text = "Client was anxious and crying after she fell in the garden."
+
+    def test_concurrent_analysis_takes_the_slowest_call(self):
+        start = time.perf_counter()
+        result = analyze_note(self.note_text, concurrent=True)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(result['sentiment'], 'Negative')
+        self.assertIn('anxiety', result['emotion_tags'])
+        self.assertIn('fell', result['ai_evaluated_notes'])
+
+    def test_concurrent_and_serial_results_match(self):
+        self.assertEqual(
+            analyze_note(self.note_text, concurrent=True),
+            analyze_note(self.note_text, concurrent=False),
+        )
+
+    @override_settings(AI_ANALYSIS_TIMEOUT=0.3)
+    def test_time_queued_in_the_pool_does_not_count_towards_the_timeout(self):
+        # One worker: the three 0.2s calls run one after another, each well within its own 0.3s.
+        with ThreadPoolExecutor(max_workers=1) as pool, mock.patch('clients.analysis.get_executor', return_value=pool):
+            result = analyze_note(self.note_text, concurrent=True, use_cache=False)
+        self.assertEqual(result['sentiment'], 'Negative')
+        self.assertIn('fell', result['ai_evaluated_notes'])
+
+    @override_settings(AI_ANALYSIS_TIMEOUT=0.05)
+    def test_timed_out_analyses_fall_back(self):
+        result = analyze_note(self.note_text, concurrent=True)
+        self.assertEqual(result['sentiment'], 'Uncategorised')
+        self.assertEqual(result['emotion_tags'], {})
+
+    def test_combined_strategy_matches_separate(self):
+        self.assertEqual(
+            analyze_note(self.note_text, strategy='combined'),
+            analyze_note(self.note_text, strategy='separate'),
+        )
+
+    def test_combined_strategy_retries_invalid_fields_separately(self):
+        document = '{"sentiment": "Very bad", "emotions": {"anxiety": 7, "fear": 0.5}, "safeguarding": "Falls risk."}'
+        response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=document))])
+        with mock.patch('clients.analysis.chat_completion', side_effect=[response, RuntimeError("down")]):
+            result = analyze_note(self.note_text, strategy='combined', concurrent=False)
+
+        self.assertEqual(result['sentiment'], 'Uncategorised')
+        self.assertEqual(result['emotion_tags'], {'fear': 0.5})
+        self.assertEqual(result['ai_evaluated_notes'], 'Falls risk.')
+
+
+class ProviderTests(SimpleTestCase):
+    def setUp(self):
+        self.requests = []
+
+    def reply(self, request):
+        self.requests.append(request)
+        body = json.loads(request.content)
+        if body.get('stream'):
+            chunks = [{'choices': [{'index': 0, 'delta': {'content': piece}}]} for piece in ("Falls ", "risk.")]
+            stream = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+            return httpx.Response(200, text=stream, headers={'content-type': 'text/event-stream'})
+        return httpx.Response(200, json={
+            'model': 'gpt-4',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'Positive'}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 12, 'completion_tokens': 1, 'total_tokens': 13},
+        })
+
+    def test_openai_provider_reuses_its_client(self):
+        provider = providers.OpenAIProvider('sk-test', 'https://llm.example/v1/', transport=httpx.MockTransport(self.reply))
+        with mock.patch('clients.analysis.get_provider', return_value=provider):
+            completion = chat_completion(messages=[{'role': 'user', 'content': 'How is Ada?'}], model='gpt-4')
+            chat_completion(messages=[{'role': 'user', 'content': 'How is Bob?'}], model='gpt-4')
+
+        self.assertEqual(completion.choices[0].message.content, 'Positive')
+        self.assertEqual(completion.usage.total_tokens, 13)
+        self.assertEqual([str(request.url) for request in self.requests], ['https://llm.example/v1/chat/completions'] * 2)
+        self.assertEqual(self.requests[0].headers['authorization'], 'Bearer sk-test')
+        self.assertEqual(json.loads(self.requests[0].content)['messages'][0]['content'], 'How is Ada?')
+
+    def test_azure_provider_addresses_the_deployment(self):
+        provider = providers.AzureOpenAIProvider(
+            'az-key', 'https://care.openai.azure.com', '2024-02-01', transport=httpx.MockTransport(self.reply),
+        )
+        provider.chat_completion(messages=[{'role': 'user', 'content': 'Hi'}], model='notes-gpt4')
+
+        request = self.requests[0]
+        self.assertEqual(str(request.url),
+                         'https://care.openai.azure.com/openai/deployments/notes-gpt4/chat/completions?api-version=2024-02-01')
+        self.assertEqual(request.headers['api-key'], 'az-key')
+        self.assertNotIn('authorization', request.headers)
+
+    def test_errors_map_to_provider_errors(self):
+        def fail(request):
+            if request.url.path.endswith('/completions') and 'chat' not in request.url.path:
+                raise httpx.ConnectError("refused")
+            return httpx.Response(429, headers={'retry-after': '3'}, json={'error': 'slow down'})
+
+        provider = providers.OpenAIProvider('sk-test', 'https://llm.example/v1', transport=httpx.MockTransport(fail))
+        with self.assertRaises(providers.RateLimitError) as raised:
+            provider.chat_completion(messages=[], model='gpt-4')
+        self.assertEqual(_retry_after(raised.exception), 3.0)
+        with self.assertRaises(providers.APIConnectionError):
+            provider.text_completion(prompt='Hi', engine='gpt-4')
+
+    async def test_streamed_completion(self):
+        provider = providers.OpenAIProvider('sk-test', 'https://llm.example/v1', transport=httpx.MockTransport(self.reply))
+        with mock.patch('clients.analysis.get_provider', return_value=provider):
+            pieces = [piece async for piece in stream_chat_completion(messages=[{'role': 'user', 'content': 'Hi'}])]
+        self.assertEqual(pieces, ["Falls ", "risk."])
+        self.assertTrue(json.loads(self.requests[0].content)['stream'])
+
+    @override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0)
+    def test_provider_follows_settings(self):
+        self.assertIsInstance(providers.get_provider(), providers.FakeProvider)
+        self.assertIs(providers.get_provider(), providers.get_provider())
+        with override_settings(AI_ANALYSIS_BACKEND='azure', OPEN_AI_BASE_URL='https://care.openai.azure.com'):
+            self.assertIsInstance(providers.get_provider(), providers.AzureOpenAIProvider)
+
+
+@override_settings(AI_ANALYSIS_BACKEND='openai', AI_RETRY_MAX_ATTEMPTS=3, AI_RETRY_BACKOFF=0.01,
+                   AI_BREAKER_FAILURE_THRESHOLD=3, AI_BREAKER_RESET_TIMEOUT=30, AI_RATE_LIMIT_RPM=0, AI_RATE_LIMIT_TPM=0)
+class ResilienceTests(TestCase):
+    def setUp(self):
+        resilience._guards.clear()
+        self.statuses = []
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+
+    def reply(self, request):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            return httpx.Response(status, json={'error': 'unavailable'})
+        return httpx.Response(200, json={
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'Neutral'}}],
+            'usage': {'prompt_tokens': 10, 'completion_tokens': 1, 'total_tokens': 11},
+        })
+
+    def provider(self):
+        provider = providers.OpenAIProvider('sk-test', 'https://llm.example/v1', transport=httpx.MockTransport(self.reply))
+        return mock.patch('clients.analysis.get_provider', return_value=provider)
+
+    def ask(self, **kwargs):
+        return chat_completion(messages=[{'role': 'user', 'content': 'How is Ada?'}], **kwargs)
+
+    def test_transient_failures_are_retried(self):
+        self.statuses = [503, 429]
+        with self.provider():
+            self.assertEqual(self.ask().choices[0].message.content, 'Neutral')
+        self.assertEqual(resilience.get_guard().breaker.state, 'closed')
+
+    @override_settings(AI_RETRY_MAX_ATTEMPTS=50, AI_RETRY_BACKOFF=0.1, AI_BREAKER_FAILURE_THRESHOLD=100)
+    def test_retries_stay_within_the_timeout(self):
+        self.statuses = [503] * 50
+        start = time.perf_counter()
+        with self.provider(), self.assertRaises(providers.ServiceUnavailableError):
+            self.ask(request_timeout=0.3)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_circuit_opens_fails_fast_and_recovers(self):
+        self.statuses = [503] * 3
+        with self.provider():
+            with self.assertRaises(providers.ServiceUnavailableError):
+                self.ask()
+            with self.assertRaises(resilience.CircuitOpenError):
+                self.ask()
+            self.assertEqual(self.statuses, [])
+
+            breaker = resilience.get_guard().breaker
+            breaker.opened_at -= 30
+            self.assertEqual(self.ask().choices[0].message.content, 'Neutral')
+            self.assertEqual(breaker.state, 'closed')
+
+    def test_token_budget(self):
+        limiter = resilience.RateLimiter(requests_per_minute=0, tokens_per_minute=600)
+        deadline = time.monotonic() + 1
+        self.assertEqual(limiter.reserve(590, deadline), 0)
+        limiter.settle(590, 500)
+        self.assertEqual(limiter.reserve(100, deadline), 0)
+        self.assertGreater(limiter.reserve(100, time.monotonic() + 60), 9)
+        with self.assertRaises(resilience.BudgetExhausted):
+            limiter.reserve(100, deadline)
+
+    @override_settings(AI_ANALYSIS_MODE='sync', AI_CACHE_ENABLED=False, AI_ANALYSIS_STRATEGY='combined')
+    def test_open_circuit_defers_notes_to_the_queue(self):
+        for _ in range(3):
+            resilience.get_guard().breaker.record_failure()
+        api = APIClient()
+        api.force_authenticate(self.user)
+        with self.provider():
+            response = api.post('/api/clients/client-notes/', {'care_client': self.care_client.pk, 'note_text': "Calm day."})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['analysis_status'], 'Pending')
+
+            job = AnalysisJob.objects.get(note_id=response.data['id'])
+            run_worker(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 0)
+        self.assertGreater(job.available_at, now() + timedelta(seconds=20))
+        self.assertEqual(ClientNote.objects.get(pk=response.data['id']).analysis_status, 'Pending')
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_ANALYSIS_MODE='deferred', AI_CACHE_ENABLED=False)
+class DeferredAnalysisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_note(self, note_text="Client was cheerful and enjoyed lunch."):
+        response = self.api.post('/api/clients/client-notes/', {'care_client': self.care_client.pk, 'note_text': note_text})
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_note_is_saved_pending_and_filled_in_by_worker(self):
+        data = self.create_note()
+        self.assertEqual(data['analysis_status'], 'Pending')
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+        self.assertEqual(run_worker(once=True), 1)
+
+        note = ClientNote.objects.get(pk=data['id'])
+        self.assertEqual(note.analysis_status, 'Complete')
+        self.assertEqual(note.sentiment, 'Positive')
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_result_is_dropped_if_the_note_changed_during_analysis(self):
+        data = self.create_note()
+
+        def edited_meanwhile(note_text, **kwargs):
+            ClientNote.objects.filter(pk=data['id']).update(
+                note_text="Client was tearful.", sentiment='Negative', analysis_status='Complete',
+                analysis_version=PROMPT_VERSION,
+            )
+            return analyze_note(note_text, **kwargs)
+
+        with mock.patch('clients.pipeline.analyze_note', side_effect=edited_meanwhile):
+            self.assertEqual(run_worker(once=True), 0)
+
+        note = ClientNote.objects.get(pk=data['id'])
+        self.assertEqual((note.note_text, note.sentiment), ("Client was tearful.", 'Negative'))
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    @override_settings(AI_QUEUE_MAX_ATTEMPTS=2, AI_QUEUE_RETRY_BACKOFF=0)
+    def test_failed_analysis_is_retried_then_marked_failed(self):
+        data = self.create_note()
+        with mock.patch('clients.analysis.chat_completion', side_effect=RuntimeError("provider down")):
+            run_worker(once=True)
+
+        note = ClientNote.objects.get(pk=data['id'])
+        self.assertEqual(note.analysis_status, 'Failed')
+        self.assertEqual(note.sentiment, 'Uncategorised')
+        self.assertFalse(AnalysisJob.objects.exists())
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_CACHE_ENABLED=False)
+class ReanalysisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+
+    def note(self, **fields):
+        fields = {'note_text': "Client was cheerful and enjoyed lunch.", 'analysis_status': 'Complete',
+                  'analysis_version': PROMPT_VERSION, 'sentiment': 'Positive', 'emotion_tags': {'happiness': 0.8},
+                  **fields}
+        return ClientNote.objects.create(care_client=self.care_client, created_by=self.user, **fields)
+
+    def test_new_notes_record_the_prompt_version(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post('/api/clients/client-notes/', {'care_client': self.care_client.pk, 'note_text': "Calm day."})
+        self.assertEqual(response.data['analysis_version'], PROMPT_VERSION)
+        self.assertFalse(notes_to_reanalyze().exists())
+
+    def test_stale_and_failed_notes_are_reanalysed(self):
+        current = self.note()
+        failed = self.note(analysis_status='Failed', analysis_version=None, sentiment='Uncategorised')
+        outdated = self.note(analysis_version=None, sentiment='Neutral')
+        fallback = self.note(ai_evaluated_notes=SAFEGUARDING_FALLBACK, emotion_tags=None)
+        queued = self.note(analysis_status='Pending', analysis_version=None)
+        AnalysisJob.objects.create(note=queued)
+
+        out = io.StringIO()
+        call_command('reanalyze_notes', '--dry-run', stdout=out)
+        self.assertIn("failed: 1\noutdated: 1\nfallback: 1\n3 notes would be re-analysed", out.getvalue())
+        self.assertEqual(ClientNote.objects.get(pk=failed.pk).analysis_status, 'Failed')
+
+        call_command('reanalyze_notes', '--batch-size', '2', stdout=io.StringIO())
+        for note in (failed, outdated, fallback):
+            note.refresh_from_db()
+            self.assertEqual((note.analysis_status, note.analysis_version), ('Complete', PROMPT_VERSION))
+            self.assertEqual(note.sentiment, 'Positive')
+        self.assertNotEqual(fallback.ai_evaluated_notes, SAFEGUARDING_FALLBACK)
+        self.assertIsNotNone(fallback.emotion_tags)
+        self.assertEqual(ClientNoteStats.objects.get(care_client=self.care_client).sentiment_counts, {'Positive': 5})
+        self.assertFalse(notes_to_reanalyze().filter(pk=current.pk).exists())
+
+    @override_settings(AI_CACHE_ENABLED=True)
+    def test_reanalysis_does_not_reuse_cached_results(self):
+        note = self.note(analysis_version=None, sentiment='Negative')
+        cached = {'sentiment': 'Negative', 'emotion_tags': {'sadness': 0.9}, 'ai_evaluated_notes': "Old."}
+        with mock.patch('clients.cache.get', return_value=cached) as lookup:
+            call_command('reanalyze_notes', stdout=io.StringIO())
+        note.refresh_from_db()
+        self.assertEqual(note.sentiment, 'Positive')
+        lookup.assert_not_called()
+
+    def test_resumes_from_checkpoint_and_leaves_failures_for_the_next_run(self):
+        first, second = self.note(analysis_version=None), self.note(analysis_version=None)
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = f"{directory}/reanalyze.checkpoint"
+            with open(checkpoint, 'w') as f:
+                json.dump({'last_id': first.pk}, f)
+            with mock.patch('clients.analysis.chat_completion', side_effect=RuntimeError("provider down")):
+                out = io.StringIO()
+                call_command('reanalyze_notes', '--checkpoint', checkpoint, stdout=out)
+            self.assertIn("Re-analysed 0 of 1 notes (1 failed)", out.getvalue())
+            self.assertFalse(os.path.exists(checkpoint))
+        self.assertEqual(set(notes_to_reanalyze().values_list('pk', flat=True)), {first.pk, second.pk})
+
+
+def scrape(client):
+    """The samples served at /metrics, as ``{'name{labels}': value}``."""
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in response.content.decode().splitlines() if line and not line.startswith('#')}
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_CACHE_ENABLED=False, METRICS_TOKEN='s3cret',
+                   METRICS_LOG_REQUESTS=True)
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_note(self):
+        response = self.api.post('/api/clients/client-notes/',
+                                 {'care_client': self.care_client.pk, 'note_text': "Client was cheerful."})
+        self.assertEqual(response.status_code, 201)
+
+    def test_requests_and_model_calls_are_measured(self):
+        before = scrape(self.client)
+        with self.assertLogs('backend.requests', 'INFO') as logs:
+            self.create_note()
+        after = scrape(self.client)
+
+        def delta(sample):
+            return after.get(sample, 0) - before.get(sample, 0)
+
+        labels = 'method="POST",endpoint="client-notes-list"'
+        self.assertEqual(delta(f'http_request_duration_seconds_count{{{labels},status="201"}}'), 1)
+        self.assertEqual(delta(f'http_request_model_seconds_count{{{labels}}}'), 1)
+        self.assertGreater(delta(f'http_request_db_queries_sum{{{labels}}}'), 0)
+        for analysis in ('sentiment', 'emotion_tags', 'ai_evaluated_notes'):
+            self.assertEqual(delta(f'ai_analysis_seconds_count{{analysis="{analysis}",outcome="ok"}}'), 1)
+        self.assertEqual(delta('ai_model_call_seconds_count{kind="chat",model="gpt-4",outcome="ok"}'), 3)
+        self.assertGreater(delta('ai_model_tokens_total{model="gpt-4",type="completion"}'), 0)
+        self.assertIn('ai_analysis_queue_jobs{state="waiting"}', after)
+
+        entry = json.loads(JsonFormatter().format(logs.records[0]))
+        self.assertEqual((entry['status'], entry['model_calls']), (201, 3))
+        self.assertGreater(entry['db_queries'], 0)
+
+    def test_scrapes_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertIn('http_request_duration_seconds', self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer s3cret').content.decode())
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_CACHE_ENABLED=True)
+class AnalysisCacheTests(TestCase):
+
+    def test_repeated_text_is_served_from_the_cache(self):
+        with mock.patch('clients.analysis.chat_completion', wraps=chat_completion) as model_call:
+            first = analyze_note("Client  was calm\ntoday.")
+            second = analyze_note("Client was calm today.")
+
+        self.assertEqual(first, second)
+        self.assertEqual(model_call.call_count, 3)
+        self.assertEqual(AnalysisCacheEntry.objects.get().hit_count, 1)
+
+    def test_refresh_replaces_the_cached_result_without_reading_it(self):
+        first = analyze_note("Client was calm today.")
+        with mock.patch('clients.analysis.chat_completion', wraps=chat_completion) as model_call:
+            analyze_note("Client was calm today.", refresh=True)
+        self.assertEqual(model_call.call_count, 3)
+        entry = AnalysisCacheEntry.objects.get()
+        self.assertEqual((entry.result, entry.hit_count), (first, 0))
+
+    def test_failed_results_are_not_cached(self):
+        with mock.patch('clients.analysis.chat_completion', side_effect=RuntimeError("down")):
+            analyze_note("Client was calm today.")
+        self.assertFalse(AnalysisCacheEntry.objects.exists())
+
+    @override_settings(AI_CACHE_MAX_ENTRIES=2)
+    def test_prune_evicts_least_recently_used(self):
+        for text in ("one", "two", "three"):
+            analyze_note(text)
+        analysis_cache.prune()
+        self.assertEqual(AnalysisCacheEntry.objects.count(), 2)
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_CACHE_ENABLED=False)
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+
+    def rows(self):
+        return "\n".join([
+            json.dumps({'care_client': self.care_client.pk, 'note_text': "Client was calm.", 'created_at': '2023-05-01T09:00:00'}),
+            json.dumps({'care_client': 999, 'note_text': "Unknown client."}),
+            "not json",
+            json.dumps({'care_client': self.care_client.pk, 'note_text': "Client was anxious."}),
+        ])
+
+    def test_inline_import_reports_row_errors_and_enriches(self):
+        importer = NoteImporter(created_by=self.user, chunk_size=2, enrich='inline')
+        report = importer.run(iter_rows(io.StringIO(self.rows()), 'jsonl'))
+
+        self.assertEqual(report['created'], 2)
+        self.assertEqual((report['enriched'], report['queued']), (2, 0))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3])
+        self.assertFalse(AnalysisJob.objects.exists())
+        self.assertEqual(ClientNote.objects.get(note_text="Client was calm.").created_at.year, 2023)
+
+    def test_resume_skips_committed_rows(self):
+        importer = NoteImporter(created_by=self.user, enrich='queue')
+        report = importer.run(iter_rows(io.StringIO(self.rows()), 'jsonl'), start_after=3)
+
+        self.assertEqual((report['created'], report['queued']), (1, 1))
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+    def test_repeated_rows_in_one_import_are_skipped(self):
+        rows = self.rows() + "\n" + self.rows()
+        report = NoteImporter(created_by=self.user, chunk_size=3, enrich='none').run(iter_rows(io.StringIO(rows), 'jsonl'))
+        self.assertEqual((report['created'], report['duplicates'], report['queued']), (2, 2, 0))
+        self.assertEqual(ClientNote.objects.count(), 2)
+
+    def test_interrupted_enrichment_is_checkpointed_and_a_rerun_does_not_duplicate(self):
+        checkpoints = []
+        importer = NoteImporter(created_by=self.user, chunk_size=10, enrich='inline',
+                                on_chunk=lambda report: checkpoints.append(report['last_line']))
+        with mock.patch('clients.importer.enrich_notes', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                importer.run(iter_rows(io.StringIO(self.rows()), 'jsonl'))
+        self.assertEqual(checkpoints, [4])
+        self.assertEqual(AnalysisJob.objects.count(), 2)
+
+        # Re-running the committed rows skips the dated note instead of importing it twice.
+        report = NoteImporter(created_by=self.user, enrich='queue').run(iter_rows(io.StringIO(self.rows()), 'jsonl'))
+        self.assertEqual((report['created'], report['duplicates']), (1, 1))
+        self.assertEqual(ClientNote.objects.filter(note_text="Client was calm.").count(), 1)
+
+    def test_rollups_are_rebuilt_once_per_client(self):
+        rows = "\n".join(
+            json.dumps({'care_client': self.care_client.pk, 'note_text': f"Day {day}.", 'created_at': f'2023-05-{day:02}T09:00:00'})
+            for day in range(1, 11)
+        )
+        with mock.patch('clients.rollups.refresh') as refresh, \
+                mock.patch('clients.rollups.rebuild', wraps=rollups.rebuild) as rebuild:
+            NoteImporter(created_by=self.user, chunk_size=3, enrich='none').run(iter_rows(io.StringIO(rows), 'jsonl'))
+        refresh.assert_not_called()
+        rebuild.assert_called_once_with(self.care_client.pk)
+        self.assertEqual(DailySentimentRollup.objects.filter(care_client=self.care_client).count(), 10)
+
+    def test_bulk_import_endpoint_accepts_csv(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        upload = SimpleUploadedFile('notes.csv', f"care_client,note_text\n{self.care_client.pk},Client ate well.\n".encode())
+        response = api.post('/api/clients/client-notes/bulk-import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(ClientNote.objects.get().analysis_status, 'Pending')
+
+
+class ClientNoteStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+
+    def add_note(self, sentiment, emotion_tags, care_client=None):
+        return ClientNote.objects.create(
+            care_client=care_client or self.care_client, created_by=self.user, note_text="Note.",
+            sentiment=sentiment, emotion_tags=emotion_tags,
+        )
+
+    def assertStatsMatchFullScan(self, care_client):
+        stored = ClientNoteStats.objects.get(care_client=care_client)
+        self.assertEqual(stats.differences(stored, stats.compute(care_client.id)), [])
+
+    def test_stats_follow_note_creates_updates_and_deletes(self):
+        first = self.add_note('Negative', {'anxiety': 0.8, 'sadness': 0.2})
+        self.add_note('Positive', {'anxiety': 0.1})
+        first.sentiment, first.emotion_tags = 'Neutral', {'sadness': 0.5}
+        first.save()
+        self.assertStatsMatchFullScan(self.care_client)
+
+        other = CareClient.objects.create(first_name='Bob', last_name='B', date_of_birth=date(1940, 1, 1), gender='Male')
+        first.care_client = other
+        first.save()
+        self.assertStatsMatchFullScan(self.care_client)
+        self.assertStatsMatchFullScan(other)
+
+        first.delete()
+        self.assertStatsMatchFullScan(other)
+        self.assertEqual(ClientNoteStats.objects.get(care_client=other).note_count, 0)
+
+    def test_delta_is_applied_to_a_row_built_concurrently(self):
+        create = stats._create
+
+        def built_concurrently(care_client_id):
+            # Another request built the row first, from a scan that did not see the new note.
+            ClientNoteStats.objects.create(care_client_id=care_client_id, note_count=0)
+            return create(care_client_id)
+
+        with mock.patch('clients.stats._create', side_effect=built_concurrently):
+            self.add_note('Negative', {'anxiety': 0.8})
+        self.assertEqual(ClientNoteStats.objects.get(care_client=self.care_client).note_count, 1)
+        self.assertStatsMatchFullScan(self.care_client)
+
+    def test_native_emotion_aggregation_matches_the_python_fallback(self):
+        self.add_note('Negative', {'anxiety': 0.75, 'sadness': 0.25})
+        self.add_note('Negative', {'anxiety': 0.25, 'fear': 1})
+        self.add_note('Neutral', {'anxiety': 'high', 'calm': True})
+        self.add_note('Neutral', ['anxiety'])
+        self.add_note('Positive', None)
+        notes = ClientNote.objects.filter(care_client=self.care_client)
+
+        native = stats.emotion_aggregates(notes)
+        self.assertEqual(native, stats.emotion_aggregates(notes, native=False))
+        self.assertEqual(native['anxiety'], {'sum': 1.0, 'count': 2, 'average': 0.5, 'max': 0.75})
+        self.assertEqual(set(native), {'anxiety', 'sadness', 'fear'})
+
+    def test_deleting_a_client_removes_its_stats(self):
+        self.add_note('Negative', {'anxiety': 0.8})
+        self.care_client.delete()
+        self.assertFalse(ClientNoteStats.objects.exists())
+
+    @mock.patch('clients.summaries.generate_analysis_summary', return_value="Summary.")
+    def test_distribution_endpoint_reads_the_stats_row(self, _):
+        self.add_note('Negative', {'anxiety': 0.75, 'sadness': 0.25})
+        self.add_note('Negative', {'anxiety': 0.25, 'sadness': 0.75})
+        stats.get_stats(self.care_client.pk)
+        ClientNoteStats.objects.update(analysis_summary="Summary.", summary_fingerprint=summaries.fingerprint(
+            [{'sentiment': 'Negative', 'count': 2}], {'anxiety': 0.5, 'sadness': 0.5}))
+        api = APIClient()
+        api.force_authenticate(self.user)
+
+        # The caseload's caregivers, the client and its stats
+        with self.assertNumQueries(3):
+            response = api.get(f'/api/clients/anaytics/client/{self.care_client.pk}/note-distribution/')
+
+        self.assertEqual(response.data['sentiment_distribution'], [{'sentiment': 'Negative', 'count': 2}])
+        self.assertEqual(response.data['emotion_distribution'], {'anxiety': 0.5, 'sadness': 0.5})
+
+
+class TrendsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.other_carer = User.objects.create_user(username='other', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.other_client = CareClient.objects.create(
+            first_name='Bob', last_name='Smith', date_of_birth=date(1940, 1, 1), gender='Male',
+            assigned_caregiver=self.other_carer,
+        )
+        # The user manages the other caregiver, so sees both clients.
+        team = CareTeam.objects.create(name='Team')
+        team.managers.add(self.user)
+        team.members.add(self.other_carer)
+        # Monday 2 and Wednesday 4 of one week, Monday 9 of the next.
+        self.monday = now().replace(year=2024, month=12, day=2, hour=12)
+
+    def add_note(self, days, sentiment, emotion_tags, care_client=None):
+        return ClientNote.objects.create(
+            care_client=care_client or self.care_client, created_by=self.user, note_text="Note.",
+            created_at=self.monday + timedelta(days=days), sentiment=sentiment, emotion_tags=emotion_tags,
+        )
+
+    def trends(self, **params):
+        params.setdefault('start', '2024-11-01')
+        params.setdefault('end', '2024-12-31')
+        response = self.api.get('/api/clients/anaytics/trends/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['buckets']
+
+    def test_weekly_buckets_for_a_client(self):
+        self.add_note(0, 'Positive', {})
+        self.add_note(2, 'Negative', {'anxiety': 0.8})
+        self.add_note(7, 'Negative', {'anxiety': 0.4, 'sadness': 0.6})
+        self.add_note(7, 'Negative', {'anxiety': 0.2})
+        self.add_note(0, 'Negative', {'anxiety': 1}, care_client=self.other_client)
+
+        buckets = self.trends(client=self.care_client.pk, interval='week')
+
+        self.assertEqual([bucket['period'] for bucket in buckets], [date(2024, 12, 2), date(2024, 12, 9)])
+        self.assertEqual(buckets[0]['sentiments'], {'Positive': 1, 'Negative': 1})
+        self.assertEqual(buckets[0]['emotions'], {'anxiety': {'mean': 0.8, 'notes': 1}})
+        self.assertEqual(buckets[1]['note_count'], 2)
+        self.assertEqual(buckets[1]['emotions']['anxiety'], {'mean': 0.3, 'notes': 2})
+
+        self.assertEqual(len(self.trends(client=self.care_client.pk, interval='day')), 3)
+        self.assertEqual(self.trends(caregiver=self.other_carer.pk, interval='month')[0]['note_count'], 1)
+        self.assertEqual(self.trends(interval='month')[0]['note_count'], 5)
+
+    def test_rollups_follow_note_changes(self):
+        note = self.add_note(0, 'Negative', {'anxiety': 0.8})
+        note.sentiment, note.emotion_tags = 'Neutral', {'sadness': 0.5}
+        note.save()
+        moved = self.add_note(0, 'Positive', {})
+        moved.created_at = self.monday + timedelta(days=1)
+        moved.save()
+        self.add_note(3, 'Negative', {}).delete()
+
+        days = self.trends(client=self.care_client.pk, interval='day')
+        self.assertEqual([(bucket['period'], bucket['sentiments']) for bucket in days], [
+            (date(2024, 12, 2), {'Neutral': 1}), (date(2024, 12, 3), {'Positive': 1}),
+        ])
+        self.assertEqual(days[0]['emotions'], {'sadness': {'mean': 0.5, 'notes': 1}})
+
+        DailySentimentRollup.objects.all().delete()
+        DailyEmotionRollup.objects.all().delete()
+        rollups.rebuild(self.care_client.pk)
+        self.assertEqual(self.trends(client=self.care_client.pk, interval='day'), days)
+
+    def test_invalid_parameters(self):
+        for params in ({'interval': 'year'}, {'client': 'abc'}, {'start': '2024-02-30'}, {'start': '2025-01-01'}):
+            response = self.api.get('/api/clients/anaytics/trends/', {'end': '2024-12-31', **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+class RiskDashboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        other = User.objects.create_user(username='other', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.clients = {
+            name: CareClient.objects.create(first_name=name, last_name='Client', date_of_birth=date(1940, 1, 1),
+                                            gender='Female', assigned_caregiver=carer)
+            for name, carer in [('Calm', self.user), ('Low', self.user), ('Flagged', other), ('Quiet', other)]
+        }
+        team = CareTeam.objects.create(name='Team')
+        team.managers.add(self.user)
+        team.members.add(other)
+        self.add_note('Calm', 'Positive', {})
+        self.add_note('Calm', 'Negative', {'hopelessness': 0.3})
+        self.add_note('Low', 'Negative', {'hopelessness': 0.9, 'anger': 1.0})
+        self.add_note('Low', 'Negative', {'fear': 0.4})
+        self.add_note('Flagged', 'Negative', {}, "Identified risks: the client talked about self-harm.")
+        self.add_note('Flagged', 'Negative', {'loneliness': 0.5})
+        # Outside the 30-day window
+        self.add_note('Quiet', 'Negative', {'hopelessness': 1.0}, days_ago=60)
+
+    def add_note(self, name, sentiment, emotion_tags, evaluation="Identified risks: none identified.", days_ago=0):
+        ClientNote.objects.create(
+            care_client=self.clients[name], created_by=self.user, note_text="Note.", sentiment=sentiment,
+            emotion_tags=emotion_tags, ai_evaluated_notes=evaluation, created_at=now() - timedelta(days=days_ago),
+        )
+
+    def test_clients_are_ranked_by_recent_risk_in_one_query_per_page(self):
+        # The caseload's caregivers, the count and the page
+        with self.assertNumQueries(3):
+            response = self.api.get('/api/clients/anaytics/risk-dashboard/')
+
+        self.assertEqual(response.data['count'], 4)
+        results = response.data['results']
+        self.assertEqual([row['first_name'] for row in results], ['Low', 'Flagged', 'Calm', 'Quiet'])
+        self.assertEqual([row['rank'] for row in results], [1, 2, 3, 4])
+        self.assertEqual((results[0]['negative_ratio'], results[0]['peak_emotion'], results[0]['peak_emotion_score']),
+                         (1.0, 'hopelessness', 0.9))
+        self.assertEqual(results[1]['flagged_notes'], 1)
+        self.assertEqual((results[2]['negative_ratio'], results[2]['recent_notes']), (0.5, 2))
+        self.assertEqual((results[3]['recent_notes'], results[3]['peak_emotion']), (0, None))
+
+    def test_filters_and_pages(self):
+        response = self.api.get('/api/clients/anaytics/risk-dashboard/', {'mine': 'true', 'page_size': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(response.data['results'][0]['first_name'], 'Low')
+        self.assertEqual(self.api.get(response.data['next']).data['results'][0]['rank'], 2)
+
+        response = self.api.get('/api/clients/anaytics/risk-dashboard/', {'days': 90})
+        self.assertEqual(response.data['results'][0]['first_name'], 'Quiet')
+        self.assertEqual(self.api.get('/api/clients/anaytics/risk-dashboard/', {'days': 0}).status_code, 400)
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0)
+class AnalysisSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Lovelace', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.url = f'/api/clients/anaytics/client/{self.care_client.pk}/note-distribution/'
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.add_note('Negative', {'anxiety': 0.8})
+
+    def add_note(self, sentiment, emotion_tags):
+        ClientNote.objects.create(
+            care_client=self.care_client, created_by=self.user, note_text="Note.",
+            sentiment=sentiment, emotion_tags=emotion_tags,
+        )
+
+    def test_summary_is_generated_once_while_notes_are_unchanged(self):
+        with mock.patch('clients.summaries.text_completion', wraps=text_completion) as model_call:
+            first = self.api.get(self.url)
+            second = self.api.get(self.url)
+
+        self.assertEqual(model_call.call_count, 1)
+        self.assertEqual(first.data['analysis_summary'], second.data['analysis_summary'])
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.api.get(self.url)['ETag']
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.add_note('Positive', {})
+        self.assertEqual(self.api.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stale_summary_is_served_while_refreshing_in_the_background(self):
+        self.api.get(self.url)
+        ClientNoteStats.objects.update(analysis_summary="Previous summary.")
+        self.add_note('Positive', {})
+
+        with mock.patch('clients.summaries.schedule_refresh') as schedule_refresh:
+            response = self.api.get(self.url)
+
+        self.assertEqual(response.data['analysis_summary'], "Previous summary.")
+        schedule_refresh.assert_called_once()
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0.3, FAKE_LLM_FIRST_TOKEN_LATENCY=0.02)
+class StreamingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.note = ClientNote.objects.create(
+            care_client=self.care_client, created_by=self.user, note_text="Client fell and was crying.",
+            sentiment='Negative', emotion_tags={'sadness': 0.6},
+        )
+
+    async def stream(self, url, method='get'):
+        """The stream's events as (event, data) pairs, and the seconds until the first token."""
+        start = time.perf_counter()
+        response = await getattr(self.async_client, method)(url, headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events, first_token = [], None
+        async for chunk in response.streaming_content:
+            for block in chunk.decode('utf-8').split('\n\n'):
+                lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+                if 'event' in lines:
+                    if first_token is None and lines['event'] == 'token':
+                        first_token = time.perf_counter() - start
+                    events.append((lines['event'], json.loads(lines['data'])))
+        return events, first_token
+
+    async def test_safeguarding_evaluation_streams_tokens_then_saves_the_text(self):
+        events, first_token = await self.stream(f'/api/clients/stream/client-notes/{self.note.pk}/safeguarding/', 'post')
+
+        self.assertLess(first_token, 0.2)
+        tokens = [data['text'] for event, data in events if event == 'token']
+        self.assertGreater(len(tokens), 5)
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual("".join(tokens).strip(), events[-1][1]['text'])
+        self.assertIn('fell', events[-1][1]['text'])
+        note = await ClientNote.objects.aget(pk=self.note.pk)
+        self.assertEqual((note.ai_evaluated_notes, note.analysis_version), (events[-1][1]['text'], PROMPT_VERSION))
+
+    async def test_safeguarding_stream_is_a_post_and_saves_nothing_without_text(self):
+        url = f'/api/clients/stream/client-notes/{self.note.pk}/safeguarding/'
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+        async def nothing():
+            for piece in ("", "  "):
+                yield piece
+
+        with mock.patch('clients.streaming.stream_chat_completion', return_value=nothing()):
+            events, _ = await self.stream(url, 'post')
+        self.assertEqual(events[-1], ('error', {'error': SAFEGUARDING_FALLBACK}))
+        note = await ClientNote.objects.aget(pk=self.note.pk)
+        self.assertIsNone(note.ai_evaluated_notes)
+
+    async def test_summary_is_streamed_once_then_served_from_storage(self):
+        url = f'/api/clients/stream/client/{self.care_client.pk}/analysis-summary/'
+        events, _ = await self.stream(url)
+        summary = events[-1][1]['text']
+        note_stats = await ClientNoteStats.objects.aget(care_client=self.care_client)
+        self.assertEqual(note_stats.analysis_summary, summary)
+
+        with mock.patch('clients.streaming.stream_text_completion') as model:
+            events, _ = await self.stream(url)
+        model.assert_not_called()
+        self.assertEqual(events, [('token', {'text': summary}), ('done', {'text': summary})])
+
+    async def test_requires_a_valid_token(self):
+        self.headers = {'Authorization': 'Bearer nonsense'}
+        response = await self.async_client.post(f'/api/clients/stream/client-notes/{self.note.pk}/safeguarding/',
+                                                headers=self.headers)
+        self.assertEqual(response.status_code, 401)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.other = CareClient.objects.create(
+            first_name='Bob', last_name='Smith', date_of_birth=date(1941, 1, 1), gender='Male',
+            assigned_caregiver=self.user,
+        )
+        for i in range(250):
+            ClientNote.objects.create(
+                care_client=self.care_client, created_by=self.user, note_text=f"Note {i}, with a comma.",
+                sentiment='Negative', emotion_tags={'anxiety': 0.5}, ai_evaluated_notes="Identified risks: none.",
+            )
+
+    def download(self, url, **kwargs):
+        response = self.api.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_jsonl_and_csv_exports(self):
+        lines = self.download(f'/api/clients/careclients/{self.care_client.pk}/export/jsonl/').decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(records[0]['record'], 'client')
+        self.assertEqual(records[0]['last_name'], 'Jones')
+        self.assertEqual(len(records), 251)
+        self.assertEqual(records[1]['note_text'], "Note 0, with a comma.")
+        self.assertEqual(records[1]['emotion_tags'], {'anxiety': 0.5})
+        self.assertEqual(records[1]['created_by'], 'carer')
+
+        rows = list(csv.DictReader(io.StringIO(
+            self.download(f'/api/clients/careclients/{self.care_client.pk}/export/csv/').decode())))
+        self.assertEqual(len(rows), 250)
+        self.assertEqual((rows[-1]['client_name'], rows[-1]['note_text']), ('Ada Jones', "Note 249, with a comma."))
+        self.assertEqual(json.loads(rows[0]['emotion_tags']), {'anxiety': 0.5})
+
+    def test_zip_bundle_and_organisation_export(self):
+        bundle = zipfile.ZipFile(io.BytesIO(self.download(f'/api/clients/careclients/{self.care_client.pk}/export/zip/')))
+        self.assertEqual(bundle.namelist(), ['client.json', 'notes.csv', 'notes.jsonl'])
+        self.assertEqual(json.loads(bundle.read('client.json'))['first_name'], 'Ada')
+        self.assertEqual(len(bundle.read('notes.jsonl').splitlines()), 251)
+
+        self.assertEqual(self.api.get('/api/clients/careclients/export/csv/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        archive = zipfile.ZipFile(io.BytesIO(self.download('/api/clients/careclients/export/jsonl/')))
+        self.assertEqual(archive.namelist(), [f'client-{self.care_client.pk}.jsonl', f'client-{self.other.pk}.jsonl'])
+        self.assertEqual(len(archive.read(f'client-{self.other.pk}.jsonl').splitlines()), 1)
+
+    def test_command_writes_one_file_per_client(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_care_records', format='csv', output_dir=directory, stdout=io.StringIO())
+            with open(f'{directory}/client-{self.care_client.pk}.csv') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 250)
+            with open(f'{directory}/client-{self.other.pk}.csv') as f:
+                self.assertEqual(list(csv.DictReader(f)), [])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.other_user = User.objects.create_user(username='nurse', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        self.other = CareClient.objects.create(
+            first_name='Bob', last_name='Smith', date_of_birth=date(1941, 1, 1), gender='Male',
+            assigned_caregiver=self.user,
+        )
+        self.fall = ClientNote.objects.create(
+            care_client=self.care_client, created_by=self.user, sentiment='Negative',
+            note_text="Ada fell in the garden <again> and was falling asleep at lunch. Another fall.",
+            ai_evaluated_notes="Identified risks: falls.",
+        )
+        self.evaluation = ClientNote.objects.create(
+            care_client=self.other, created_by=self.other_user, sentiment='Neutral',
+            note_text="Bob had a quiet morning.", ai_evaluated_notes="Identified risks: a fall on the stairs last week.",
+        )
+        self.garden = ClientNote.objects.create(
+            care_client=self.other, created_by=self.user, sentiment='Positive',
+            note_text="Bob enjoyed the garden.", ai_evaluated_notes="Identified risks: none.",
+        )
+
+    def results(self, **params):
+        response = self.api.get('/api/clients/client-notes/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, **params):
+        return [note['id'] for note in self.results(**params)['results']]
+
+    def test_ranks_stems_and_highlights(self):
+        if not search.fts_available('default'):
+            self.skipTest("SQLite FTS5 unavailable")
+        body = self.results(q='falls')
+        self.assertEqual([note['id'] for note in body['results']], [self.fall.pk, self.evaluation.pk])
+        top = body['results'][0]
+        self.assertIn('<mark>falling</mark>', top['note_text_highlight'])
+        self.assertIn('&lt;again&gt;', top['note_text_highlight'])
+        self.assertIn('<mark>falls</mark>', top['ai_evaluated_notes_highlight'])
+        self.assertNotIn('note_text', top)
+
+    def test_phrases_exclusions_and_filters(self):
+        self.assertEqual(self.ids(q='"quiet morning"'), [self.evaluation.pk])
+        self.assertEqual(self.ids(q='garden -fall'), [self.garden.pk])
+        self.assertEqual(self.ids(q='garden', care_client=self.care_client.pk), [self.fall.pk])
+        self.assertEqual(self.ids(q='fall', created_by=self.other_user.pk), [self.evaluation.pk])
+        self.assertEqual(self.ids(q='garden', sentiment='Positive'), [self.garden.pk])
+        self.assertEqual(set(self.ids(q='garden', order='recent')), {self.fall.pk, self.garden.pk})
+
+        self.assertEqual(self.api.get('/api/clients/client-notes/search/').status_code, 400)
+        self.assertEqual(self.api.get('/api/clients/client-notes/search/', {'q': 'x', 'order': 'best'}).status_code, 400)
+
+    def test_pages(self):
+        first = self.results(q='identified', page_size=2, order='recent')
+        self.assertEqual(len(first['results']), 2)
+        self.assertIsNotNone(first['next'])
+        self.assertIsNone(first['previous'])
+        second = self.api.get(first['next']).json()
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+        self.assertEqual(len({note['id'] for note in first['results'] + second['results']}), 3)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.garden.note_text = "Bob painted watercolours."
+        self.garden.save()
+        self.assertEqual(self.ids(q='watercolours'), [self.garden.pk])
+        self.assertEqual(self.ids(q='garden'), [self.fall.pk])
+
+        self.garden.delete()
+        self.assertEqual(self.ids(q='watercolours'), [])
+
+        rows = json.dumps({'care_client': self.other.pk, 'note_text': "Bob went swimming."})
+        NoteImporter(created_by=self.user).run(iter_rows(io.StringIO(rows), 'jsonl'))
+        self.assertEqual(len(self.ids(q='swimming')), 1)
+
+    def test_rebuild_command(self):
+        if not search.fts_available('default'):
+            self.skipTest("SQLite FTS5 unavailable")
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self.ids(q='garden'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(set(self.ids(q='garden')), {self.fall.pk, self.garden.pk})
+
+
+@override_settings(AI_EMBEDDING_BACKEND='hashing', AI_EMBEDDING_DIMENSIONS=256, AI_EMBEDDING_ANN_THRESHOLD=50000)
+class SimilarNotesTests(TestCase):
+    def setUp(self):
+        embeddings._indexes.clear()
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.ada, self.bob = (
+            CareClient.objects.create(first_name=name, last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+                                      assigned_caregiver=self.user)
+            for name in ('Ada', 'Bob')
+        )
+        texts = {
+            'fall': (self.ada, 'Negative', "Client fell in the bathroom and has a bruise on her left arm."),
+            'ada_meal': (self.ada, 'Positive', "Client enjoyed her lunch and chatted with family."),
+            'bob_fall': (self.bob, 'Negative', "Client had a fall in the bathroom, bruise on left arm, refused pain relief."),
+            'bob_meal': (self.bob, 'Positive', "Client enjoyed lunch in the garden."),
+        }
+        self.notes = {
+            key: ClientNote.objects.create(care_client=client, created_by=self.user, sentiment=sentiment, note_text=text)
+            for key, (client, sentiment, text) in texts.items()
+        }
+        embeddings.store_embeddings(list(self.notes.values()))
+
+    def similar(self, key, **params):
+        response = self.api.get(f'/api/clients/client-notes/{self.notes[key].pk}/similar/', params)
+        self.assertEqual(response.status_code, 200)
+        return [note['id'] for note in response.json()['results']]
+
+    def test_hashing_embedder(self):
+        embedder = embeddings.get_embedder()
+        vectors = embedder.embed(["Fell in the bathroom.", "A fall in the bathroom!", "Enjoyed lunch.", ""])
+        self.assertEqual(vectors.shape, (4, 256))
+        self.assertAlmostEqual(float(vectors[0] @ vectors[0]), 1.0, places=5)
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+        self.assertFalse(vectors[3].any())
+        stored = NoteEmbedding.objects.get(note=self.notes['fall'])
+        self.assertEqual(stored.model, 'hashing-v1-256')
+        self.assertEqual(len(bytes(stored.vector)), 256 * 4)
+
+    def test_similar_notes_across_clients(self):
+        ranked = self.similar('fall')
+        self.assertEqual(ranked[0], self.notes['bob_fall'].pk)
+        self.assertNotIn(self.notes['fall'].pk, ranked)
+
+        self.assertNotIn(self.notes['ada_meal'].pk, self.similar('fall', other_clients='true'))
+        self.assertEqual(self.similar('bob_meal', sentiment='Positive'), [self.notes['ada_meal'].pk])
+        self.assertEqual(len(self.similar('fall', limit=1)), 1)
+
+        hit = self.api.get(f"/api/clients/client-notes/{self.notes['fall'].pk}/similar/", {'limit': 1}).json()['results'][0]
+        self.assertEqual(hit['excerpt'], self.notes['bob_fall'].note_text)
+        self.assertNotIn('note_text', hit)
+
+    def test_index_follows_new_and_deleted_notes(self):
+        self.assertEqual(self.similar('bob_meal', limit=1), [self.notes['ada_meal'].pk])
+        garden = ClientNote.objects.create(care_client=self.ada, created_by=self.user, note_text="Enjoyed lunch in the garden.")
+        embeddings.store_embeddings([garden])
+        self.assertEqual(self.similar('bob_meal', limit=1), [garden.pk])
+
+        garden.delete()
+        self.assertEqual(self.similar('bob_meal', limit=1), [self.notes['ada_meal'].pk])
+
+    @override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_ANALYSIS_MODE='sync', AI_CACHE_ENABLED=False)
+    def test_enrichment_embeds_notes(self):
+        response = self.api.post('/api/clients/client-notes/', {
+            'care_client': self.bob.pk, 'note_text': "Client fell in the bathroom, bruise on left arm.",
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(NoteEmbedding.objects.filter(note_id=response.data['id']).exists())
+        self.assertEqual(self.similar('fall', limit=1), [response.data['id']])
+
+    def test_ann_index(self):
+        try:
+            import hnswlib  # noqa: F401
+        except ImportError:
+            self.skipTest("hnswlib not installed")
+        with override_settings(AI_EMBEDDING_ANN_THRESHOLD=1):
+            self.assertEqual(self.similar('fall')[0], self.notes['bob_fall'].pk)
+            self.assertIsInstance(embeddings._indexes['default', 'hashing-v1-256'].index, embeddings.HNSWIndex)
+            self.assertEqual(self.similar('bob_meal', sentiment='Positive'), [self.notes['ada_meal'].pk])
+
+    def test_exact_search_without_hnswlib(self):
+        with override_settings(AI_EMBEDDING_ANN_THRESHOLD=1), mock.patch.dict('sys.modules', {'hnswlib': None}):
+            with self.assertLogs('clients.embeddings', 'WARNING'):
+                self.assertEqual(self.similar('fall')[0], self.notes['bob_fall'].pk)
+            self.assertIsInstance(embeddings._indexes['default', 'hashing-v1-256'].index, embeddings.BruteForceIndex)
+
+    def test_rebuild_command(self):
+        NoteEmbedding.objects.filter(note=self.notes['fall']).delete()
+        NoteEmbedding.objects.filter(note=self.notes['bob_fall']).update(model='retired-model')
+        call_command('rebuild_embeddings', missing=True, stdout=io.StringIO())
+        self.assertEqual(NoteEmbedding.objects.filter(model='hashing-v1-256').count(), 4)
+        self.assertFalse(NoteEmbedding.objects.exclude(model='hashing-v1-256').exists())
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        for i, last_name in enumerate(['Smith', 'Jones', 'Smith', 'Brown', 'Smith']):
+            CareClient.objects.create(
+                first_name=f'Client{i % 2}', last_name=last_name, date_of_birth=date(1940, 1, 1), gender='Female',
+                care_status='Inactive' if i == 3 else 'Active', assigned_caregiver=self.user,
+            )
+        self.care_client = CareClient.objects.get(last_name='Jones')
+        moment = now()
+        for i in range(5):
+            note = ClientNote.objects.create(
+                care_client=self.care_client, created_by=self.user, note_text=f"Note {i}.",
+                sentiment='Negative' if i % 2 else 'Positive',
+            )
+            # Two notes share a timestamp so the id tie-breaker is exercised.
+            ClientNote.objects.filter(pk=note.pk).update(created_at=moment - timedelta(days=i // 2))
+
+    def walk(self, url):
+        pages, seen = [], []
+        while url:
+            data = self.api.get(url).data
+            pages.append(data)
+            seen.extend(data['results'])
+            url = data['next']
+        return pages, seen
+
+    def test_clients_are_paged_by_name_without_gaps_or_duplicates(self):
+        pages, clients = self.walk('/api/clients/careclients/?page_size=2')
+
+        self.assertEqual(len(pages), 3)
+        expected = list(CareClient.objects.order_by('last_name', 'first_name', 'id').values_list('id', flat=True))
+        self.assertEqual([client['id'] for client in clients], expected)
+
+        previous = self.api.get(pages[2]['previous']).data
+        self.assertEqual(previous['results'], pages[1]['results'])
+
+    def test_client_notes_are_paged_newest_first(self):
+        _, notes = self.walk(f'/api/clients/client-notes/{self.care_client.pk}/notes/?page_size=2')
+        expected = list(ClientNote.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([note['id'] for note in notes], expected)
+
+    def test_filters(self):
+        response = self.api.get('/api/clients/careclients/?care_status=Inactive')
+        self.assertEqual([client['last_name'] for client in response.data['results']], ['Brown'])
+
+        response = self.api.get(f'/api/clients/client-notes/?sentiment=Negative&created_after={now().date()}')
+        self.assertEqual(len(response.data['results']), 1)
+
+        self.assertEqual(self.api.get('/api/clients/client-notes/?sentiment=Angry').status_code, 400)
+        for value in ('yesterday', '2024-02-30', '2024-02-30T10:00:00'):
+            response = self.api.get('/api/clients/client-notes/', {'created_after': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('created_after', response.data)
+        self.assertEqual(self.api.get('/api/clients/client-notes/?cursor=nonsense').status_code, 404)
+
+    def test_seek_starts_at_the_cursor_in_the_index(self):
+        pagination = ClientNoteKeysetPagination()
+        note = ClientNote.objects.order_by('-created_at', '-id')[2]
+        seek = pagination._seek(list(pagination.ordering), {'created_at': note.created_at, 'id': note.pk})
+        notes = ClientNote.objects.filter(seek).order_by(*pagination.ordering)
+
+        self.assertEqual(list(notes), list(ClientNote.objects.order_by('-created_at', '-id')[3:]))
+        if connections['default'].vendor == 'sqlite':
+            self.assertIn('SEARCH', notes.explain())
+
+
+class ListEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.api = APIClient()
+        # A token rather than force_authenticate, so every request loads the user (and its caseload) afresh.
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user, care_notes="Long care plan. " * 100,
+        )
+
+    def add_notes(self, count, note_text="Short note."):
+        start = User.objects.count()
+        authors = [User.objects.create_user(username=f'author{start + i}') for i in range(count)]
+        return [ClientNote.objects.create(care_client=self.care_client, created_by=author, note_text=note_text,
+                                          ai_evaluated_notes="Identified risks: none.") for author in authors]
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def test_note_lists_make_the_same_queries_for_any_number_of_authors(self):
+        for url in ('/api/clients/client-notes/', f'/api/clients/client-notes/{self.care_client.pk}/notes/'):
+            with self.subTest(url=url):
+                ClientNote.objects.all().delete()
+                self.add_notes(2)
+                _, few = self.get(url)
+                self.add_notes(15)
+                response, many = self.get(url)
+
+                self.assertEqual(len(response.data['results']), 17)
+                self.assertEqual(len(many), len(few))
+                self.assertNotIn('ai_evaluated_notes', ' '.join(query['sql'] for query in many))
+
+    def test_note_list_returns_excerpts_and_the_detail_the_full_note(self):
+        note = self.add_notes(1, note_text="Word " * 100)[0]
+
+        row = self.get('/api/clients/client-notes/')[0].data['results'][0]
+        self.assertEqual(len(row['excerpt']), 200)
+        self.assertTrue(row['excerpt'].endswith('…'))
+        self.assertEqual(row['created_by_username'], note.created_by.username)
+        self.assertNotIn('note_text', row)
+        self.assertNotIn('ai_evaluated_notes', row)
+
+        detail = self.get(f'/api/clients/client-notes/{note.pk}/')[0].data
+        self.assertEqual(detail['note_text'], note.note_text)
+        self.assertEqual(detail['ai_evaluated_notes'], "Identified risks: none.")
+
+    def test_client_list_returns_summaries(self):
+        response, queries = self.get('/api/clients/careclients/')
+
+        # The user, the caseload's caregivers and the page
+        self.assertEqual(len(queries), 3)
+        [ada] = response.data['results']
+        self.assertEqual(ada['assigned_caregiver_username'], 'carer')
+        self.assertNotIn('care_notes', ada)
+        self.assertIn('care_notes', self.get(f'/api/clients/careclients/{self.care_client.pk}/')[0].data)
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_CACHE_ENABLED=False)
+class CaseloadAccessTests(TestCase):
+    def setUp(self):
+        self.carer = User.objects.create_user(username='carer', password='secret')
+        self.nurse = User.objects.create_user(username='nurse', password='secret')
+        self.manager = User.objects.create_user(username='manager', password='secret')
+        team = CareTeam.objects.create(name='Day shift')
+        team.managers.add(self.manager)
+        team.members.add(self.carer)
+        self.ada, self.bob, self.cy = (
+            CareClient.objects.create(first_name=name, last_name='Jones', date_of_birth=date(1940, 1, 1),
+                                      gender='Female', assigned_caregiver=carer)
+            for name, carer in [('Ada', self.carer), ('Bob', self.nurse), ('Cy', self.manager)]
+        )
+        self.notes = {
+            care_client.first_name: ClientNote.objects.create(care_client=care_client, created_by=self.carer,
+                                                              note_text="Client was calm.")
+            for care_client in (self.ada, self.bob, self.cy)
+        }
+
+    def api(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api
+
+    def visible(self, user):
+        api = self.api(user)
+        clients = [row['first_name'] for row in api.get('/api/clients/careclients/').data['results']]
+        notes = sorted(row['id'] for row in api.get('/api/clients/client-notes/').data['results'])
+        return clients, notes
+
+    def test_lists_are_scoped_to_the_caseload(self):
+        notes = self.notes
+        self.assertEqual(self.visible(self.carer), (['Ada'], [notes['Ada'].pk]))
+        self.assertEqual(self.visible(self.nurse), (['Bob'], [notes['Bob'].pk]))
+        # A manager sees their team's clients as well as their own
+        self.assertEqual(self.visible(self.manager), (['Ada', 'Cy'], [notes['Ada'].pk, notes['Cy'].pk]))
+        self.nurse.is_staff = True
+        self.assertEqual(self.visible(self.nurse), (['Ada', 'Bob', 'Cy'], sorted(note.pk for note in notes.values())))
+
+    def test_the_caseload_is_an_indexed_filter(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.api(self.carer).get('/api/clients/careclients/')
+        self.assertIn(f'"assigned_caregiver_id" IN ({self.carer.pk})', queries[-1]['sql'])
+
+    def test_other_caseloads_are_not_found(self):
+        api = self.api(self.carer)
+        for url in (f'/api/clients/careclients/{self.bob.pk}/', f'/api/clients/client-notes/{self.notes["Bob"].pk}/',
+                    f'/api/clients/client-notes/{self.bob.pk}/notes/',
+                    f'/api/clients/anaytics/client/{self.bob.pk}/note-distribution/'):
+            self.assertEqual(api.get(url).status_code, 404, url)
+
+        response = api.post('/api/clients/client-notes/', {'care_client': self.bob.pk, 'note_text': "Calm day."})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(api.post('/api/clients/client-notes/', {'care_client': self.ada.pk, 'note_text': "Calm day."})
+                         .status_code, 201)
+        self.assertEqual(APIClient().get('/api/clients/client-notes/').status_code, 401)
+
+    def test_editing_a_client_keeps_its_caregiver_unless_reassigned(self):
+        api = self.api(self.manager)
+        url = f'/api/clients/careclients/{self.ada.pk}/'
+        response = api.patch(url, {'care_status': 'Inactive'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assigned_caregiver'], self.carer.pk)
+        self.assertEqual(self.visible(self.carer)[0], ['Ada'])
+
+        self.assertEqual(api.patch(url, {'assigned_caregiver': self.nurse.pk}).status_code, 400)
+        self.assertEqual(api.patch(url, {'assigned_caregiver': self.manager.pk}).status_code, 200)
+        self.assertEqual(self.visible(self.carer)[0], [])
+
+
+@override_settings(DB_READ_REPLICA='replica', AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    # A transaction test: reads inside a transaction on the primary are kept there.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='carer', password='secret')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.care_client = CareClient.objects.create(
+            first_name='Ada', last_name='Jones', date_of_birth=date(1940, 1, 1), gender='Female',
+            assigned_caregiver=self.user,
+        )
+        ClientNote.objects.create(care_client=self.care_client, created_by=self.user, note_text="Quiet day.")
+
+    def queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.api, method)(url, **kwargs)
+        return response, [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_read_heavy_endpoints_read_from_the_replica(self):
+        for url in ['/api/clients/careclients/', '/api/clients/client-notes/',
+                    f'/api/clients/client-notes/{self.care_client.pk}/notes/',
+                    f'/api/clients/anaytics/client/{self.care_client.pk}/note-distribution/']:
+            response, primary, replica = self.queries('get', url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(replica, url)
+            self.assertFalse([sql for sql in primary if sql.startswith('SELECT')], url)
+
+    def test_writes_and_detail_reads_use_the_primary(self):
+        response, primary, replica = self.queries('post', '/api/clients/careclients/', data={
+            'first_name': 'Bea', 'last_name': 'Smith', 'date_of_birth': '1941-02-03', 'gender': 'Female',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(primary)
+        self.assertEqual(replica, [])
+
+        response, primary, replica = self.queries('get', f"/api/clients/careclients/{response.data['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, [])
+
+    def test_reads_inside_a_transaction_stay_on_the_primary(self):
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(ClientNote), 'replica')
+            self.assertEqual(router.db_for_write(ClientNote), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(ClientNote), 'default')
+        self.assertEqual(router.db_for_read(ClientNote), 'default')
+
+
+@override_settings(AI_ANALYSIS_BACKEND='fake', FAKE_LLM_LATENCY=0, AI_CACHE_ENABLED=False,
+                   AI_SUMMARY_BACKGROUND_REFRESH=False, METRICS_LOG_REQUESTS=False)
+class LoadTestTests(TransactionTestCase):
+    # A transaction test: the load runs in other threads, which must see the seeded data.
+
+    def test_load_run_reports_every_scenario(self):
+        caregivers, care_clients = seed_dataset(clients=3, notes_per_client=5, caregivers=2)
+        # One thread: the shared in-memory test database can't take concurrent writes (load_test uses a file).
+        samples, wall_seconds = loadtest.run_load(caregivers, care_clients, requests=40, concurrency=1)
+        report = loadtest.summarise(samples, wall_seconds)
+
+        self.assertEqual(report['all']['requests'], 40)
+        self.assertEqual(report['all']['errors'], 0)
+        self.assertLessEqual(set(report) - {'all'}, set(loadtest.SCENARIOS))
+        for row in report.values():
+            self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+            self.assertLessEqual(row['p95_ms'], row['p99_ms'])
+            self.assertGreater(row['queries'], 0)
+
+    def test_regressions_against_the_baseline(self):
+        baseline = {'list_notes': {'p95_ms': 10.0, 'throughput_rps': 100.0, 'queries': 2.0, 'errors': 0}}
+        same = {'list_notes': {'p95_ms': 11.0, 'throughput_rps': 95.0, 'queries': 2.0, 'errors': 0}}
+        slower = {'list_notes': {'p95_ms': 20.0, 'throughput_rps': 50.0, 'queries': 5.0, 'errors': 1}}
+
+        self.assertEqual(loadtest.compare(same, baseline), [])
+        self.assertEqual(len(loadtest.compare(slower, baseline)), 4)
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(loadtest.percentile([1, 2, 3, 4, 5], 95), 4.8)
+
+    def test_fake_latency_distributions(self):
+        with override_settings(FAKE_LLM_LATENCY=0.2, FAKE_LLM_LATENCY_SPREAD=0.5):
+            with override_settings(FAKE_LLM_LATENCY_DISTRIBUTION='uniform'):
+                self.assertTrue(all(0.1 <= fake_llm.sample_latency() <= 0.3 for _ in range(100)))
+            with override_settings(FAKE_LLM_LATENCY_DISTRIBUTION='lognormal'):
+                fake_llm.seed_latency(1)
+                first = [fake_llm.sample_latency() for _ in range(200)]
+                fake_llm.seed_latency(1)
+                self.assertEqual(first, [fake_llm.sample_latency() for _ in range(200)])
+                self.assertAlmostEqual(loadtest.percentile(first, 50), 0.2, delta=0.03)
+                self.assertGreater(max(first), 0.4)
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CareClientViewSet, ClientNoteViewSet,ClientNoteDistributionAPIView
+from . import streaming
+from .views import CareClientViewSet, ClientNoteViewSet,ClientNoteDistributionAPIView, ClientNoteTrendsAPIView, RiskDashboardAPIView
 
 router = DefaultRouter()
 router.register('careclients', CareClientViewSet)
@@ -9,4 +10,9 @@ router.register('client-notes', ClientNoteViewSet, basename='client-notes')
 urlpatterns = [
     path('', include(router.urls)),
     path('anaytics/client/<int:client_id>/note-distribution/', ClientNoteDistributionAPIView.as_view(), name='client_note_distribution'),
+    path('anaytics/trends/', ClientNoteTrendsAPIView.as_view(), name='note_trends'),
+    path('anaytics/risk-dashboard/', RiskDashboardAPIView.as_view(), name='risk_dashboard'),
+    # Server-sent events; serve these through backend.asgi
+    path('stream/client-notes/<int:pk>/safeguarding/', streaming.stream_safeguarding, name='stream_safeguarding'),
+    path('stream/client/<int:client_id>/analysis-summary/', streaming.stream_analysis_summary, name='stream_analysis_summary'),
 ]
@@ -1,14 +1,25 @@
 from rest_framework import viewsets, permissions
-from .serializers import CareClientSerializer,  ClientNoteSerializer
+from .serializers import (CareClientListSerializer, CareClientSerializer, ClientNoteListSerializer, ClientNoteSerializer,
+                          NoteSearchResultSerializer, SimilarNoteSerializer)
 from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db.models import Count
-from .models import CareClient, ClientNote
-import openai
-from django.conf import settings
+from django.utils.dateparse import parse_date
+from django.utils.timezone import localdate
+from datetime import timedelta
+from .models import CareClient, CareStatusChoices, ClientNote
+from .importer import FORMATS, NoteImporter, iter_rows
+from . import exporter
+from django.db import router
+from django.http import StreamingHttpResponse
+from .filters import CareClientFilterBackend, ClientNoteFilterBackend
+from .pagination import CareClientKeysetPagination, ClientNoteKeysetPagination, RiskDashboardPagination
+from . import access, embeddings, rollups, search, stats, summaries
+from backend.db_router import ReplicaReadMixin
+from rest_framework.utils.urls import replace_query_param
+import hashlib
 import logging
 
 # Set up logger
@@ -16,34 +27,175 @@ logger = logging.getLogger(__name__)
 
 # Client information ***********************************************************
 
-class CareClientViewSet(viewsets.ModelViewSet):
+class CareClientViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
-    A viewset for viewing and editing care client instances.
+    A viewset for viewing and editing care client instances, limited to the
+    requesting user's caseload (see ``clients.access``).
     """
     queryset = CareClient.objects.all()
     serializer_class = CareClientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CareClientKeysetPagination
+    filter_backends = [CareClientFilterBackend]
+    replica_actions = {'list', 'export', 'export_all'}
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CareClientListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = access.clients_for(self.request.user, super().get_queryset())
+        if self.action == 'list':
+            return CareClientListSerializer.list_queryset(queryset)
+        return queryset
+
+    def export_response(self, chunks, name, fmt):
+        response = StreamingHttpResponse(chunks, content_type=exporter.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{name}"'
+        return response
+
+    @action(detail=True, methods=['get'], url_path=r'export/(?P<fmt>csv|jsonl|zip)')
+    def export(self, request, pk=None, fmt=None):
+        """Stream the client's full care record, notes and AI fields included, as CSV, JSON Lines or a zip bundle."""
+        care_client = self.get_object()
+        # The response is streamed after this view returns, so pin the database it reads from now.
+        using = router.db_for_read(CareClient)
+        return self.export_response(exporter.export_client(care_client.pk, fmt, using),
+                                    exporter.filename(care_client.pk, fmt), fmt)
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<fmt>csv|jsonl|zip)',
+            permission_classes=[permissions.IsAdminUser])
+    def export_all(self, request, fmt=None):
+        """Stream a zip with one care record file per client, optionally filtered like the client list."""
+        using = router.db_for_read(CareClient)
+        clients = self.filter_queryset(self.get_queryset()).using(using)
+        return self.export_response(exporter.export_organisation(fmt, clients, using),
+                                    f"care-records-{fmt}.zip", 'zip')
 
 
 # End Client information ***********************************************************
 
 # Client Notes *********************************************************************
 
-class ClientNoteViewSet(viewsets.ModelViewSet):
+class ClientNoteViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    """Notes of the clients in the requesting user's caseload (see ``clients.access``)."""
     queryset = ClientNote.objects.all()
     serializer_class = ClientNoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ClientNoteKeysetPagination
+    filter_backends = [ClientNoteFilterBackend]
+    replica_actions = {'list', 'client_notes', 'search_notes', 'similar'}
+    # Lists return summaries; the full text and evaluation are on the note itself.
+    summary_actions = {'list', 'client_notes'}
+
+    def get_serializer_class(self):
+        if self.action in self.summary_actions:
+            return ClientNoteListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = access.notes_for(self.request.user, super().get_queryset())
+        if self.action in self.summary_actions:
+            return ClientNoteListSerializer.list_queryset(queryset)
+        return queryset
 
     @action(detail=True, methods=['get'], url_path='notes')
     def client_notes(self, request, pk=None):
-        """Retrieve all notes for a specific client."""
-        try:
-            care_client = CareClient.objects.get(pk=pk)
-        except CareClient.DoesNotExist:
+        """Retrieve the notes for a specific client, newest first, one page at a time."""
+        if not access.clients_for(request.user).filter(pk=pk).exists():
             return Response({"error": "Client not found"}, status=404)
 
-        notes = ClientNote.objects.filter(care_client=care_client)
-        serializer = self.get_serializer(notes, many=True)
-        return Response(serializer.data)
+        notes = self.filter_queryset(self.get_queryset().filter(care_client_id=pk))
+        page = self.paginate_queryset(notes)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search_notes(self, request):
+        """
+        Full-text search of note text and safeguarding evaluations. ``q`` takes
+        words, "quoted phrases" and -exclusions; the note list filters apply;
+        ``order`` is ``rank`` (default) or ``recent``; pages via ``page`` and
+        ``page_size``.
+        """
+        params = request.query_params
+        text = params.get('q', '').strip()
+        if not text:
+            return Response({"error": "Enter a search query as 'q'."}, status=status.HTTP_400_BAD_REQUEST)
+        order = params.get('order', 'rank')
+        if order not in ('rank', 'recent'):
+            return Response({"error": "order must be 'rank' or 'recent'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(1, int(params.get('page', 1)))
+            page_size = max(1, min(int(params.get('page_size', 20)), 100))
+        except ValueError:
+            return Response({"error": "page and page_size must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        notes = self.filter_queryset(self.get_queryset())
+        results, has_more = search.search(notes, text, order, offset=(page - 1) * page_size, limit=page_size)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if has_more else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': NoteSearchResultSerializer(results, many=True).data,
+        })
+
+    @action(detail=True, methods=['get'], url_path='similar')
+    def similar(self, request, pk=None):
+        """
+        Notes most similar to this one, best first, with their cosine
+        similarity. ``other_clients=true`` leaves out the note's own client;
+        the note list filters narrow the candidates; ``limit`` up to 50.
+        """
+        note = self.get_object()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        candidates = self.filter_queryset(self.get_queryset())
+        if request.query_params.get('other_clients') in ('1', 'true', 'True'):
+            candidates = candidates.exclude(care_client_id=note.care_client_id)
+        using = router.db_for_read(ClientNote)
+        hits = embeddings.similar_notes(
+            note, candidates if candidates.query.has_filters() else None, limit, using=using,
+        )
+
+        notes = SimilarNoteSerializer.list_queryset(ClientNote.objects.using(using)).in_bulk(
+            [note_id for note_id, _ in hits])
+        results = []
+        for note_id, similarity in hits:
+            if note_id in notes:
+                notes[note_id].similarity = round(similarity, 4)
+                results.append(notes[note_id])
+        return Response({'results': SimilarNoteSerializer(results, many=True).data})
+
+    @action(detail=False, methods=['post'], url_path='bulk-import', permission_classes=[permissions.IsAuthenticated])
+    def bulk_import(self, request):
+        """
+        Import notes from an uploaded JSON Lines or CSV ``file``. Notes are queued
+        for the analysis workers (``manage.py run_analysis_workers``) rather than
+        analysed in the request; the response's ``queued`` says how many. To
+        resume a failed upload, resend the file with ``start_after`` set to the
+        returned ``last_line``.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload the notes as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or upload.name.rsplit('.', 1)[-1].replace('ndjson', 'jsonl')
+        if fmt not in FORMATS:
+            return Response({"error": f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start_after = int(request.data.get('start_after') or 0)
+        except ValueError:
+            return Response({"error": "start_after must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = NoteImporter(created_by=request.user, enrich='queue', clients=access.clients_for(request.user))
+        report = importer.run(iter_rows(upload.file, fmt), start_after=start_after)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
 
 
 
@@ -51,73 +203,116 @@ class ClientNoteViewSet(viewsets.ModelViewSet):
 
 # Client Statistics *************************************************************
 
-class ClientNoteDistributionAPIView(APIView):
+class ClientNoteDistributionAPIView(ReplicaReadMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
     def get(self, request, client_id):
-        care_client = get_object_or_404(CareClient, id=client_id)
-        notes = ClientNote.objects.filter(care_client=care_client)
-
-        # Sentiment Distribution
-        sentiment_distribution = notes.values('sentiment').annotate(count=Count('sentiment'))
-
-        # Emotion Distribution
-        emotion_distribution = {}
-        for note in notes:
-            if note.emotion_tags:
-                for emotion, value in note.emotion_tags.items():
-                    if emotion in emotion_distribution:
-                        emotion_distribution[emotion] += value
-                    else:
-                        emotion_distribution[emotion] = value
-
-        # Normalize emotion distribution
-        total_emotion_score = sum(emotion_distribution.values())
-        if total_emotion_score > 0:
-            emotion_distribution = {
-                emotion: round(value / total_emotion_score, 2)
-                for emotion, value in emotion_distribution.items()
-            }
-
-        # Analysis Summary
-        analysis_summary = self.generate_analysis_summary(sentiment_distribution, emotion_distribution)
+        care_client = get_object_or_404(access.clients_for(request.user), id=client_id)
+        note_stats = stats.get_stats(care_client.id)
+
+        # Sentiment and emotion distributions come from the precomputed totals
+        sentiment_distribution = stats.sentiment_distribution(note_stats)
+        emotion_distribution = stats.emotion_distribution(note_stats)
+
+        # Analysis Summary, regenerated only when the distributions change
+        analysis_summary = summaries.get_summary(note_stats, sentiment_distribution, emotion_distribution)
+
+        etag = '"{}"'.format(hashlib.sha256(
+            f"{note_stats.summary_fingerprint}:{sentiment_distribution}:{emotion_distribution}:{analysis_summary}".encode('utf-8')
+        ).hexdigest()[:32])
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
         return Response({
-            'sentiment_distribution': list(sentiment_distribution),
+            'sentiment_distribution': sentiment_distribution,
             'emotion_distribution': emotion_distribution,
             'analysis_summary': analysis_summary,
+        }, status=status.HTTP_200_OK, headers=headers)
+
+
+class ClientNoteTrendsAPIView(ReplicaReadMixin, APIView):
+    """
+    Sentiment counts and mean emotion scores per ``interval`` (day, week or
+    month; default week) between ``start`` and ``end`` (default: the last
+    year), for one ``client``, one ``caregiver``'s clients or the whole
+    organisation, within the requesting user's caseload. Read from the daily
+    rollups, never from the notes.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        interval = params.get('interval', 'week')
+        if interval not in rollups.INTERVALS:
+            return Response({"error": f"interval must be one of: {', '.join(rollups.INTERVALS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        scope = {}
+        for name in ('client', 'caregiver'):
+            if params.get(name):
+                try:
+                    scope[name] = int(params[name])
+                except ValueError:
+                    return Response({"error": f"{name} must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            end = parse_date(params['end']) if params.get('end') else localdate()
+            start = parse_date(params['start']) if params.get('start') else end - timedelta(days=365)
+        except (TypeError, ValueError):
+            start = end = None
+        if start is None or end is None or start > end:
+            return Response({"error": "start and end must be dates (YYYY-MM-DD) with start before end."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        buckets = rollups.trends(interval, start, end, care_client_id=scope.get('client'),
+                                 caregiver_id=scope.get('caregiver'), caregiver_ids=access.caregiver_ids(request.user))
+        return Response({
+            'interval': interval,
+            'start': start,
+            'end': end,
+            'scope': scope or 'organisation',
+            'buckets': buckets,
         }, status=status.HTTP_200_OK)
 
-    def generate_analysis_summary(self, sentiment_distribution, emotion_distribution):
-        """
-        Generates a summary analysis using OpenAI GPT model based on the sentiment
-        and emotion distribution.
-        """
+
+class RiskDashboardAPIView(ReplicaReadMixin, APIView):
+    """
+    Every client in the requesting user's caseload ranked by risk over the
+    last ``days`` (default 30): share of negative notes, peak score of a
+    high-risk emotion and safeguarding flags. ``mine=true`` limits it to the
+    clients assigned to the requesting user (not their team's) and
+    ``care_status`` to clients with that status.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RiskDashboardPagination
+    fields = (
+        'id', 'first_name', 'last_name', 'care_status', 'assigned_caregiver', 'recent_notes', 'negative_notes',
+        'negative_ratio', 'peak_emotion', 'peak_emotion_score', 'flagged_notes',
+    )
+
+    def get(self, request):
+        params = request.query_params
         try:
-            sentiment_data = ", ".join(
-                [f"{item['sentiment']} ({item['count']} occurrences)" for item in sentiment_distribution]
-            )
-            emotion_data = ", ".join(
-                [f"{emotion}: {score}" for emotion, score in emotion_distribution.items()]
-            )
-
-            prompt = (
-                f"Based on the following patient data:\n\n"
-                f"Sentiment Distribution: {sentiment_data}\n"
-                f"Emotion Distribution: {emotion_data}\n\n"
-                f"1. Provide a brief analysis of the patient's mental health.\n"
-                f"2. Suggest actionable recommendations to support their mental well-being.\n\n"
-                f"Be concise and professional in your response."
-            )
-
-            openai.api_key = settings.OPEN_AI_API
-            response = openai.Completion.create(
-                engine="gpt-4",
-                prompt=prompt,
-                max_tokens=200,
-                temperature=0.7,
-            )
-
-            analysis_summary = response.choices[0].text.strip()
-            return analysis_summary
-        except Exception as e:
-            logger.error(f"Error generating analysis summary: {str(e)}", exc_info=True)
-            return "Unable to generate analysis summary at this time."
\ No newline at end of file
+            days = int(params.get('days', 30))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 365:
+            return Response({"error": "days must be a number between 1 and 365."}, status=status.HTTP_400_BAD_REQUEST)
+
+        clients = access.clients_for(request.user)
+        if params.get('mine', '').lower() in ('1', 'true', 'yes'):
+            clients = clients.filter(assigned_caregiver=request.user)
+        if params.get('care_status'):
+            if params['care_status'] not in CareStatusChoices.values:
+                return Response({"error": f"care_status must be one of: {', '.join(CareStatusChoices.values)}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            clients = clients.filter(care_status=params['care_status'])
+
+        ranking = rollups.risk_ranking(localdate() - timedelta(days=days - 1), clients).values(*self.fields)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(ranking, request, view=self)
+        for rank, row in enumerate(page, start=paginator.page.start_index()):
+            row['rank'] = rank
+            row['negative_ratio'] = round(row['negative_ratio'], 3)
+        return paginator.get_paginated_response(page)
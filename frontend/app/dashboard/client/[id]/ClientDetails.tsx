@@ -4,6 +4,7 @@ import { useEffect, useState, useCallback } from 'react';
 import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 import { isAuthenticated } from '@/services/auth';
+import { fetchAllPages } from '@/services/api';
 import AddNoteModal from '@/app/components/AddNoteModal';
 import { Pie, Bar } from 'react-chartjs-2';
 import {
@@ -99,18 +100,9 @@ export default function ClientDetails({ id }: ClientDetailsProps) {
     if (!id) return;
     
     try {
-      const response = await fetch(`https://backend.doxcert.com/api/clients/client-notes/${id}/notes/`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
-        },
-      });
-
-      if (!response.ok) {
-        throw new Error('Failed to fetch client notes');
-      }
-
-      const data = await response.json();
-      setNotes(data);
+      const notes = await fetchAllPages<Note>(
+        `https://backend.doxcert.com/api/clients/client-notes/${id}/notes/`, 'Failed to fetch client notes');
+      setNotes(notes);
     } catch (err) {
       console.error('Error fetching client notes:', err);
     }
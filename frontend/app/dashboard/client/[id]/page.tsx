@@ -4,6 +4,7 @@ import { useEffect, useState, useCallback } from 'react';
 import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 import { isAuthenticated } from '@/services/auth';
+import { fetchAllPages } from '@/services/api';
 import AddNoteModal from '@/app/components/AddNoteModal';
 import { Pie, Bar } from 'react-chartjs-2';
 import {
@@ -46,11 +47,18 @@ interface ClientDetails {
 interface Note {
   id: number;
   created_at: string;
-  note_text: string;
+  excerpt: string;
   sentiment: string;
   emotion_tags: Record<string, number>;
   care_client: number;
   created_by: number;
+  created_by_username: string;
+}
+
+// The notes list only carries an excerpt; the full note is fetched when opened.
+interface NoteDetail extends Omit<Note, 'excerpt' | 'created_by_username'> {
+  note_text: string;
+  ai_evaluated_notes: string;
 }
 
 interface PageParams {
@@ -66,13 +74,32 @@ const NotesTable = ({ notes }: { notes: Note[] }) => {
   const [searchTerm, setSearchTerm] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
   const [sortConfig, setSortConfig] = useState({ key: 'created_at', direction: 'desc' });
-  const [selectedNote, setSelectedNote] = useState<Note | null>(null);
+  const [selectedNote, setSelectedNote] = useState<NoteDetail | null>(null);
   const [isViewModalOpen, setIsViewModalOpen] = useState(false);
   const itemsPerPage = 5;
 
+  const openNote = async (noteId: number) => {
+    try {
+      const response = await fetch(`https://backend.doxcert.com/api/clients/client-notes/${noteId}/`, {
+        headers: {
+          'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
+        },
+      });
+
+      if (!response.ok) {
+        throw new Error('Failed to fetch note');
+      }
+
+      setSelectedNote(await response.json());
+      setIsViewModalOpen(true);
+    } catch (err) {
+      console.error('Error fetching note:', err);
+    }
+  };
+
   // Filter and sort notes
   const filteredNotes = notes.filter(note => 
-    note.note_text.toLowerCase().includes(searchTerm.toLowerCase()) ||
+    note.excerpt.toLowerCase().includes(searchTerm.toLowerCase()) ||
     note.sentiment.toLowerCase().includes(searchTerm.toLowerCase())
   ).sort((a, b) => {
     if (sortConfig.key === 'created_at') {
@@ -181,10 +208,7 @@ const NotesTable = ({ notes }: { notes: Note[] }) => {
                     className={`hover:bg-gray-50 transition-colors duration-150 cursor-pointer ${
                       index % 2 === 0 ? 'bg-white' : 'bg-gray-50'
                     }`}
-                    onClick={() => {
-                      setSelectedNote(note);
-                      setIsViewModalOpen(true);
-                    }}
+                    onClick={() => openNote(note.id)}
                   >
                     <td className="px-6 py-4 whitespace-nowrap">
                       <div className="flex flex-col">
@@ -198,7 +222,7 @@ const NotesTable = ({ notes }: { notes: Note[] }) => {
                     </td>
                     <td className="px-6 py-4">
                       <div className="text-sm text-gray-900 whitespace-pre-wrap max-w-xl">
-                        {note.note_text}
+                        {note.excerpt}
                       </div>
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap">
@@ -230,7 +254,7 @@ const NotesTable = ({ notes }: { notes: Note[] }) => {
                         </div>
                         <div className="ml-3">
                           <div className="text-sm font-medium text-gray-900">
-                            ID: {note.created_by}
+                            {note.created_by_username}
                           </div>
                         </div>
                       </div>
@@ -675,18 +699,9 @@ export default function ClientPage({
 
   const fetchClientNotes = useCallback(async () => {
     try {
-      const response = await fetch(`https://backend.doxcert.com/api/clients/client-notes/${params.id}/notes/`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
-        },
-      });
-
-      if (!response.ok) {
-        throw new Error('Failed to fetch client notes');
-      }
-
-      const data = await response.json();
-      setNotes(data);
+      const notes = await fetchAllPages<Note>(
+        `https://backend.doxcert.com/api/clients/client-notes/${params.id}/notes/`, 'Failed to fetch client notes');
+      setNotes(notes);
     } catch (err) {
       console.error('Error fetching client notes:', err);
     }
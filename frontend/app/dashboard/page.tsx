@@ -3,6 +3,7 @@
 import { useEffect, useState } from 'react';
 import { useRouter } from 'next/navigation';
 import { isAuthenticated, logout } from '@/services/auth';
+import { fetchAllPages } from '@/services/api';
 import ClientCard from '@/app/components/ClientCard';
 import Link from 'next/link';
 
@@ -35,18 +36,9 @@ export default function DashboardPage() {
 
   const fetchClients = async () => {
     try {
-      const response = await fetch('https://backend.doxcert.com/api/clients/careclients/', {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
-        },
-      });
-
-      if (!response.ok) {
-        throw new Error('Failed to fetch clients');
-      }
-
-      const data = await response.json();
-      setClients(data);
+      const clients = await fetchAllPages<Client>(
+        'https://backend.doxcert.com/api/clients/careclients/', 'Failed to fetch clients');
+      setClients(clients);
     } catch (err) {
       setError('Failed to load clients');
       console.error('Error fetching clients:', err);
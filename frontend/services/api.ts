@@ -0,0 +1,28 @@
+interface Page<T> {
+  next: string | null;
+  results: T[];
+}
+
+// The list endpoints are paginated: follow `next` until it is null so callers get every row.
+export const fetchAllPages = async <T>(url: string, errorMessage: string): Promise<T[]> => {
+  const results: T[] = [];
+  let next: string | null = url;
+
+  while (next) {
+    const response = await fetch(next, {
+      headers: {
+        'Authorization': `Bearer ${localStorage.getItem('accessToken')}`,
+      },
+    });
+
+    if (!response.ok) {
+      throw new Error(errorMessage);
+    }
+
+    const page: Page<T> = await response.json();
+    results.push(...page.results);
+    next = page.next;
+  }
+
+  return results;
+};